@@ -1,31 +1,159 @@
 import requests
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from item_store import atomic_write_json
 
-START_YEAR = 2015
-END_YEAR = 2025
 BLS_API_URL = 'https://api.bls.gov/publicAPI/v2/timeseries/data/'
+MAX_SERIES_PER_REQUEST = 25 # Public API limit without a registration key (50 with one)
+MAX_WORKERS = 4
+REQUEST_TIMEOUT = 10 # seconds
+CACHE_FILE = "bls_cache.json"
+CACHE_TTL_SECONDS = 24 * 60 * 60 # BLS average prices are published monthly
 
 headers = {"Content-type": "application/json"}
 
+class BLSClient:
+    def __init__(self, api_url = BLS_API_URL, cache_path = CACHE_FILE, cache_ttl = CACHE_TTL_SECONDS,
+                 batch_size = MAX_SERIES_PER_REQUEST, max_workers = MAX_WORKERS, registration_key = None,
+                 fixture_path = None, record = False):
+        """
+        Batched, cached client for the BLS timeseries API.
+        :param api_url: Endpoint to POST to; point it at a local stub server for offline runs.
+        :param cache_path: JSON file caching values by series_id and period. None disables the disk cache.
+        :param fixture_path: Recorded responses file. Without record=True, requests are answered from it and
+                             the network is never touched; with record=True, live responses are saved to it.
+        """
+        self.api_url = api_url
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.registration_key = registration_key
+        self.fixture_path = fixture_path
+        self.record = record
+        self.lock = threading.Lock()
+        self.cache = self._load_json(cache_path)
+        self.fixture = self._load_json(fixture_path)
+
+    def _load_json(self, path):
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r") as file:
+                return json.load(file)
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"[BLSClient] Ignoring unreadable file {path}: {e}")
+            return {}
+
+    def _latest_cached(self, series_id, fresh_only = True):
+        """ Returns the value of the newest cached period for series_id, or None. """
+        periods = self.cache.get(series_id)
+        if not periods:
+            return None
+        entry = periods[max(periods)]
+        if fresh_only and time.time() - entry["fetched_at"] > self.cache_ttl:
+            return None
+        return entry["value"]
+
+    def get_latest_prices(self, series_ids):
+        """
+        Returns {series_id: latest average price} for every series that could be resolved.
+        Fresh cache hits skip the network; the rest are fetched in concurrent batches. If a batch
+        fails, stale cached values are used, and series with no value at all are left out.
+        """
+        wanted = list(dict.fromkeys(sid for sid in series_ids if sid))
+        prices = {}
+        missing = []
+        for series_id in wanted:
+            value = self._latest_cached(series_id)
+            if value is None:
+                missing.append(series_id)
+            else:
+                prices[series_id] = value
+
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            print(f"[BLSClient] Fetching {len(missing)} series in {len(batches)} batches ({len(prices)} cached).")
+            with ThreadPoolExecutor(max_workers = min(self.max_workers, len(batches))) as executor:
+                for batch_result in executor.map(self._fetch_batch, batches):
+                    self._store(batch_result)
+            self._save_cache()
+
+            for series_id in missing:
+                value = self._latest_cached(series_id, fresh_only = False)
+                if value is not None:
+                    prices[series_id] = value
+                else:
+                    print(f"[BLSClient] No price available for series {series_id}.")
+        return prices
+
+    def _request_payload(self, batch):
+        # Only the current and previous year: early in the year the latest period is still last December
+        this_year = datetime.now().year
+        payload = {"seriesid": batch, "startyear": str(this_year - 1), "endyear": str(this_year)}
+        if self.registration_key:
+            payload["registrationkey"] = self.registration_key
+        return payload
+
+    def _fetch_batch(self, batch):
+        """ Fetches one request-sized batch. Returns {series_id: (period, value)}; empty on failure. """
+        if self.fixture_path and not self.record:
+            series_list = [{"seriesID": sid, "data": self.fixture[sid]} for sid in batch if sid in self.fixture]
+        else:
+            try:
+                p = requests.post(self.api_url, data = json.dumps(self._request_payload(batch)),
+                                  headers = headers, timeout = REQUEST_TIMEOUT)
+                p.raise_for_status()
+                json_data = p.json()
+                series_list = json_data['Results']['series']
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print(f"[BLSClient] Error fetching batch of {len(batch)} series: {e}")
+                return {}
+
+        result = {}
+        for series in series_list:
+            # The API returns data points newest first
+            for item in series['data']:
+                try:
+                    result[series['seriesID']] = (f"{item['year']}-{item['period']}", float(item['value']))
+                except (KeyError, ValueError):
+                    continue
+                break
+            if self.record:
+                with self.lock:
+                    self.fixture[series['seriesID']] = series['data'][:1]
+        return result
+
+    def _store(self, batch_result):
+        now = time.time()
+        with self.lock:
+            for series_id, (period, value) in batch_result.items():
+                self.cache.setdefault(series_id, {})[period] = {"value": value, "fetched_at": now}
+
+    def _save_cache(self):
+        try:
+            if self.cache_path:
+                atomic_write_json(self.cache_path, self.cache)
+            if self.record and self.fixture_path:
+                atomic_write_json(self.fixture_path, self.fixture)
+        except IOError as e:
+            print(f"[BLSClient] Error writing cache: {e}")
+
+
+_default_client = None
+
 def get_bls_data(seriesid):
-    """ Fetches average pricing data from the BLS API for the given series IDs. """
-    prices = []
-
-    data = json.dumps({
-        "seriesid": seriesid,
-        "startyear": str(START_YEAR),
-        "endyear": str(END_YEAR)
-    })
-
-    p = requests.post(BLS_API_URL, data = data, headers = headers)
-    json_data = json.loads(p.text)
-    for series in json_data['Results']['series']:
-        value = None
-        for item in series['data']:
-            value = item['value']
-            break
-
-        if value is not None:
-            prices.append(float(value))
-
-    return prices
\ No newline at end of file
+    """
+    Fetches average pricing data from the BLS API for the given series IDs.
+    Returns a list aligned with seriesid; entries that could not be resolved are None.
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = BLSClient(fixture_path = os.environ.get("BLS_FIXTURE"))
+    prices = _default_client.get_latest_prices(seriesid)
+    return [prices.get(series_id) for series_id in seriesid]
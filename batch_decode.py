@@ -0,0 +1,147 @@
+"""
+Decodes every frame of a video file or image directory on all cores, offline, to measure decoder changes.
+
+    python3 batch_decode.py SOURCE [--workers 8] [--pipeline original|staged] [--limit N]
+                            [--output results.jsonl] [--json summary.json]
+
+SOURCE is anything capture_module.open_source accepts: a video file, a directory of images, or a camera
+index (then --limit is required). Per-frame results go to --output (stdout by default), one JSON object per line:
+    {"frame": "0001.png", "barcodes": [["0001", "EAN13"]], "ms": 12.5}
+Frames are reported in source order. The summary (frames, decode rate, aggregate frames/sec) goes to stderr and --json.
+
+--pipeline original runs preprocess_image + scan_barcode on each frame, the capture path before the staged chain;
+--pipeline staged runs the decode_frame chain the capture thread uses now.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+from capture_module import CameraSource, ImageDirectorySource, decode_frame, open_source, preprocess_image, scan_barcode
+
+PIPELINES = ("original", "staged")
+JOBS_PER_WORKER = 4 # Frames queued ahead per worker; bounds memory on long videos
+
+
+def decode_one(job):
+    """
+    Decodes one (frame_id, frame, pipeline) job. frame may be an image path, read here so that
+    image decoding also runs on the workers. Returns (frame_id, results or None if unreadable, seconds).
+    """
+    frame_id, frame, pipeline = job
+    if isinstance(frame, str):
+        frame = cv2.imread(frame)
+        if frame is None:
+            return frame_id, None, 0.0
+    start = time.perf_counter()
+    if pipeline == "staged":
+        results = decode_frame(frame)[0]
+    else:
+        results = scan_barcode(preprocess_image(frame))
+    return frame_id, results, time.perf_counter() - start
+
+def _jobs(source, pipeline, limit):
+    if isinstance(source, ImageDirectorySource):
+        frames = ((os.path.basename(path), path) for path in source.paths)
+    else:
+        frames = source.frames()
+    for count, (frame_id, frame) in enumerate(frames):
+        if limit is not None and count >= limit:
+            return
+        yield frame_id, frame, pipeline
+
+def run_batch(source, workers = None, pipeline = "original", limit = None, on_result = None):
+    """
+    Decodes every frame of source on a pool of worker processes (inline when workers is 1).
+    :param on_result: Called with (frame_id, results, seconds) for each frame, in source order.
+    :return: Summary dict with frame counts, decode rate and aggregate frames per second.
+    """
+    workers = workers or os.cpu_count() or 1
+    frames = unreadable = decoded = 0
+    decode_seconds = 0.0
+    barcodes = set()
+
+    def collect(result):
+        nonlocal frames, unreadable, decoded, decode_seconds
+        frame_id, results, seconds = result
+        frames += 1
+        if results is None:
+            unreadable += 1
+        elif results:
+            decoded += 1
+            barcodes.update(data for data, _ in results)
+        decode_seconds += seconds
+        if on_result:
+            on_result(frame_id, results, seconds)
+
+    start = time.perf_counter()
+    if workers == 1:
+        for job in _jobs(source, pipeline, limit):
+            collect(decode_one(job))
+    else:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            pending = deque()
+            for job in _jobs(source, pipeline, limit):
+                pending.append(pool.submit(decode_one, job))
+                if len(pending) >= workers * JOBS_PER_WORKER:
+                    collect(pending.popleft().result())
+            while pending:
+                collect(pending.popleft().result())
+    elapsed = time.perf_counter() - start
+
+    readable = frames - unreadable
+    return {
+        "source": source.name,
+        "pipeline": pipeline,
+        "workers": workers,
+        "frames": frames,
+        "unreadable": unreadable,
+        "decoded": decoded,
+        "decode_rate": decoded / readable if readable else 0.0,
+        "distinct_barcodes": len(barcodes),
+        "seconds": elapsed,
+        "frames_per_second": frames / elapsed if elapsed else 0.0,
+        "average_decode_ms": 1000 * decode_seconds / readable if readable else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help = "Video file, image directory or camera index")
+    parser.add_argument("--workers", type = int, help = "Decode processes (default: CPU count; 1 decodes inline)")
+    parser.add_argument("--pipeline", choices = PIPELINES, default = "original")
+    parser.add_argument("--limit", type = int, help = "Stop after this many frames")
+    parser.add_argument("--output", default = "-", help = "Per-frame JSON lines file; '-' for stdout")
+    parser.add_argument("--json", help = "Also write the summary to this file")
+    args = parser.parse_args()
+
+    source = open_source(args.source)
+    if not source.is_open():
+        raise SystemExit(f"Cannot open frame source {args.source}")
+    if isinstance(source, CameraSource) and args.limit is None:
+        raise SystemExit("A camera never ends; pass --limit")
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    def write_result(frame_id, results, seconds):
+        record = {"frame": frame_id, "barcodes": results, "ms": round(1000 * seconds, 3)}
+        if results is None:
+            record["error"] = "unreadable"
+        output.write(json.dumps(record) + "\n")
+
+    try:
+        summary = run_batch(source, args.workers, args.pipeline, args.limit, write_result)
+    finally:
+        source.release()
+        if output is not sys.stdout:
+            output.close()
+
+    print(json.dumps(summary, indent = 2), file = sys.stderr)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(summary, file, indent = 2)
+
+if __name__ == "__main__":
+    main()
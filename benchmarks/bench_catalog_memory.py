@@ -0,0 +1,94 @@
+"""
+Memory cost of the in-memory item catalog: bytes per item for the plain dict-of-dicts that json.load produces
+(what ItemDataManager.items held before item_catalog.CompactCatalog) against the columnar CompactCatalog,
+plus the time of one full pass over the prices (the decay/sync scan pattern) for each.
+
+    python3 benchmarks/bench_catalog_memory.py [--items 10000 100000 1000000] [--json out.json]
+
+Sizes are measured with tracemalloc, so they count every Python allocation the catalog keeps alive
+(keys, values, containers and the barcode index), not the process RSS.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import synthetic_catalog
+from item_catalog import ChangeIndex, CompactCatalog
+
+def as_loaded(catalog):
+    """ The catalog the way json.load hands it over: fresh, uninterned strings for every key and value. """
+    return json.loads(json.dumps(catalog))
+
+def measure(build):
+    """ Bytes held by the object build() returns, and the object itself. """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+def build_compact(source):
+    """ A CompactCatalog of source. Its change index is dropped: the old dict catalog needed the same one. """
+    changes = ChangeIndex()
+    catalog = CompactCatalog(json.loads(source), set(), set(), changes)
+    changes.log.clear()
+    changes.latest.clear()
+    return catalog
+
+def scan_seconds(items):
+    start = time.perf_counter()
+    total = 0.0
+    for item in items.values():
+        total += item.get("current_price", 0.0)
+    return time.perf_counter() - start
+
+def run_size(count, seed):
+    source = json.dumps(synthetic_catalog(count, random.Random(seed)))
+    dict_bytes, plain = measure(lambda: json.loads(source))
+    plain_scan = scan_seconds(plain)
+    del plain
+    compact_bytes, compact = measure(lambda: build_compact(source))
+    compact_scan = scan_seconds(compact)
+    start = time.perf_counter()
+    sum(value for value in compact.float_column("current_price") if value == value)
+    column_scan = time.perf_counter() - start
+    return {
+        "items": count,
+        "dict_bytes_per_item": dict_bytes / count,
+        "compact_bytes_per_item": compact_bytes / count,
+        "ratio": dict_bytes / compact_bytes,
+        "dict_scan_ms": 1000 * plain_scan,
+        "compact_scan_ms": 1000 * compact_scan,
+        "column_scan_ms": 1000 * column_scan
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type = int, nargs = "+", default = [10000, 100000, 1000000])
+    parser.add_argument("--seed", type = int, default = 131)
+    parser.add_argument("--json", help = "Also write the report to this file")
+    args = parser.parse_args()
+
+    results = [run_size(count, args.seed) for count in args.items]
+    print(f"{'items':>9}{'dict B/item':>14}{'compact B/item':>16}{'ratio':>8}{'dict scan ms':>14}{'view scan ms':>14}{'column scan ms':>16}")
+    for row in results:
+        print(f"{row['items']:>9}{row['dict_bytes_per_item']:>14.0f}{row['compact_bytes_per_item']:>16.0f}{row['ratio']:>8.2f}"
+              f"{row['dict_scan_ms']:>14.1f}{row['compact_scan_ms']:>14.1f}{row['column_scan_ms']:>16.1f}")
+    report = {"python": sys.version.split()[0], "seed": args.seed, "results": results}
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent = 2)
+
+if __name__ == "__main__":
+    main()
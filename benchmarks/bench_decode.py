@@ -0,0 +1,80 @@
+"""
+Compares the staged decode chain (capture_module.decode_frame) against the original
+pipeline (Otsu threshold of the full frame + zbar) over a directory of sample images.
+
+    python3 benchmarks/bench_decode.py samples/ [--labels labels.json] [--repeat 3] [--json out.json]
+
+labels.json maps image file names to the expected barcode. Without it, accuracy is reported
+as agreement with the original pipeline.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+from capture_module import IMAGE_EXTENSIONS, DecodeStats, decode_frame, preprocess_image, scan_barcode
+
+def original_pipeline(frame):
+    return scan_barcode(preprocess_image(frame))
+
+def staged_pipeline(frame, stats):
+    results, attempts = decode_frame(frame)
+    stats.record(attempts)
+    return results
+
+def run(image_dir, labels, repeat):
+    names = sorted(name for name in os.listdir(image_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    frames = [(name, cv2.imread(os.path.join(image_dir, name))) for name in names]
+    frames = [(name, frame) for name, frame in frames if frame is not None]
+    if not frames:
+        raise SystemExit(f"No readable images in {image_dir}")
+
+    stats = DecodeStats()
+    report = {"images": len(frames), "repeat": repeat}
+    decoded = {}
+    for label, pipeline in (("original", original_pipeline), ("staged", lambda f: staged_pipeline(f, stats))):
+        found = {}
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for name, frame in frames:
+                found[name] = {data for data, _ in pipeline(frame)}
+        elapsed = time.perf_counter() - start
+        decoded[label] = found
+        report[label] = {
+            "decodes_per_second": len(frames) * repeat / elapsed,
+            "decode_rate": sum(1 for codes in found.values() if codes) / len(frames)
+        }
+        if labels:
+            correct = sum(1 for name, _ in frames if labels.get(name) in found[name])
+            report[label]["accuracy"] = correct / len(frames)
+
+    agree = sum(1 for name, _ in frames if decoded["original"][name] <= decoded["staged"][name])
+    report["staged"]["agreement_with_original"] = agree / len(frames)
+    report["stages"] = stats.summary()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--labels", help = "JSON file mapping image file name -> expected barcode")
+    parser.add_argument("--repeat", type = int, default = 1)
+    parser.add_argument("--json", help = "Also write the report to this file")
+    args = parser.parse_args()
+
+    labels = {}
+    if args.labels:
+        with open(args.labels, "r") as file:
+            labels = json.load(file)
+
+    report = run(args.image_dir, labels, args.repeat)
+    print(json.dumps(report, indent = 2))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent = 2)
+
+if __name__ == "__main__":
+    main()
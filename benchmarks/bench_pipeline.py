@@ -0,0 +1,269 @@
+"""
+End-to-end benchmark of the scan -> price -> persist -> sync pipeline on synthetic catalogs, with no
+camera, Tk window, BLS API or registry: BLS prices come from a generated fixture (api_BLS fixture mode)
+and sync runs between two NetworkManagers over loopback.
+
+    python3 benchmarks/bench_pipeline.py [--items 1000 10000 100000] [--transactions 500] [--basket 8]
+                                         [--store json|sqlite] [--no-network] [--keep] [--json out.json]
+
+Each catalog size runs in its own subprocess so peak memory is per size. Stages:
+    startup       ItemDataManager construction (load + BLS fixture + first save)
+    load          Reopening the price history (HISTORY_POINTS per item) and _load_items
+    transaction   ItemProcessor.process_pipeline per transaction (includes its save)
+    save          save_items_to_json with 1% of the catalog changed
+    sync_query    get_recently_updated_items_for_sync for the last transactions
+    decay         decay_prices over the whole catalog
+    sync_send     send_prices_to_other_store until the peer has merged every price
+Reports ops/s, p50/p99 latency (ms) and peak RSS (MB) per stage as JSON for regression comparison.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SERIES_COUNT = 64
+HISTORY_POINTS = 16 # Price points seeded per item, a full ring (price_history.RECENT_CAPACITY)
+
+def synthetic_catalog(count, rng):
+    now = time.time()
+    catalog = {}
+    for index in range(count):
+        base = round(rng.uniform(0.5, 25.0), 3)
+        catalog[f"{index:08d}"] = {
+            "item_name": f"item {index}",
+            "base_price": base,
+            "demand_price": base * rng.uniform(1.0, 1.5),
+            "current_price": base,
+            "last_purchased": now - rng.uniform(2, 30) * 86400,
+            "last_updated": now - rng.uniform(2, 30) * 86400,
+            "meter": rng.randint(0, 4),
+            "series_id": f"BENCH{index % SERIES_COUNT:04d}"
+        }
+    return catalog
+
+def bls_fixture(rng):
+    year = time.localtime().tm_year
+    return {f"BENCH{index:04d}": [{"year": str(year), "period": "M01", "value": f"{rng.uniform(0.5, 25.0):.3f}"}]
+            for index in range(SERIES_COUNT)}
+
+def synthetic_transactions(barcodes, count, basket, rng):
+    """ Skewed toward a few best sellers, like real checkout streams. """
+    weights = [1.0 / (rank + 1) for rank in range(len(barcodes))]
+    return [rng.choices(barcodes, weights = weights, k = rng.randint(1, 2 * basket)) for _ in range(count)]
+
+def write_catalog(path, items):
+    """ Writes a catalog the way ItemDataManager would find it: an items.json snapshot or an SQLite table. """
+    from item_store import SqliteItemStore, atomic_write_json
+    if path.endswith(".db"):
+        store = SqliteItemStore(path)
+        store.commit(items, set(items), set())
+        store.close()
+    else:
+        atomic_write_json(path, items)
+
+def write_history(path, barcodes, rng):
+    """ Seeds the price history database with HISTORY_POINTS hourly prices per item, as after a long run. """
+    from price_history import HistoryStore
+    history = HistoryStore(path)
+    now = time.time()
+    with history.conn:
+        history.conn.executemany("INSERT INTO points (barcode, ts, price) VALUES (?, ?, ?)",
+                                 ((barcode, now - (HISTORY_POINTS - step) * 3600, round(rng.uniform(0.5, 25.0), 3))
+                                  for barcode in barcodes for step in range(HISTORY_POINTS)))
+    history.close()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KB on Linux
+
+def summarize(latencies, seconds = None):
+    latencies = sorted(latencies)
+    seconds = sum(latencies) if seconds is None else seconds
+    return {
+        "ops": len(latencies),
+        "seconds": seconds,
+        "ops_per_second": len(latencies) / seconds if seconds else None,
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def run_size(count, transactions, basket, store, network, seed, keep = False):
+    """ Runs every stage for one catalog size in the current process, in a working directory removed afterwards unless keep. """
+    workdir = tempfile.mkdtemp(prefix = "pipeline-bench-")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir) # bls_cache.json and friends land here
+        result = _run_stages(workdir, count, transactions, basket, store, network, seed)
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors = True)
+    if keep:
+        result["workdir"] = workdir
+    return result
+
+def _run_stages(workdir, count, transactions, basket, store, network, seed):
+    rng = random.Random(seed)
+    catalog_path = os.path.join(workdir, "items.db" if store == "sqlite" else "items.json")
+    with open(os.path.join(workdir, "bls_fixture.json"), "w") as file:
+        json.dump(bls_fixture(rng), file)
+    os.environ["BLS_FIXTURE"] = os.path.join(workdir, "bls_fixture.json")
+
+    catalog = synthetic_catalog(count, rng)
+    barcodes = list(catalog)
+    stream = synthetic_transactions(barcodes, transactions, basket, rng)
+
+    from item_data_manager import ItemDataManager
+    from price_history import HistoryStore, history_path_for
+    from process_module import ItemProcessor
+    write_catalog(catalog_path, catalog)
+    write_history(history_path_for(catalog_path), barcodes, rng)
+    del catalog
+
+    quiet = lambda *args: None
+    stages = {}
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        seconds, manager = timed(ItemDataManager, catalog_path, quiet)
+        stages["startup"] = summarize([seconds])
+
+        def reload():
+            manager.history.close()
+            manager.history = HistoryStore(history_path_for(catalog_path))
+            manager._load_items()
+        seconds, _ = timed(reload)
+        stages["load"] = summarize([seconds])
+
+        processor = ItemProcessor(manager, log_callback = quiet)
+        started = time.time()
+        latencies = []
+        for barcodes_bought in stream:
+            latencies.append(timed(processor.process_pipeline, barcodes_bought)[0])
+            output.seek(0)
+            output.truncate() # Per-transaction prints would otherwise pile up in memory
+        stages["transaction"] = summarize(latencies)
+
+        latencies = []
+        changed_per_save = max(1, count // 100)
+        for _ in range(10):
+            for barcode in rng.sample(barcodes, changed_per_save):
+                manager.items[barcode]["meter"] = rng.randint(0, 4)
+            latencies.append(timed(manager.save_items_to_json)[0])
+        stages["save"] = summarize(latencies)
+
+        latencies = [timed(manager.get_recently_updated_items_for_sync, started)[0] for _ in range(20)]
+        stages["sync_query"] = summarize(latencies)
+
+        seconds, _ = timed(processor.decay_prices, time.time() + 1)
+        stages["decay"] = summarize([seconds])
+
+        if network:
+            stages["sync_send"] = run_sync(manager, catalog_path, workdir)
+        output.seek(0)
+        output.truncate()
+    return {"items": count, "store": store, "transactions": transactions, "stages": stages}
+
+def run_sync(manager, catalog_path, workdir):
+    """ Sends every price changed by decay from this store to a second one and waits until it has merged them. """
+    from item_data_manager import ItemDataManager
+    from network_manager import NetworkManager
+
+    quiet = lambda *args: None
+    peer_path = os.path.join(workdir, "peer_" + os.path.basename(catalog_path))
+    write_catalog(peer_path, dict(manager.items))
+    peer_manager = ItemDataManager(peer_path, quiet, history_path = os.path.join(workdir, "peer_history.db"))
+
+    port_a, port_b = free_port(), free_port()
+    sender = NetworkManager(manager, log_callback = quiet, store_id = "a", listen_endpoint = f"tcp://127.0.0.1:{port_a}",
+                            peers = {"b": f"tcp://127.0.0.1:{port_b}"})
+    receiver = NetworkManager(peer_manager, log_callback = quiet, store_id = "b", listen_endpoint = f"tcp://127.0.0.1:{port_b}",
+                              peers = {"a": f"tcp://127.0.0.1:{port_a}"})
+    deadline = time.time() + 5
+    while "b" not in sender.peer_formats and time.time() < deadline:
+        time.sleep(0.01) # Wait for the HELLO exchange so the negotiated binary format is used
+
+    prices = manager.get_recently_updated_items_for_sync(0)
+    for barcode, entry in prices.items():
+        entry["version"] += 1 # Make sure the peer takes every price, whatever the clocks say
+        entry.pop("clock", None)
+        entry["current_price"] += 0.01
+    merged = threading.Event()
+    peer_manager.subscribe(lambda barcodes: merged.set())
+
+    start = time.perf_counter()
+    sender.send_prices_to_other_store(0, prices)
+    merged.wait(timeout = 60)
+    seconds = time.perf_counter() - start
+
+    sender.shutdown()
+    receiver.shutdown()
+    result = summarize([seconds])
+    result["items_sent"] = len(prices)
+    result["items_per_second"] = len(prices) / seconds
+    result["completed"] = merged.is_set()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type = int, nargs = "+", default = [1000, 10000, 100000])
+    parser.add_argument("--transactions", type = int, default = 500)
+    parser.add_argument("--basket", type = int, default = 8, help = "Average items per transaction")
+    parser.add_argument("--store", choices = ("json", "sqlite"), default = "json")
+    parser.add_argument("--no-network", action = "store_true", help = "Skip the loopback sync stage")
+    parser.add_argument("--seed", type = int, default = 131)
+    parser.add_argument("--json", help = "Also write the report to this file")
+    parser.add_argument("--keep", action = "store_true", help = "Keep each size's working directory (catalog, WAL, history) for inspection")
+    parser.add_argument("--single", type = int, help = argparse.SUPPRESS) # Internal: run one size in this process
+    args = parser.parse_args()
+
+    if args.single:
+        result = run_size(args.single, args.transactions, args.basket, args.store, not args.no_network, args.seed, args.keep)
+        sys.__stdout__.write(json.dumps(result) + "\n")
+        return
+
+    results = []
+    for count in args.items:
+        command = [sys.executable, os.path.abspath(__file__), "--single", str(count), "--transactions", str(args.transactions),
+                   "--basket", str(args.basket), "--store", args.store, "--seed", str(args.seed)]
+        if args.no_network:
+            command.append("--no-network")
+        if args.keep:
+            command.append("--keep")
+        completed = subprocess.run(command, capture_output = True, text = True, check = True)
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        if "workdir" in results[-1]:
+            print(f"Kept the {count}-item working directory {results[-1]['workdir']}", file = sys.stderr)
+
+    print(f"{'items':>9} {'stage':<12}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for result in results:
+        for stage, row in result["stages"].items():
+            print(f"{result['items']:>9} {stage:<12}{row['ops_per_second'] or 0:>12.1f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['peak_rss_mb']:>10.1f}")
+    report = {"python": sys.version.split()[0], "seed": args.seed, "results": results}
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent = 2)
+
+if __name__ == "__main__":
+    main()
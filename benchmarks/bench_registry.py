@@ -0,0 +1,96 @@
+"""
+Load test for the store registry (flask_app.py) served locally by a threaded werkzeug server.
+Submits the same synthetic items once per item through GET /submit (how stores used to publish)
+and once in batches through POST /submit_batch, and reports requests/s and items/s for both.
+
+    python3 benchmarks/bench_registry.py [--items 2000] [--batch-size 500] [--clients 4] [--json out.json]
+
+Runs against a throwaway HOME so the real AllFlashcards files are never touched.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def run(items, batch_size, clients):
+    """ Runs both load tests with HOME pointed at a temporary directory, removed (and HOME restored) afterwards. """
+    home = os.environ.get("HOME")
+    with tempfile.TemporaryDirectory(prefix = "registry-bench-") as bench_home:
+        os.environ["HOME"] = bench_home # flask_app puts its database in HOME when it is imported
+        try:
+            return _run(items, batch_size, clients)
+        finally:
+            if home is None:
+                del os.environ["HOME"]
+            else:
+                os.environ["HOME"] = home
+
+def _run(items, batch_size, clients):
+    import requests
+    from werkzeug.serving import make_server
+    import flask_app
+
+    server = make_server("127.0.0.1", 0, flask_app.app, threaded = True)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    base_url = f"http://127.0.0.1:{server.port}"
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def per_item(index):
+        session().get(f"{base_url}/submit", params = {
+            "insertStore": "1", "searchStore": "0", "storename": f"STORE{index % clients}", "storeIP": "127.0.0.1",
+            "storeCo": "USA", "itemname": f"{index:06d} : 1.00", "password": "password"
+        }).raise_for_status()
+        return 1
+
+    def batch(start):
+        names = [f"{index:06d} : 2.00" for index in range(start, min(start + batch_size, items))]
+        session().post(f"{base_url}/submit_batch", json = {
+            "storename": f"STORE{start % clients}", "storeIP": "127.0.0.1", "storeCo": "USA",
+            "password": "password", "items": names
+        }).raise_for_status()
+        return 1
+
+    results = {}
+    for label, fn, jobs in (("per_item_get", per_item, range(items)),
+                            ("batch_post", batch, range(0, items, batch_size))):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = clients) as executor:
+            requests_made = sum(executor.map(fn, jobs))
+        elapsed = time.perf_counter() - start
+        results[label] = {
+            "requests": requests_made,
+            "seconds": elapsed,
+            "requests_per_second": requests_made / elapsed,
+            "items_per_second": items / elapsed
+        }
+
+    server.shutdown()
+    return {"items": items, "batch_size": batch_size, "clients": clients, "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type = int, default = 2000)
+    parser.add_argument("--batch-size", type = int, default = 500)
+    parser.add_argument("--clients", type = int, default = 4)
+    parser.add_argument("--json", help = "Also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args.items, args.batch_size, args.clients)
+    print(json.dumps(report, indent = 2))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent = 2)
+
+if __name__ == "__main__":
+    main()
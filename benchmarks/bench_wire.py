@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of the sync message formats: the legacy JSON string vs wire_format
+price batches (uncompressed, zlib and, if installed, lz4).
+
+    python3 benchmarks/bench_wire.py [--items 1000 10000 100000] [--repeat 5] [--json out.json]
+
+Reports encode/decode milliseconds and bytes per item for each format and catalog size.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wire_format
+
+def synthetic_prices(count, seed = 131):
+    rng = random.Random(seed)
+    now = int(time.time())
+    return {
+        f"{index:08d}": {"current_price": round(rng.uniform(0.5, 25.0), 6), "version": now - rng.randint(0, 3600)}
+        for index in range(count)
+    }
+
+def formats():
+    yield "json", lambda prices: [json.dumps(prices).encode("utf-8")], lambda frames: json.loads(frames[0])
+    for compression in [None] + wire_format.supported_compression():
+        yield (f"binary-{compression or 'raw'}",
+               lambda prices, c = compression: wire_format.encode_prices(prices, compression = c),
+               wire_format.decode_prices)
+
+def best_of(repeat, fn, *args):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def run(sizes, repeat):
+    results = []
+    for count in sizes:
+        prices = synthetic_prices(count)
+        for name, encode, decode in formats():
+            encode_seconds, frames = best_of(repeat, encode, prices)
+            decode_seconds, decoded = best_of(repeat, decode, frames)
+            assert len(decoded) == count
+            size = sum(len(frame) for frame in frames)
+            results.append({
+                "format": name,
+                "items": count,
+                "encode_ms": 1000 * encode_seconds,
+                "decode_ms": 1000 * decode_seconds,
+                "bytes": size,
+                "bytes_per_item": size / count
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type = int, nargs = "+", default = [1000, 10000, 100000])
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--json", help = "Also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.items, args.repeat)
+    print(f"{'format':<14}{'items':>9}{'encode ms':>12}{'decode ms':>12}{'bytes/item':>12}")
+    for row in results:
+        print(f"{row['format']:<14}{row['items']:>9}{row['encode_ms']:>12.2f}{row['decode_ms']:>12.2f}{row['bytes_per_item']:>12.2f}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent = 2)
+
+if __name__ == "__main__":
+    main()
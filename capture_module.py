@@ -1,45 +1,485 @@
+import abc
 import cv2
+import os
+import queue
+import threading
+import time
+from collections import deque
 from pyzbar.pyzbar import decode
 
-class CaptureModule:
-    def __init__ (self, camera_index = 0):
-        self.camera_index = camera_index
-        self.camera = cv2.VideoCapture(camera_index)
-        if not self.camera.isOpened():
-            raise IOError("Cannot open camera!")
-        
-    def __del__(self):
+import metrics
+
+FRAME_BUFFER_SIZE = 4
+DUPLICATE_WINDOW_SECONDS = 2.0 # A barcode held in view is reported once until it leaves for this long
+
+DECODE_WIDTH = 640 # Cheap stages work on frames/ROIs downscaled to at most this width
+MAX_ROIS = 3
+DECODE_STAGES = ("roi", "gray", "threshold", "full_res")
+PREVIEW_MAX_FPS = 30
+
+def preprocess_image(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thresh
+
+def scan_barcode(image):
+    results = []
+    for barcode in decode(image):
+        barcode_data = barcode.data.decode("utf-8")
+        barcode_type = barcode.type
+        results.append((barcode_data, barcode_type))
+    return results
+
+def _downscale(image, max_width = DECODE_WIDTH):
+    height, width = image.shape[:2]
+    if width <= max_width:
+        return image
+    scale = max_width / width
+    return cv2.resize(image, (max_width, int(height * scale)), interpolation = cv2.INTER_AREA)
+
+def fit_size(width, height, box_width, box_height):
+    """ Largest (width, height) with the frame's aspect ratio that fits inside the box. """
+    if box_width * height > box_height * width:
+        return max(int(width * box_height / height), 1), box_height
+    return box_width, max(int(height * box_width / width), 1)
+
+def preview_image(frame, box):
+    """ frame downscaled to fit box=(width, height), as a contiguous RGB array ready for the Tk preview. """
+    height, width = frame.shape[:2]
+    size = fit_size(width, height, *box)
+    if size != (width, height):
+        frame = cv2.resize(frame, size, interpolation = cv2.INTER_LINEAR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB if frame.ndim == 3 else cv2.COLOR_GRAY2RGB)
+
+def find_barcode_regions(gray, max_regions = MAX_ROIS):
+    """
+    Finds barcode-like regions (dense vertical edges) with a gradient + morphology pass.
+    Returns up to max_regions (x, y, w, h) boxes in gray's coordinates, largest first.
+    """
+    grad_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize = -1)
+    grad_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize = -1)
+    gradient = cv2.convertScaleAbs(cv2.subtract(grad_x, grad_y))
+    blurred = cv2.blur(gradient, (9, 9))
+    _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7))
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    closed = cv2.dilate(cv2.erode(closed, None, iterations = 4), None, iterations = 4)
+    contours = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+
+    height, width = gray.shape[:2]
+    regions = []
+    for contour in sorted(contours, key = cv2.contourArea, reverse = True)[:max_regions]:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w < 20 or h < 10:
+            continue
+        pad_x, pad_y = w // 5, h // 5 # zbar needs some quiet zone around the bars
+        x0, y0 = max(x - pad_x, 0), max(y - pad_y, 0)
+        x1, y1 = min(x + w + pad_x, width), min(y + h + pad_y, height)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+    return regions
+
+def _decode_rois(small_gray):
+    for x, y, w, h in find_barcode_regions(small_gray):
+        results = scan_barcode(small_gray[y:y + h, x:x + w])
+        if results:
+            return results
+    return []
+
+def decode_frame(frame):
+    """
+    Staged decode, cheapest first: ROI crops of the downscaled frame, the downscaled grayscale,
+    its Otsu threshold, and finally the full-resolution frame (grayscale, then the original pipeline).
+    Returns (results, attempts) where attempts lists (stage, hit, seconds) for every stage tried.
+    Module level so it can be shipped to a process pool.
+    """
+    attempts = []
+    cache = {}
+
+    def gray():
+        if "gray" not in cache:
+            cache["gray"] = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cache["gray"]
+
+    def small_gray():
+        if "small" not in cache:
+            cache["small"] = _downscale(gray())
+        return cache["small"]
+
+    stages = (
+        ("roi", lambda: _decode_rois(small_gray())),
+        ("gray", lambda: scan_barcode(small_gray())),
+        ("threshold", lambda: scan_barcode(preprocess_image(small_gray()))),
+        ("full_res", lambda: scan_barcode(gray()) or scan_barcode(preprocess_image(frame))),
+    )
+    for stage, run in stages:
+        start = time.perf_counter()
+        results = run()
+        attempts.append((stage, bool(results), time.perf_counter() - start))
+        if results:
+            return results, attempts
+    return [], attempts
+
+
+class DecodeStats:
+    """ Per-stage attempt/hit counters and latency totals for decode_frame, for tuning the chain. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.frames = 0
+            self.stages = {stage: {"attempts": 0, "hits": 0, "seconds": 0.0} for stage in DECODE_STAGES}
+
+    def record(self, attempts):
+        with self.lock:
+            self.frames += 1
+            for stage, hit, seconds in attempts:
+                entry = self.stages[stage]
+                entry["attempts"] += 1
+                entry["hits"] += int(hit)
+                entry["seconds"] += seconds
+
+    def summary(self):
+        """ Returns {stage: {"attempts", "hits", "hit_rate", "avg_ms"}} plus the frame count. """
+        with self.lock:
+            summary = {"frames": self.frames}
+            for stage, entry in self.stages.items():
+                attempts = entry["attempts"]
+                summary[stage] = {
+                    "attempts": attempts,
+                    "hits": entry["hits"],
+                    "hit_rate": entry["hits"] / attempts if attempts else 0.0,
+                    "avg_ms": 1000 * entry["seconds"] / attempts if attempts else 0.0
+                }
+            return summary
+
+
+class FrameRingBuffer:
+    """ Holds the most recent frames. Publishing never blocks; the oldest frame is overwritten. """
+    def __init__(self, capacity = FRAME_BUFFER_SIZE):
+        self.frames = deque(maxlen = capacity)
+        self.sequence = 0
+        self.condition = threading.Condition()
+
+    def publish(self, frame):
+        with self.condition:
+            self.sequence += 1
+            self.frames.append((self.sequence, frame))
+            self.condition.notify_all()
+
+    def latest(self):
+        """ Returns (sequence, frame) for the newest frame, or (0, None) if nothing was captured yet. """
+        with self.condition:
+            return self.frames[-1] if self.frames else (0, None)
+
+    def wait_newer(self, sequence, timeout):
+        """ Blocks until a frame newer than sequence is published (or timeout) and returns the newest one. """
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > sequence, timeout)
+            return self.frames[-1] if self.frames else (0, None)
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+class FrameSource(abc.ABC):
+    """
+    Where CaptureModule gets its frames. read() behaves like cv2.VideoCapture.read(): (ok, frame), paced like
+    a live camera. frames() is for offline work: one unpaced pass yielding (frame_id, frame).
+    """
+    name = "source"
+
+    @abc.abstractmethod
+    def is_open(self):
+        """ Whether the source opened and has frames to read. """
+
+    @abc.abstractmethod
+    def read(self):
+        """ The next frame as (ok, frame), paced like a live camera. """
+
+    def frames(self):
+        frame_id = 0
+        while True:
+            result, frame = self.read()
+            if not result:
+                return
+            yield frame_id, frame
+            frame_id += 1
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    """ A live device (or anything else cv2.VideoCapture opens, such as a stream URL). """
+    def __init__(self, index = 0):
+        self.name = str(index)
+        self.camera = cv2.VideoCapture(index)
+
+    def is_open(self):
+        return self.camera.isOpened()
+
+    def read(self):
+        return self.camera.read()
+
+    def release(self):
         if self.camera.isOpened():
             self.camera.release()
-        
+
+
+class _ReplaySource(FrameSource):
+    """ Paces read() at fps and starts over at the end when looping, so a recording stands in for a camera. """
+    def __init__(self, fps, loop):
+        self.interval = 1 / fps
+        self.loop = loop
+        self.next_frame_time = time.monotonic()
+
+    def read(self):
+        delay = self.next_frame_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_frame_time = max(self.next_frame_time + self.interval, time.monotonic())
+        result, frame = self._next()
+        if not result and self.loop:
+            self._rewind()
+            result, frame = self._next()
+        return result, frame
+
+    @abc.abstractmethod
+    def _next(self):
+        """ The next frame as (ok, frame), unpaced. """
+
+    @abc.abstractmethod
+    def _rewind(self):
+        """ Goes back to the first frame. """
+
+
+class VideoFileSource(_ReplaySource):
+    """ A video file played at its own frame rate (or fps). """
+    def __init__(self, path, fps = None, loop = True):
+        self.name = path
+        self.video = cv2.VideoCapture(path)
+        super().__init__(fps or self.video.get(cv2.CAP_PROP_FPS) or 30, loop)
+
+    def is_open(self):
+        return self.video.isOpened()
+
+    def _next(self):
+        return self.video.read()
+
+    def _rewind(self):
+        self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def frames(self):
+        self._rewind()
+        frame_id = 0
+        while True:
+            result, frame = self.video.read()
+            if not result:
+                return
+            yield frame_id, frame
+            frame_id += 1
+
+    def release(self):
+        self.video.release()
+
+
+class ImageDirectorySource(_ReplaySource):
+    """ The images in a directory, in file name order, shown fps times a second. Unreadable files are skipped. """
+    def __init__(self, path, fps = 30, loop = True):
+        self.name = path
+        self.paths = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if name.lower().endswith(IMAGE_EXTENSIONS)]
+        self.position = 0
+        super().__init__(fps, loop)
+
+    def is_open(self):
+        return bool(self.paths)
+
+    def _next(self):
+        while self.position < len(self.paths):
+            frame = cv2.imread(self.paths[self.position])
+            self.position += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def _rewind(self):
+        self.position = 0
+
+    def frames(self):
+        for path in self.paths:
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield os.path.basename(path), frame
+
+
+def open_source(source):
+    """
+    A FrameSource for source: a FrameSource (returned as is), a camera index (int or digit string),
+    a directory of images, a video file, or any other cv2.VideoCapture argument.
+    """
+    if isinstance(source, FrameSource):
+        return source
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, str) and os.path.isdir(source):
+        return ImageDirectorySource(source)
+    if isinstance(source, str) and os.path.isfile(source):
+        return VideoFileSource(source)
+    return CameraSource(source)
+
+
+class CaptureModule:
+    def __init__ (self, source = 0, decode_pool = None):
+        """
+        :param source: FrameSource, camera index, video file or image directory (see open_source).
+        :param decode_pool: Optional concurrent.futures executor shared with other lanes; frames are decoded
+                            there instead of on this module's decode thread.
+        """
+        self.source = open_source(source)
+        if not self.source.is_open():
+            raise IOError(f"Cannot open frame source {self.source.name}!")
+        self.decode_pool = decode_pool
+
+        self.frame_buffer = FrameRingBuffer()
+        self.barcode_events = queue.Queue()
+        self.scanning = threading.Event()
+        self.running = False
+        self.capture_thread = None
+        self.decode_thread = None
+        self.decode_stats = DecodeStats()
+        self._last_seen = {}
+        self.preview_box = None
+        self.preview_interval = 1 / PREVIEW_MAX_FPS
+        self._preview = (0, None)
+        self._last_preview_time = 0.0
+
+    def __del__(self):
+        self.running = False
+        if hasattr(self, "source"):
+            self.source.release()
+
+    def start(self):
+        """
+        Starts the capture thread, which becomes the only reader of the frame source, and the decode
+        worker, which decodes the newest frame whenever scanning is enabled.
+        """
+        if self.running:
+            return
+        self.running = True
+        self.capture_thread = threading.Thread(target = self._capture_loop, daemon = True)
+        self.decode_thread = threading.Thread(target = self._decode_loop, daemon = True)
+        self.capture_thread.start()
+        self.decode_thread.start()
+
+    def stop(self):
+        self.running = False
+        for thread in (self.capture_thread, self.decode_thread):
+            if thread and thread.is_alive():
+                thread.join(timeout = 1)
+
+    def release(self):
+        self.stop()
+        self.source.release()
+
+    def configure_preview(self, box, max_fps = PREVIEW_MAX_FPS):
+        """
+        Makes the capture thread keep a preview-sized RGB copy of the newest frame, so the Tk thread never
+        resizes or converts full frames.
+        :param box: (width, height) the preview is fitted into, or None to stop making previews.
+        :param max_fps: Previews are made at most this often, whatever the camera rate.
+        """
+        self.preview_interval = 1 / max_fps
+        self.preview_box = box
+
+    def latest_preview(self):
+        """ Returns (sequence, rgb) for the newest preview, or (0, None) before the first one. """
+        return self._preview
+
+    def _update_preview(self, frame):
+        box = self.preview_box
+        now = time.monotonic()
+        if box is None or now - self._last_preview_time < self.preview_interval:
+            return
+        self._last_preview_time = now
+        self._preview = (self.frame_buffer.sequence, preview_image(frame, box))
+
+    def _capture_loop(self):
+        while self.running:
+            result, frame = self.source.read()
+            if result:
+                self.frame_buffer.publish(frame)
+                self._update_preview(frame)
+            else:
+                time.sleep(0.01)
+
+    def _decode_loop(self):
+        sequence = 0
+        while self.running:
+            if not self.scanning.wait(timeout = 0.5):
+                continue
+            sequence, frame = self.frame_buffer.wait_newer(sequence, timeout = 0.5)
+            if frame is None:
+                continue
+            try:
+                results = self.scan_frame(frame)
+            except Exception as e:
+                print(f"[CaptureModule] Error decoding frame: {e}")
+                continue
+            self._emit_new(results)
+
+    def _emit_new(self, results):
+        """
+        Queues barcodes that were not already seen within DUPLICATE_WINDOW_SECONDS.
+        _last_seen is kept in the order barcodes were last seen, so entries older than the window are dropped from its front.
+        """
+        now = time.monotonic()
+        for barcode_data, barcode_type in results:
+            last_seen = self._last_seen.pop(barcode_data, None)
+            self._last_seen[barcode_data] = now
+            if last_seen is None or now - last_seen > DUPLICATE_WINDOW_SECONDS:
+                self.barcode_events.put((barcode_data, barcode_type))
+        while self._last_seen:
+            barcode_data, last_seen = next(iter(self._last_seen.items()))
+            if now - last_seen <= DUPLICATE_WINDOW_SECONDS:
+                break
+            del self._last_seen[barcode_data]
+
+    def get_barcode_events(self):
+        """ Drains and returns the de-duplicated (barcode_data, barcode_type) events without blocking. """
+        events = []
+        while True:
+            try:
+                events.append(self.barcode_events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def latest_frame(self):
+        """ Newest captured frame (None before the first one) without touching the frame source. """
+        return self.frame_buffer.latest()[1]
+
     def capture_frame(self):
-        result, frame = self.camera.read()
+        if self.running:
+            frame = self.latest_frame()
+            if frame is None:
+                raise IOError("Failed to capture image!")
+            return frame
+        result, frame = self.source.read()
         if not result:
             raise IOError("Failed to capture image!")
         return frame
-    
-    def preprocess_image(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        return thresh
-    
-    def scan_barcode(self, pre_processed_frame):
-        barcodes = decode(pre_processed_frame)
-        results = []
-        for barcode in barcodes:
-            barcode_data = barcode.data.decode("utf-8")
-            barcode_type = barcode.type
-            results.append((barcode_data, barcode_type))
+
+    @metrics.timed("capture_decode_seconds", "Decoding one captured frame through the staged chain, pool round trip included")
+    def scan_frame(self, frame):
+        """ Decodes a raw frame through the staged decode_frame chain and records its stage stats. """
+        if self.decode_pool is not None:
+            results, attempts = self.decode_pool.submit(decode_frame, frame).result()
+        else:
+            results, attempts = decode_frame(frame)
+        self.decode_stats.record(attempts)
+        for stage, hit, seconds in attempts:
+            metrics.observe(f"capture_decode_{stage}_seconds", seconds, f"The {stage} stage of decode_frame, hit or miss")
         return results
-    
-    def capture_pipeline(self):
-        frame = self.capture_frame()
-        pre_processed_frame = self.preprocess_image(frame)
-        results = self.scan_barcode(pre_processed_frame)
-        return frame, results
-        
-        
-    
-    
-        
@@ -2,22 +2,34 @@ import tkinter as tk
 from tkinter import ttk
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import json
-import os
+import queue
 from PIL import Image, ImageTk
 
+import metrics
+
+CHANGE_POLL_MS = 200 # How often queued item change events are applied on the Tk thread
+RECENT_BARCODES_KEPT = 100
+
 
 class DashboardModule(tk.Frame):
-    def __init__(self, parent, process_module, json_path="items.json", max_items=5):
+    def __init__(self, parent, process_module, max_items=5, top_window="day"):
+        """
+        Shows the recently bought items and the price trends of the most bought ones.
+        Reads the catalog in memory and redraws when ItemDataManager reports changes, instead of polling items.json.
+        :param process_module: ItemProcessor whose item_data_manager holds the catalog.
+        :param top_window: Purchase window the most bought items are ranked by, when it has been added (see PurchaseTracker.add_window);
+                           all-time best sellers fill the remaining places.
+        """
         super().__init__(parent)
         self.process_module = process_module
+        self.item_data_manager = process_module.item_data_manager
         self.recent_barcodes = []
         self.icon_up = ImageTk.PhotoImage(Image.open("icons/up_arrow.png").resize((16, 16)))
         self.icon_down = ImageTk.PhotoImage(Image.open("icons/down_arrow.png").resize((16, 16)))
         self.icon_same = ImageTk.PhotoImage(Image.open("icons/no_change.png").resize((16, 16)))
 
-        self.json_path = json_path
         self.max_items = max_items
+        self.top_window = top_window
 
         self.recent_frame = ttk.LabelFrame(self, text="Recently Bought Items")
         self.recent_frame.pack(fill='x', padx=10, pady=10)
@@ -68,48 +80,86 @@ class DashboardModule(tk.Frame):
         self.figure, self.ax = plt.subplots(figsize=(5, 3))
         self.canvas = FigureCanvasTkAgg(self.figure, self.graph_frame)
         self.canvas.get_tk_widget().pack(fill='both', expand=True)
-        self.load_existing_data()
-
-    def update_dashboard(self, transaction_barcodes):
-        if not os.path.exists(self.json_path):
-            self.clear_dashboard_ui("No data available.")
-            return
-
-        with open(self.json_path, 'r') as f:
-            items = json.load(f)
-
-        self.recent_barcodes.extend(transaction_barcodes)
-
-        seen = {}
-        for barcode in reversed(self.recent_barcodes):
-            if barcode in items and barcode not in seen:
-                seen[barcode] = items[barcode]
-
-        recent_items = list(seen.items())[:self.max_items]
-
-        # Update graph with top items
-        sorted_items = sorted(items.items(), key=lambda x: x[1].get("total_bought", 0), reverse=True)
-        top_items = sorted_items[:5]
-
-        self.ax.clear()
-        for idx, (barcode, item) in enumerate(top_items):
-            name = item.get("item_name", f"Item {idx}")
-            history = item.get("history", [])[-10:]  # Last 10 entries
-
-            if len(history) >= 2:
-                self.ax.plot(range(len(history)), history, label=name, linewidth=2, marker='o')
-            elif len(history) == 1:
-                self.ax.plot([0, 1], [history[0], history[0]], label=name, linewidth=2, marker='o')
 
+        # The axes and one line per top item are created once; refreshes only swap their data
         self.ax.set_xticks([])
         self.ax.set_title("Top 5 Most Bought Items – Price Trend")
         self.ax.set_ylabel("Current Price")
         self.ax.set_xlabel("Change in Price")
-        self.ax.legend()
         self.ax.grid(True)
-        self.canvas.draw()
+        self.lines = [self.ax.plot([], [], linewidth=2, marker='o', visible=False)[0] for _ in range(self.max_items)]
+        self.legend_names = None
 
-        for i, (icon_label, name_label, price_label, delta_label) in enumerate(self.recent_labels):
+        self.top_barcodes = [] # Best sellers currently drawn
+
+        self.changed_barcodes = queue.Queue()
+        self.item_data_manager.subscribe(self._on_items_changed)
+        self.load_existing_data()
+        self._poll_changes()
+
+    def _on_items_changed(self, barcodes):
+        """ ItemDataManager subscriber. May run on any thread, so it only queues the barcodes for the Tk thread. """
+        self.changed_barcodes.put(barcodes)
+
+    def _poll_changes(self):
+        """ Applies queued change events on the Tk thread and redraws if any shown item changed. """
+        changed = set()
+        while True:
+            try:
+                changed |= self.changed_barcodes.get_nowait()
+            except queue.Empty:
+                break
+        if changed:
+            top_barcodes = self._top_sellers()
+            if top_barcodes != self.top_barcodes or not changed.isdisjoint(top_barcodes + self.recent_barcodes[-self.max_items:]):
+                self.refresh()
+        self.after(CHANGE_POLL_MS, self._poll_changes)
+
+    def _top_sellers(self):
+        """ Barcodes of the max_items items bought most within top_window, then of the all-time best sellers. """
+        top = []
+        if self.top_window in self.item_data_manager.purchases.windows:
+            top = [barcode for barcode, _ in self.item_data_manager.top_sellers(self.max_items, self.top_window)]
+        for barcode, _ in self.item_data_manager.top_sellers(self.max_items):
+            if len(top) == self.max_items:
+                break
+            if barcode not in top:
+                top.append(barcode)
+        return top
+
+    @metrics.timed("dashboard_update_seconds", "Adding a transaction to the dashboard and redrawing")
+    def update_dashboard(self, transaction_barcodes):
+        """ Adds a finished transaction to the recently bought list and refreshes the dashboard. """
+        self.recent_barcodes.extend(transaction_barcodes)
+        del self.recent_barcodes[:-RECENT_BARCODES_KEPT]
+        self.refresh()
+
+    @metrics.timed("dashboard_refresh_seconds", "Dashboard redraw from the in-memory catalog")
+    def refresh(self):
+        """ Redraws from the in-memory catalog. Touches only the top and recent items, so the cost does not grow with the catalog. """
+        items = self.item_data_manager.items
+        with self.item_data_manager.lock:
+            if not items:
+                self.clear_dashboard_ui("No data available.")
+                return
+
+            seen = {}
+            for barcode in reversed(self.recent_barcodes):
+                if barcode in items and barcode not in seen:
+                    seen[barcode] = dict(items[barcode], history=self.item_data_manager.price_history(barcode, 2))
+                    if len(seen) == self.max_items:
+                        break
+            recent_items = list(seen.items())
+
+            self.top_barcodes = self._top_sellers()
+            series = []
+            for idx, barcode in enumerate(self.top_barcodes):
+                item = items.get(barcode, {})
+                series.append((item.get("item_name", f"Item {idx}"), self.item_data_manager.price_history(barcode, 10))) # Last 10 entries
+
+        self._update_graph(series)
+
+        for i, (icon_label, name_label, price_label, demand_label, base_label, delta_label) in enumerate(self.recent_labels):
             if i < len(recent_items):
                 barcode, data = recent_items[i]
                 name = data.get("item_name", "Unknown")
@@ -136,6 +186,34 @@ class DashboardModule(tk.Frame):
                 base_label.config(text="")
                 delta_label.config(text="")
 
+    def _update_graph(self, series):
+        """ Moves the persistent lines to the new histories and schedules a redraw for when Tk is idle. """
+        names = []
+        for line, index in zip(self.lines, range(self.max_items)):
+            name, history = series[index] if index < len(series) else (None, [])
+            if len(history) == 1:
+                history = [history[0], history[0]]
+            if len(history) >= 2:
+                line.set_data(range(len(history)), history)
+                line.set_label(name)
+                line.set_visible(True)
+                names.append(name)
+            else:
+                line.set_data([], [])
+                line.set_label(None)
+                line.set_visible(False)
+
+        if names != self.legend_names:
+            # Only rebuilt when the set of plotted items changes
+            if self.ax.get_legend():
+                self.ax.get_legend().remove()
+            if names:
+                self.ax.legend(handles=[line for line in self.lines if line.get_visible()])
+            self.legend_names = names
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+        self.canvas.draw_idle()
+
     def get_trend_icon_image(self, current, base):
         if current > base:
             return self.icon_up
@@ -153,28 +231,29 @@ class DashboardModule(tk.Frame):
             tk.messagebox.showinfo("Reset Done", "All item histories and prices have been reset.")
 
     def load_existing_data(self):
-        if not os.path.exists(self.json_path):
-            return
-
-        with open(self.json_path, 'r') as f:
-            items = json.load(f)
-
-        items_with_history = {k: v for k, v in items.items() if v.get("history")}
-        sorted_items = sorted(items_with_history.items(), key=lambda x: x[1].get("total_bought", 0), reverse=True)
-        top_items = sorted_items[:self.max_items]
-        self.recent_barcodes = [barcode for barcode, _ in top_items]
-        self.update_dashboard(self.recent_barcodes)
+        with self.item_data_manager.lock:
+            # Best sellers first, from the purchase tracker, so neither items on disk nor price histories are read in
+            # beyond the few needed to fill the list
+            history = self.item_data_manager.history
+            self.recent_barcodes = []
+            for barcode, _ in self.item_data_manager.purchases.ranked():
+                if len(self.recent_barcodes) == self.max_items:
+                    break
+                if history.has_history(barcode):
+                    self.recent_barcodes.append(barcode)
+        self.refresh()
 
     def clear_dashboard_ui(self, message="Waiting for data..."):
-        self.ax.clear()
-        self.ax.set_title("Most Bought Items – Price Trend")
-        self.ax.set_ylabel("Current Price")
-        self.ax.set_xlabel("Change in Price")
-        self.ax.grid(True)
-        self.canvas.draw()
+        self._update_graph([])
 
-        for icon_label, name_label, price_label, delta_label in self.recent_labels:
+        for icon_label, name_label, price_label, demand_label, base_label, delta_label in self.recent_labels:
             icon_label.config(image="")
             name_label.config(text=message)
             price_label.config(text="")
+            demand_label.config(text="")
+            base_label.config(text="")
             delta_label.config(text="")
+
+    def destroy(self):
+        self.item_data_manager.unsubscribe(self._on_items_changed)
+        super().destroy()
@@ -1,30 +1,110 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import os
 import json
+import sqlite3
+import threading
 from datetime import datetime
 
 app = Flask(__name__)
 
 user_home = os.path.expanduser('~')
-flashcards_file = os.path.join(user_home, 'AllFlashcards.json')
-
-def initialize_json_file():
+flashcards_file = os.path.join(user_home, 'AllFlashcards.json') # Legacy store list, imported once into the database
+registry_db = os.path.join(user_home, 'AllFlashcards.db')
+
+# Stores are indexed by lowercase name and items by (store, itemname), so lookups and duplicate checks
+# are index probes and a submit only writes the rows it adds. SQLite's locking makes concurrent
+# requests (threads or worker processes) safe without losing updates.
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+def get_db():
+    """ One connection per worker thread, created on first use. """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        initialize_db()
+        conn = sqlite3.connect(registry_db, timeout=30)
+        conn.row_factory = sqlite3.Row
+        _local.conn = conn
+    return conn
+
+def initialize_db():
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        conn = sqlite3.connect(registry_db, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS stores (
+                            name_key TEXT PRIMARY KEY,
+                            storename TEXT NOT NULL,
+                            storeIP TEXT,
+                            storeCo TEXT,
+                            timestamp TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS items (
+                            name_key TEXT NOT NULL,
+                            itemname TEXT NOT NULL,
+                            UNIQUE (name_key, itemname))''')
+        if conn.execute('SELECT COUNT(*) FROM stores').fetchone()[0] == 0:
+            import_json_file(conn)
+        conn.close()
+        _initialized = True
+
+def import_json_file(conn):
+    """ Copies the stores from the old AllFlashcards.json list into the database, if there is one. """
     if not os.path.exists(flashcards_file):
-        with open(flashcards_file, 'w') as f:
-            json.dump([], f)
-    else:
-        try:
-            with open(flashcards_file, 'r') as f:
-                data = json.load(f)
-            if not isinstance(data, list):
-                raise ValueError("JSON is not a list")
-        except Exception:
-            with open(flashcards_file, 'w') as f:
-                json.dump([], f)
+        return
+    try:
+        with open(flashcards_file, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError("JSON is not a list")
+    except Exception:
+        return
+    skipped = 0
+    with conn:
+        for store in data:
+            if not _valid_store_entry(store):
+                skipped += 1
+                continue
+            upsert_store(conn, store['storename'], store.get('storeIP', ''), store.get('storeCo', ''),
+                         store.get('itemslist') or [], store.get('timestamp'))
+    if skipped:
+        app.logger.warning(f"Skipped {skipped} malformed store entries in {flashcards_file}")
+
+def _valid_store_entry(store):
+    """ A legacy entry needs a non-empty storename; itemslist, if present, must be a list of strings. """
+    if not isinstance(store, dict) or not isinstance(store.get('storename'), str) or not store['storename']:
+        return False
+    itemnames = store.get('itemslist') or []
+    return isinstance(itemnames, list) and all(isinstance(itemname, str) for itemname in itemnames)
+
+def upsert_store(conn, storename, storeIP, storeCo, itemnames, timestamp=None):
+    """ Adds itemnames to the store entry (creating it if needed) and returns the response message. Caller commits. """
+    name_key = storename.lower()
+    timestamp = timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    updated = conn.execute('UPDATE stores SET storeIP = ?, storeCo = ?, timestamp = ? WHERE name_key = ?',
+                           (storeIP, storeCo, timestamp, name_key)).rowcount
+    if not updated:
+        conn.execute('INSERT INTO stores (name_key, storename, storeIP, storeCo, timestamp) VALUES (?, ?, ?, ?, ?)',
+                     (name_key, storename, storeIP, storeCo, timestamp))
+    conn.executemany('INSERT OR IGNORE INTO items (name_key, itemname) VALUES (?, ?)',
+                     [(name_key, itemname) for itemname in itemnames])
+    return 'Store updated' if updated else 'New store added'
+
+def store_as_dict(conn, store_row):
+    """ The JSON shape stores have always been returned in, with items in insertion order. """
+    items = conn.execute('SELECT itemname FROM items WHERE name_key = ? ORDER BY rowid', (store_row['name_key'],))
+    return {
+        'storename': store_row['storename'],
+        'storeIP': store_row['storeIP'],
+        'storeCo': store_row['storeCo'],
+        'timestamp': store_row['timestamp'],
+        'itemslist': [row['itemname'] for row in items]
+    }
+
 @app.route('/submit', methods=['GET'])
 def submit_data():
-    initialize_json_file()
-
     searchStore = request.args.get('searchStore')
     insertStore = request.args.get('insertStore')
     storename = request.args.get('storename', '').strip()
@@ -47,17 +127,15 @@ def submit_data():
     insertStore = int(insertStore)
 
     try:
-        with open(flashcards_file, 'r') as f:
-            data = json.load(f)
-    except Exception as e:
-        return jsonify({'error': f'Failed to load JSON file: {str(e)}'}), 500
-
-    existing_store = next((store for store in data if store['storename'].lower() == storename.lower()), None)
+        conn = get_db()
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Failed to open database: {str(e)}'}), 500
 
     if insertStore == 0:  #Search mode
-        # Just return store JSON if found, else 404 
+        # Just return store JSON if found, else 404
+        existing_store = conn.execute('SELECT * FROM stores WHERE name_key = ?', (storename.lower(),)).fetchone()
         if existing_store:
-            return jsonify(existing_store), 200
+            return jsonify(store_as_dict(conn, existing_store)), 200
         else:
             return jsonify({'error': f'Store "{storename}" not found'}), 404
 
@@ -65,36 +143,71 @@ def submit_data():
     if not itemname:
         return jsonify({'error': 'itemname is required when inserting/updating'}), 400
 
-    if existing_store:
-        if 'itemslist' not in existing_store or not isinstance(existing_store['itemslist'], list):
-            existing_store['itemslist'] = []
-
-        existing_store['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        if itemname not in existing_store['itemslist']:
-            existing_store['itemslist'].append(itemname)
-        existing_store['storeIP'] = storeIP
-        existing_store['storeCo'] = storeCo
-
-        message = 'Store updated'
-    else:
-        new_store = {
-            'storename': storename,
-            'storeIP': storeIP,
-            'storeCo': storeCo,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'itemslist': [itemname]
-        }
-        data.append(new_store)
-        message = 'New store added'
+    try:
+        with conn:
+            message = upsert_store(conn, storename, storeIP, storeCo, [itemname])
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Failed to save data: {str(e)}'}), 500
+
+    return jsonify({
+        'message': message,
+        'storename': storename,
+        'path': registry_db
+    }), 200
+
+@app.route('/submit_batch', methods=['POST'])
+def submit_batch():
+    """ Inserts many items for one store per request: JSON body {storename, storeIP, storeCo, password, items: [...]} """
+    payload = request.get_json(silent=True) or {}
+    storename = str(payload.get('storename', '')).strip()
+    storeIP = str(payload.get('storeIP', '')).strip()
+    storeCo = str(payload.get('storeCo', '')).strip()
+    items = payload.get('items', [])
+
+    if payload.get('password') != 'password':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    if not storename:
+        return jsonify({'error': 'storename is required'}), 400
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
 
     try:
-        with open(flashcards_file, 'w') as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
+        conn = get_db()
+        with conn:
+            message = upsert_store(conn, storename, storeIP, storeCo, [str(item).strip() for item in items])
+    except sqlite3.Error as e:
         return jsonify({'error': f'Failed to save data: {str(e)}'}), 500
 
     return jsonify({
         'message': message,
         'storename': storename,
-        'path': flashcards_file
+        'items': len(items),
+        'path': registry_db
     }), 200
+
+@app.route('/stores', methods=['GET'])
+def list_stores():
+    """
+    Streams matching stores as newline-delimited JSON, one store per line, without building the
+    whole result in memory. ?q= filters by case-insensitive storename substring; ?items=0 omits itemslist.
+    """
+    if request.args.get('password', '') != 'password':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    query = request.args.get('q', '').strip().lower()
+    include_items = request.args.get('items', '1') != '0'
+    conn = get_db()
+
+    def generate():
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        rows = conn.execute("SELECT * FROM stores WHERE name_key LIKE ? ESCAPE '\\' ORDER BY name_key", (pattern,))
+        for row in rows:
+            if include_items:
+                store = store_as_dict(conn, row)
+            else:
+                store = {key: row[key] for key in ('storename', 'storeIP', 'storeCo', 'timestamp')}
+            yield json.dumps(store) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -0,0 +1,326 @@
+"""
+Runs a store without the Tk GUI, camera or dashboard: pricing, decay and price sync on an asyncio loop.
+
+    python3 headless.py [--items items.json] [--stores stores.json] [--http 127.0.0.1:8765]
+                        [--replay transactions.jsonl] [--exit-after-replay] [--publish]
+                        [--lanes 0 1 lane3.mp4] [--decode-workers 4] [--lane-idle-finish 5]
+
+Transactions come from either source:
+    HTTP   POST /transactions  {"barcodes": ["0001", "0001", "0002"]}   -> {"processed": 3, "prices": {...}}
+           GET  /items/<barcode>                                         -> {"item_name": ..., "current_price": ...}
+           GET  /health                                                  -> item count and transaction queue depth/latency
+           A 202 with "durable": false means the transaction was applied but the save failed; it is written with
+           the next save that succeeds and must not be sent again.
+    replay one transaction per line, either a JSON list of barcodes or {"barcodes": [...]}
+    lanes  one camera (or video file / image directory) per checkout lane, see lane_manager.py
+           POST /lanes/<id>/finish                                       -> {"prices": {...}} once that lane's items are saved
+           GET  /lanes                                                   -> per-lane frames/sec, scans and transactions
+
+Only the pricing and sync modules are imported; nothing here loads tkinter or matplotlib, and OpenCV/pyzbar
+are only loaded when --lanes is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from datetime import datetime
+
+from item_data_manager import ItemDataManager
+from process_module import ItemProcessor
+from transaction_queue import NotDurableError, TransactionQueue
+import metrics
+
+JSON_FILE = "items.json"
+STORES_CONFIG = "stores.json"
+HTTP_ADDRESS = "127.0.0.1:8765"
+HOURLY_INTERVAL_SIMULATED = 10 # Same simulated hour and day as DemandSyncApp
+DAILY_INTERVAL_SIMULATED = 120
+MAX_REQUEST_BYTES = 1024 * 1024
+
+
+def log_message(message, log_type="info"):
+    print(f"{datetime.now().strftime('[%H:%M:%S]')} [{log_type.upper()}] {message}")
+
+
+class HeadlessService:
+    def __init__(self, filepath = JSON_FILE, network_config = None, http_address = HTTP_ADDRESS, replay_path = None,
+                 replay_delay = 0.0, exit_after_replay = False, publish = False,
+                 hourly_interval = HOURLY_INTERVAL_SIMULATED, daily_interval = DAILY_INTERVAL_SIMULATED,
+                 lane_sources = None, decode_workers = None, lane_idle_finish = None, store_name = None):
+        """
+        :param network_config: NetworkManager keyword arguments (see load_topology); None runs without price sync.
+        :param http_address: "host:port" for the transaction API, or None to disable it.
+        :param replay_path: File of transactions to process at startup, replay_delay seconds apart.
+        :param publish: Also publish changed prices to the store registry (imports requests on demand).
+        :param store_name: Name in the store registry; defaults to the mesh's (see load_topology), so it is required
+                           to publish without network_config.
+        :param lane_sources: Camera indexes / video files, one per checkout lane, all feeding this store's catalog.
+        """
+        if publish and not store_name and not network_config:
+            raise ValueError("Publishing to the store registry without a store mesh needs a store_name")
+        self.http_address = http_address
+        self.replay_path = replay_path
+        self.replay_delay = replay_delay
+        self.exit_after_replay = exit_after_replay
+        self.hourly_interval = hourly_interval
+        self.daily_interval = daily_interval
+
+        self.item_data_manager = ItemDataManager(filepath = filepath, log_callback = log_message)
+        self.item_data_manager.purchases.add_window("day", daily_interval)
+        self.item_processor = ItemProcessor(item_data_manager = self.item_data_manager, log_callback = log_message)
+        self.transaction_queue = TransactionQueue(self.item_processor, log_callback = log_message)
+        self.transaction_queue.start()
+
+        self.network_manager = None
+        if network_config:
+            from network_manager import NetworkManager
+            self.network_manager = NetworkManager(item_data_manager = self.item_data_manager, log_callback = log_message, **network_config)
+        self.registry_publisher = None
+        if publish:
+            from registry_publisher import RegistryPublisher
+            if not store_name:
+                store_name = self.network_manager.store_name
+            self.registry_publisher = RegistryPublisher(store_name = store_name, log_callback = log_message)
+            self.registry_publisher.start()
+        self.lane_manager = None
+        if lane_sources:
+            from lane_manager import LaneManager
+            self.lane_manager = LaneManager(self.item_data_manager, self.transaction_queue, lane_sources,
+                                            decode_workers = decode_workers, idle_finish = lane_idle_finish,
+                                            log_callback = log_message)
+            self.lane_manager.start()
+
+        self.last_hourly_check_time = time.time()
+        self.last_daily_check_time = time.time()
+        self.processing_lock = None # asyncio.Lock, created on the running loop
+        self.stopping = None
+
+    async def run(self):
+        """ Serves until stop() or SIGINT/SIGTERM, then shuts the sync and publisher threads down. """
+        self.processing_lock = asyncio.Lock()
+        self.stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass # Windows / not the main thread: rely on KeyboardInterrupt
+
+        tasks = [asyncio.create_task(self._periodic(self.hourly_interval, self.run_hourly_tasks)),
+                 asyncio.create_task(self._periodic(self.daily_interval, self.run_daily_tasks))]
+        server = None
+        if self.http_address:
+            host, port = self.http_address.rsplit(":", 1)
+            server = await asyncio.start_server(self._handle_http, host, int(port))
+            log_message(f"Transaction API listening on http://{host}:{server.sockets[0].getsockname()[1]}", "info")
+        if self.replay_path:
+            tasks.append(asyncio.create_task(self._replay()))
+
+        try:
+            await self.stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if server:
+                server.close()
+                await server.wait_closed()
+            self.shutdown()
+
+    def stop(self):
+        self.stopping.set()
+
+    def shutdown(self):
+        if self.lane_manager:
+            self.lane_manager.release()
+        self.transaction_queue.stop()
+        if self.network_manager:
+            self.network_manager.shutdown()
+        if self.registry_publisher:
+            self.registry_publisher.stop()
+        self.item_data_manager.save_items_to_json()
+        log_message("Headless service stopped.", "info")
+
+    async def _periodic(self, interval, task):
+        while True:
+            await asyncio.sleep(interval)
+            async with self.processing_lock:
+                await asyncio.to_thread(task)
+
+    def run_hourly_tasks(self):
+        """ Sends the prices changed since the last run to the other stores (and the registry). """
+        prices = self.item_data_manager.get_recently_updated_items_for_sync(self.last_hourly_check_time)
+        if self.network_manager:
+            self.network_manager.send_prices_to_other_store(self.last_hourly_check_time, prices)
+        if self.registry_publisher:
+            self.registry_publisher.publish(prices)
+        self.last_hourly_check_time = time.time()
+
+    def run_daily_tasks(self):
+        self.item_processor.decay_prices(self.last_daily_check_time)
+        self.last_daily_check_time = time.time()
+
+    async def process_transaction(self, barcodes):
+        """ Queues one transaction (group-committed with any that arrive alongside it) and returns its saved prices. """
+        return await asyncio.wrap_future(self.transaction_queue.submit(str(barcode) for barcode in barcodes))
+
+    async def _replay(self):
+        count = 0
+        with open(self.replay_path, "r") as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    transaction = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"[HeadlessService] Skipping line {line_number} of {self.replay_path}: {e}")
+                    continue
+                barcodes = transaction.get("barcodes", []) if isinstance(transaction, dict) else transaction
+                try:
+                    await self.process_transaction(barcodes)
+                except NotDurableError as e:
+                    print(f"[HeadlessService] Line {line_number}: {e}")
+                count += 1
+                if self.replay_delay:
+                    await asyncio.sleep(self.replay_delay)
+        log_message(f"Replayed {count} transactions from {self.replay_path}.", "process")
+        if self.exit_after_replay:
+            self.stop()
+
+    async def _handle_http(self, reader, writer):
+        """ Minimal HTTP/1.1 handler for the transaction API: one request per connection. """
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > MAX_REQUEST_BYTES:
+                status, body = 413, {"error": "request too large"}
+            else:
+                payload = await reader.readexactly(length) if length else b""
+                status, body = await self._route(request_line, payload)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, body = 400, {"error": str(e)}
+
+        data = json.dumps(body).encode("utf-8")
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+                  500: "Internal Server Error", 503: "Service Unavailable"}.get(status, "")
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, request_line, payload):
+        if len(request_line) < 2:
+            return 400, {"error": "malformed request line"}
+        method, path = request_line[0], request_line[1].split("?", 1)[0]
+        if path == "/health":
+            return 200, {"items": len(self.item_data_manager.items), "store_id": self.item_data_manager.store_id,
+                         "transactions": self.transaction_queue.stats(),
+                         "lanes": len(self.lane_manager.lanes) if self.lane_manager else 0}
+        if path == "/transactions":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                barcodes = json.loads(payload or b"{}").get("barcodes")
+            except (json.JSONDecodeError, AttributeError):
+                barcodes = None
+            if not isinstance(barcodes, list) or not barcodes:
+                return 400, {"error": "body must be {\"barcodes\": [...]} with at least one barcode"}
+            try:
+                prices = await self.process_transaction(barcodes)
+            except NotDurableError as e:
+                return 202, {"processed": len(barcodes), "prices": e.prices, "durable": False, "warning": str(e)}
+            except IOError as e:
+                return 503, {"error": str(e)}
+            except Exception as e:
+                return 500, {"error": str(e)}
+            return 200, {"processed": len(barcodes), "prices": prices}
+        if path.startswith("/lanes"):
+            return await self._route_lanes(method, path)
+        if path.startswith("/items/"):
+            barcode = path[len("/items/"):]
+            item = self.item_data_manager.items.get(barcode)
+            if item is None:
+                return 404, {"error": f"item {barcode} not found"}
+            return 200, {"item_name": item.get("item_name"), "current_price": item.get("current_price"),
+                         "total_bought": item.get("total_bought", 0)}
+        return 404, {"error": f"no route for {path}"}
+
+    async def _route_lanes(self, method, path):
+        if not self.lane_manager:
+            return 404, {"error": "no lanes; start with --lanes"}
+        parts = path.strip("/").split("/")
+        if len(parts) == 1:
+            return 200, {str(lane_id): stats for lane_id, stats in self.lane_manager.stats().items()}
+        if len(parts) != 3 or parts[2] != "finish" or not parts[1].isdigit() or int(parts[1]) not in self.lane_manager.lanes:
+            return 404, {"error": f"no route for {path}"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        future = self.lane_manager.finish(int(parts[1]))
+        if future is None:
+            return 200, {"prices": {}}
+        try:
+            prices = await asyncio.wrap_future(future)
+        except NotDurableError as e:
+            return 202, {"prices": e.prices, "durable": False, "warning": str(e)}
+        except IOError as e:
+            return 503, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+        return 200, {"prices": prices}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", default = JSON_FILE, help = "Item catalog (.json, or .db for SQLite)")
+    parser.add_argument("--stores", default = STORES_CONFIG, help = "Store mesh config; price sync is off if the file does not exist")
+    parser.add_argument("--http", default = HTTP_ADDRESS, help = "host:port for the transaction API; 'off' to disable")
+    parser.add_argument("--replay", help = "File of transactions to process, one JSON list of barcodes per line")
+    parser.add_argument("--replay-delay", type = float, default = 0.0, help = "Seconds between replayed transactions")
+    parser.add_argument("--exit-after-replay", action = "store_true")
+    parser.add_argument("--publish", action = "store_true", help = "Publish changed prices to the store registry")
+    parser.add_argument("--store-name", help = "Name in the store registry (default: the stores.json name); required for --publish without stores.json")
+    parser.add_argument("--hourly", type = float, default = HOURLY_INTERVAL_SIMULATED, help = "Seconds per simulated hour (price sync)")
+    parser.add_argument("--metrics", default = os.environ.get(metrics.METRICS_ENV), help = "Serve /metrics on this port or host:port")
+    parser.add_argument("--daily", type = float, default = DAILY_INTERVAL_SIMULATED, help = "Seconds per simulated day (price decay)")
+    parser.add_argument("--lanes", nargs = "+", help = "Capture source per checkout lane: camera index, video file or image directory")
+    parser.add_argument("--decode-workers", type = int, help = "Barcode decode processes shared by all lanes (default: CPU count)")
+    parser.add_argument("--lane-idle-finish", type = float, help = "Finish a lane's transaction after this many seconds without a scan")
+    args = parser.parse_args()
+
+    if args.metrics:
+        host, _, port = args.metrics.rpartition(":")
+        metrics.serve(int(port), host or metrics.DEFAULT_HOST)
+
+    network_config = None
+    if os.path.exists(args.stores):
+        from network_manager import load_topology
+        network_config = load_topology(args.stores)
+    else:
+        log_message(f"{args.stores} not found, running without price sync.", "info")
+        if args.publish and not args.store_name:
+            parser.error("--publish without a stores.json needs --store-name")
+
+    service = HeadlessService(filepath = args.items, network_config = network_config,
+                              http_address = None if args.http == "off" else args.http,
+                              replay_path = args.replay, replay_delay = args.replay_delay,
+                              exit_after_replay = args.exit_after_replay, publish = args.publish,
+                              hourly_interval = args.hourly, daily_interval = args.daily,
+                              lane_sources = args.lanes, decode_workers = args.decode_workers,
+                              lane_idle_finish = args.lane_idle_finish, store_name = args.store_name)
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+import bisect
+import math
+import sys
+import threading
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime
+from functools import lru_cache
+
+TIMESTAMP_FIELDS = ("last_purchased", "last_updated")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S" # Format of timestamps in items.json files written before they became unix times
+
+# Fields stored column-wise, one array slot per row. Anything else (clock dicts, new fields, values of an
+# unexpected type) goes to a per-row dict that stays None for most items.
+FLOAT_FIELDS = ("base_price", "demand_price", "current_price", "last_purchased", "last_updated")
+INT_FIELDS = ("meter", "total_bought", "version")
+STRING_FIELDS = ("item_name", "series_id", "category")
+INT_ABSENT = -(2 ** 63) # Marks an unset int field; unset float fields are NaN
+_MISSING = object()
+
+@lru_cache(maxsize=65536)
+def _parse_timestamp(value):
+    return datetime.strptime(value, TIMESTAMP_FORMAT).timestamp()
+
+def to_epoch(value):
+    """ Unix time of a stored timestamp, accepting both numbers and the old string format. Raises ValueError. """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return _parse_timestamp(value)
+    return float(value)
+
+
+class ChangeIndex:
+    """
+    Answers "which items changed since time X" in O(changes) instead of scanning the catalog.
+    Every change (a new last_updated) gets the next sequence number; the log holds (time, sequence, barcode)
+    in time order and only the entry matching an item's latest sequence counts.
+    """
+    def __init__(self):
+        self.sequence = 0
+        self.latest = {} # barcode -> sequence of its newest change
+        self.log = []
+
+    def record(self, barcode, timestamp):
+        self.sequence += 1
+        self.latest[barcode] = self.sequence
+        entry = (timestamp, self.sequence, barcode)
+        if self.log and timestamp < self.log[-1][0]:
+            bisect.insort(self.log, entry) # Clock stepped back or a peer-supplied time; keep the log sorted
+        else:
+            self.log.append(entry)
+        if len(self.log) > 2 * len(self.latest) + 1024:
+            self.log = [entry for entry in self.log if self.latest.get(entry[2]) == entry[1]]
+
+    def seed(self, stamped):
+        """ Records (timestamp, barcode) pairs in one go, e.g. the stored last_updated values when a catalog is loaded. """
+        stamped.sort()
+        first = self.sequence + 1
+        entries = [(timestamp, sequence, barcode) for sequence, (timestamp, barcode) in enumerate(stamped, first)]
+        self.sequence += len(entries)
+        self.latest.update((barcode, sequence) for _, sequence, barcode in entries)
+        if self.log and entries and entries[0] < self.log[-1]:
+            self.log = sorted(self.log + entries)
+        else:
+            self.log.extend(entries)
+
+    def forget(self, barcode):
+        self.latest.pop(barcode, None)
+
+    def changed_since(self, since_timestamp):
+        start = bisect.bisect_left(self.log, (since_timestamp,))
+        return [barcode for _, sequence, barcode in self.log[start:] if self.latest.get(barcode) == sequence]
+
+
+class ItemRecord(MutableMapping):
+    """
+    Dict-like view of one item in a CompactCatalog. Reads and writes go straight to the catalog's columns;
+    assigning a field flags the item as dirty. Timestamps are stored as unix times and every new
+    last_updated is recorded in the change index. In-place mutation of a nested value (e.g. a clock dict)
+    must be followed by ItemDataManager.mark_dirty.
+    """
+    __slots__ = ("_catalog", "_barcode")
+
+    def __init__(self, catalog, barcode):
+        self._catalog = catalog
+        self._barcode = barcode
+
+    def _row(self):
+        return self._catalog.index[self._barcode] # KeyError once the item is deleted
+
+    def __getitem__(self, key):
+        value = self._catalog._get(self._row(), key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._catalog._get(self._row(), key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        return self._catalog._get(self._row(), key) is not _MISSING
+
+    def __setitem__(self, key, value):
+        if key in TIMESTAMP_FIELDS and isinstance(value, str):
+            value = to_epoch(value)
+        catalog = self._catalog
+        catalog._set(self._row(), key, value)
+        catalog.dirty.add(self._barcode)
+        if key == "last_updated" and value is not None:
+            catalog.changes.record(self._barcode, value)
+
+    def __delitem__(self, key):
+        if not self._catalog._delete(self._row(), key):
+            raise KeyError(key)
+        self._catalog.dirty.add(self._barcode)
+
+    def __iter__(self):
+        return iter(self._catalog._fields(self._row()))
+
+    def __len__(self):
+        return len(self._catalog._fields(self._row()))
+
+    def copy(self):
+        """ The item as a plain dict (one pass over the columns; used when items are serialized). """
+        return self._catalog._fields(self._row())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CompactCatalog(MutableMapping):
+    """
+    The barcode -> item mapping exposed as ItemDataManager.items, stored as columns: one float64 array per price
+    and timestamp field, one int64 array per counter, and lists of interned strings, with a barcode -> row index
+    on top. Items read as ItemRecord views, so callers use them like dicts. Assigning or deleting an item, or
+    assigning a field on one, records it in dirty/deleted so only changed items are persisted.
+
+    Items can also be left on disk ("cold", see WalItemStore.load_lazy). A cold item has a row holding only the
+    fields the store indexes (timestamps, total_bought, series_id, readable with peek) and is read in completely,
+    without being marked dirty, the first time it is looked up.
+    """
+    def __init__(self, items, dirty, deleted, changes, cold=None, read_cold=None, lock=None, on_load=None, on_delete=None):
+        """
+        :param cold: Columns of the items left on disk: {"barcode": [...], "offset": [...], "length": [...], field: [...]}
+                     for some of the catalog's fields (numeric columns as arrays with the catalog's typecodes).
+        :param read_cold: read_cold((offset, length)) returns the fields of a cold item.
+        :param lock: Lock held while a cold item is read in; defaults to a private one.
+        :param on_load: on_load(barcode, fields) is called with the plain dict of a cold item as read, before it is stored,
+                        so whatever it changes there is kept without the item being marked dirty.
+        :param on_delete: on_delete(barcode) is called after an item is deleted, e.g. to drop its purchase counts.
+        """
+        self.dirty = dirty
+        self.deleted = deleted
+        self.changes = changes
+        self.index = {}
+        self.barcodes = [] # row -> barcode, None for free rows
+        self.free_rows = []
+        self.floats = {name: array("d") for name in FLOAT_FIELDS}
+        self.ints = {name: array("q") for name in INT_FIELDS}
+        self.strings = {name: [] for name in STRING_FIELDS}
+        self.extras = [] # row -> {field: value} for everything not held in a column, or None
+        self.cold = set()
+        self.offsets = array("q") # row -> where a cold item is on disk
+        self.lengths = array("q")
+        self.read_cold = read_cold
+        self.lock = lock if lock else threading.RLock()
+        self.on_load = on_load
+        self.on_delete = on_delete
+
+        for barcode, fields in items.items():
+            self._load_row(barcode, fields)
+        if cold:
+            self._add_cold(cold)
+        # Seed the change index in time order from the stored last_updated values
+        last_updated = self.floats["last_updated"]
+        changes.seed([(last_updated[row], barcode) for barcode, row in self.index.items() if last_updated[row] == last_updated[row]])
+
+    # Row storage
+
+    def _new_row(self, barcode):
+        """ Allocates an empty row; the caller adds it to the index once its fields are set. """
+        barcode = sys.intern(barcode)
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.barcodes[row] = barcode
+        else:
+            row = len(self.barcodes)
+            self.barcodes.append(barcode)
+            for column in self.floats.values():
+                column.append(math.nan)
+            for column in self.ints.values():
+                column.append(INT_ABSENT)
+            for column in self.strings.values():
+                column.append(None)
+            self.extras.append(None)
+            self.offsets.append(0)
+            self.lengths.append(0)
+        return row
+
+    def _add_cold(self, cold):
+        """ Appends rows for the cold columns in bulk. """
+        count = len(cold["barcode"])
+        first = len(self.barcodes)
+        barcodes = [sys.intern(barcode) for barcode in cold["barcode"]]
+        self.barcodes.extend(barcodes)
+        for columns, empty in ((self.floats, array("d", [math.nan])), (self.ints, array("q", [INT_ABSENT]))):
+            for name, column in columns.items():
+                column.extend(cold[name] if name in cold else empty * count)
+        for name, column in self.strings.items():
+            column.extend([value if value is None else sys.intern(value) for value in cold[name]] if name in cold else [None] * count)
+        self.extras.extend([None] * count)
+        self.offsets.extend(cold["offset"])
+        self.lengths.extend(cold["length"])
+        self.index.update(zip(barcodes, range(first, first + count)))
+        self.cold.update(barcodes)
+
+    def _load_row(self, barcode, fields, row=None):
+        """ Stores fields as read from disk in a new row (or the given one), without marking it dirty. """
+        if row is None:
+            row = self._new_row(barcode)
+        for key, value in fields.items():
+            if key in TIMESTAMP_FIELDS and isinstance(value, str):
+                try:
+                    value = to_epoch(value)
+                except ValueError:
+                    print(f"[ItemDataManager] Warning: Could not parse '{key}' date for barcode {barcode}.")
+            self._set(row, key, value)
+        self.index[self.barcodes[row]] = row
+        return row
+
+    def _load_cold(self, barcode):
+        """ Reads a cold item's fields into its row. """
+        with self.lock:
+            if barcode not in self.cold:
+                return # Another thread read it in meanwhile
+            row = self.index[barcode]
+            fields = self.read_cold((self.offsets[row], self.lengths[row]))
+            if self.on_load:
+                self.on_load(barcode, fields)
+            self._clear_row(row)
+            self._load_row(barcode, fields, row)
+            self.cold.discard(barcode)
+
+    def load_all(self):
+        """ Reads in every cold item, for passes over the whole catalog that use the columns directly. """
+        with self.lock:
+            for barcode in list(self.cold):
+                self._load_cold(barcode)
+
+    def cold_location(self, barcode):
+        """ (offset, length) of an item left on disk, None once it has been read in. """
+        if barcode not in self.cold:
+            return None
+        row = self.index[barcode]
+        return self.offsets[row], self.lengths[row]
+
+    def relocate_cold(self, locations):
+        """ Points cold items at a rewritten snapshot: locations yields (barcode, offset, length); other barcodes are ignored. """
+        for barcode, offset, length in locations:
+            if barcode in self.cold:
+                row = self.index[barcode]
+                self.offsets[row] = offset
+                self.lengths[row] = length
+
+    def is_loaded(self, barcode):
+        return barcode in self.index and barcode not in self.cold
+
+    def peek(self, barcode, key, default=None):
+        """ A field of an item without reading it in if it is cold, when only its indexed fields are known. """
+        row = self.index.get(barcode)
+        if row is None:
+            return default
+        value = self._get(row, key)
+        return default if value is _MISSING else value
+
+    def _clear_row(self, row):
+        for column in self.floats.values():
+            column[row] = math.nan
+        for column in self.ints.values():
+            column[row] = INT_ABSENT
+        for column in self.strings.values():
+            column[row] = None
+        self.extras[row] = None
+
+    def _get(self, row, key):
+        if key in self.floats:
+            value = self.floats[key][row]
+            if value == value: # not NaN
+                return value
+        elif key in self.ints:
+            value = self.ints[key][row]
+            if value != INT_ABSENT:
+                return value
+        elif key in self.strings:
+            value = self.strings[key][row]
+            if value is not None:
+                return value
+        extras = self.extras[row]
+        if extras is not None and key in extras:
+            return extras[key]
+        return _MISSING
+
+    def _set(self, row, key, value):
+        """ Stores value in its column when it has the column's type, otherwise in the row's extras. """
+        if key in self.floats and isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+            self.floats[key][row] = value
+        elif key in self.ints and isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 < value < 2 ** 63:
+            self.ints[key][row] = value
+        elif key in self.strings and isinstance(value, str):
+            self.strings[key][row] = sys.intern(value)
+        else:
+            self._delete(row, key)
+            if self.extras[row] is None:
+                self.extras[row] = {}
+            self.extras[row][key] = value
+            return
+        extras = self.extras[row]
+        if extras is not None and key in extras:
+            self._delete_extra(row, key)
+
+    def _delete_extra(self, row, key):
+        extras = self.extras[row]
+        del extras[key]
+        if not extras:
+            self.extras[row] = None
+
+    def _delete(self, row, key):
+        """ Clears the field wherever it is stored. Returns whether it was set. """
+        found = False
+        if key in self.floats and self.floats[key][row] == self.floats[key][row]:
+            self.floats[key][row] = math.nan
+            found = True
+        elif key in self.ints and self.ints[key][row] != INT_ABSENT:
+            self.ints[key][row] = INT_ABSENT
+            found = True
+        elif key in self.strings and self.strings[key][row] is not None:
+            self.strings[key][row] = None
+            found = True
+        extras = self.extras[row]
+        if extras is not None and key in extras:
+            self._delete_extra(row, key)
+            found = True
+        return found
+
+    def _fields(self, row):
+        fields = {name: column[row] for name, column in self.strings.items() if column[row] is not None}
+        for name, column in self.floats.items():
+            value = column[row]
+            if value == value:
+                fields[name] = value
+        for name, column in self.ints.items():
+            value = column[row]
+            if value != INT_ABSENT:
+                fields[name] = value
+        if self.extras[row] is not None:
+            fields.update(self.extras[row])
+        return fields
+
+    def float_column(self, name):
+        """ The raw float64 array of a column, indexed by row (NaN where unset or on free rows); see row_barcodes. """
+        return self.floats[name]
+
+    def column_values(self, name):
+        """ {barcode: value} for every item with the column field set, read from the column (cold items included). """
+        column = self.floats[name] if name in self.floats else self.ints[name]
+        absent = INT_ABSENT if name in self.ints else None
+        return {barcode: column[row] for barcode, row in self.index.items() if column[row] != absent and column[row] == column[row]}
+
+    def row_barcodes(self):
+        """ row -> barcode list aligned with the column arrays; None marks a free row. """
+        return self.barcodes
+
+    # Mapping interface
+
+    def __getitem__(self, barcode):
+        if barcode in self.cold:
+            self._load_cold(barcode)
+        if barcode not in self.index:
+            raise KeyError(barcode)
+        return ItemRecord(self, barcode)
+
+    def get(self, barcode, default=None):
+        if barcode in self.cold:
+            self._load_cold(barcode)
+        return ItemRecord(self, barcode) if barcode in self.index else default
+
+    def __contains__(self, barcode):
+        return barcode in self.index
+
+    def __iter__(self):
+        return iter(self.index) # Reading a cold item in fills its existing row, so lookups while iterating are safe
+
+    def __len__(self):
+        return len(self.index)
+
+    def __setitem__(self, barcode, fields):
+        fields = dict(fields) # Copy first: fields may be a view of the row being replaced
+        row = self.index.get(barcode)
+        if row is None:
+            row = self._new_row(barcode)
+        else:
+            self._clear_row(row)
+        for key, value in fields.items():
+            if key in TIMESTAMP_FIELDS and isinstance(value, str):
+                value = to_epoch(value)
+            self._set(row, key, value)
+        self.index[self.barcodes[row]] = row
+        self.cold.discard(barcode)
+        self.deleted.discard(barcode)
+        self.dirty.add(barcode)
+        if fields.get("last_updated") is not None:
+            self.changes.record(barcode, self._get(row, "last_updated"))
+
+    def __delitem__(self, barcode):
+        row = self.index.pop(barcode)
+        self._clear_row(row)
+        self.barcodes[row] = None
+        self.free_rows.append(row)
+        self.cold.discard(barcode)
+        self.dirty.discard(barcode)
+        self.deleted.add(barcode)
+        self.changes.forget(barcode)
+        if self.on_delete:
+            self.on_delete(barcode)
+
+    def pop(self, barcode, *default):
+        """ Removes the item and returns a plain dict copy of it (a view would outlive its row). """
+        if barcode not in self.index:
+            if default:
+                return default[0]
+            raise KeyError(barcode)
+        fields = self[barcode].copy()
+        del self[barcode]
+        return fields
+
+    def __repr__(self):
+        return f"CompactCatalog({len(self)} items, {len(self.cold)} on disk)"
@@ -1,18 +1,77 @@
 import json
-from datetime import datetime
-import requests
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
 
+import metrics
+import vector_clock
 from api_BLS import get_bls_data
+from item_catalog import ChangeIndex, CompactCatalog, to_epoch
+from item_store import make_item_store
+from price_history import HistoryStore, history_path_for
+from pricing_rules import PricingRules
+from purchase_tracker import PurchaseTracker
+
+HOT_WINDOW_SECONDS = 7 * 24 * 3600 # Items bought or updated this recently are read at startup, the rest on first lookup
+
+def store_id_path_for(catalog_path):
+    """ Default store id file next to the catalog: items.json -> items_store_id """
+    return os.path.splitext(catalog_path)[0] + "_store_id"
+
+def load_store_id(path):
+    """
+    This store's id in item vector clocks, read from path. On the first run one is generated from the host name
+    and a random suffix and saved there, so every store gets its own id and keeps it across restarts.
+    """
+    try:
+        with open(path, "r") as file:
+            store_id = file.read().strip()
+        if store_id:
+            return store_id
+    except FileNotFoundError:
+        pass
+    store_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+    try:
+        with open(path, "w") as file:
+            file.write(store_id + "\n")
+    except OSError as e:
+        print(f"[ItemDataManager] Could not save store id to {path}, it changes on restart: {e}")
+    return store_id
 
-BLS_WEIGHT = 0.30
-DEMAND_WEIGHT = 0.70
 
 class ItemDataManager:
-    def __init__(self, filepath="items.json", log_callback=None):
+    def __init__(self, filepath="items.json", log_callback=None, store=None, history_path=None, pricing_rules=None,
+                 hot_window=HOT_WINDOW_SECONDS, store_id=None):
+        """
+        :param filepath: Catalog location. A .db/.sqlite path selects the SQLite backend.
+        :param store: Optional storage backend (see item_store.py); overrides the one picked from filepath.
+        :param history_path: Price history database (see price_history.py). Defaults to <catalog name>_history.db.
+        :param pricing_rules: PricingRules for price blending, steps and decay; defaults to pricing_rules.json if present.
+        :param hot_window: With a store that supports load_lazy, only items bought or updated within this many seconds
+                           are read at startup; None reads everything.
+        :param store_id: This store's id in item vector clocks. Defaults to the one kept in <catalog name>_store_id
+                         (see load_store_id); NetworkManager replaces it with the id configured for the sync mesh.
+        """
         self.get_bls_data = get_bls_data
 
         self.filepath = filepath
-        self.items = {}
+        self.store_id = store_id if store_id else load_store_id(store_id_path_for(filepath))
+        self.store = store if store else make_item_store(filepath)
+        self.pricing_rules = pricing_rules if pricing_rules else PricingRules.load()
+        self.hot_window = hot_window
+        self._bls_prices = {} # series_id -> BLS price not yet applied to items still on disk
+        self.history = HistoryStore(history_path if history_path else history_path_for(filepath))
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()
+        self._dirty = set()
+        self._deleted = set()
+        self._changes = ChangeIndex()
+        self.items = CompactCatalog({}, self._dirty, self._deleted, self._changes)
+        self._subscribers = []
+        self.purchases = PurchaseTracker()
         self.log_callback = log_callback if log_callback else self._default_log
         self._load_items()
         self.load_bls_data()
@@ -22,41 +81,200 @@ class ItemDataManager:
         print(f"[{log_type.upper()}] {message}")
 
     def _load_items(self):
-        """ Loads item data from the JSON file. """
+        """
+        Loads item data from the storage backend. Stores with load_lazy (items.json + WAL) only read the recently
+        active items here; the others join self.items as they are looked up (see CompactCatalog).
+        """
+        loaded, cold = {}, None
         try:
-            with open(self.filepath, "r") as file:
-                self.items = json.load(file)
-                print(f"[ItemDataManager] Successfully loaded items from {self.filepath}.")
+            if self.hot_window is not None and hasattr(self.store, "load_lazy"):
+                loaded, cold = self.store.load_lazy(time.time() - self.hot_window)
+            else:
+                loaded = self.store.load()
+            print(f"[ItemDataManager] Successfully loaded items from {self.filepath}.")
+            if cold and cold["barcode"]:
+                print(f"[ItemDataManager] {len(cold['barcode'])} items not active in the last {self.hot_window // 3600} hours stay on disk until looked up.")
         except FileNotFoundError:
             print(f"[ItemDataManager] File {self.filepath} not found. Starting with empty items.")
-            self.items = {}
         except json.JSONDecodeError:
             print(f"[ItemDataManager] Error decoding JSON from file {self.filepath}. Starting with empty items.")
-            self.items = {}
+            loaded, cold = {}, None
+        self._migrate_history(loaded)
+        self._dirty.clear()
+        self._deleted.clear()
+        self._changes = ChangeIndex()
+        self.items = CompactCatalog(loaded, self._dirty, self._deleted, self._changes, cold=cold,
+                                    read_cold=getattr(self.store, "read_record", None), lock=self.lock, on_load=self._on_item_loaded,
+                                    on_delete=self.purchases.forget)
+        self.purchases.load(self.items.column_values("total_bought"))
+
+    def _on_item_loaded(self, barcode, fields):
+        """
+        Does for an item read in after startup what startup did for the others: history migration and the BLS base price.
+        Both change the fields as read, before they reach the catalog, so looking an item up does not mark it dirty;
+        the stored record catches up with the item's next write or the next compaction.
+        """
+        self._migrate_history({barcode: fields})
+        price = self._bls_prices.get(fields.get("series_id"))
+        if price is not None:
+            fields["base_price"] = price
+            fields["current_price"] = self.pricing_rules.rule_for(fields).blend(price, fields["demand_price"])
+
+    def _migrate_history(self, items):
+        """
+        Moves "history" lists left in item records by older versions into the history store.
+        :param items: {barcode: fields} as read from disk; the lists are removed from the fields.
+        """
+        migrated = 0
+        for barcode, fields in items.items():
+            history = fields.pop("history", None)
+            if history is None:
+                continue
+            if not self.history.has_history(barcode):
+                try:
+                    timestamp = to_epoch(fields.get("last_updated")) or time.time()
+                except ValueError:
+                    timestamp = time.time()
+                for price in history:
+                    self.history.append(barcode, price, timestamp)
+            migrated += 1
+        if migrated:
+            print(f"[ItemDataManager] Moved the price history of {migrated} items to {self.history.filepath}.")
+
+    def mark_dirty(self, barcode):
+        """ Flags an item for the next save after its nested data was mutated in place. """
+        self._dirty.add(barcode)
+
+    def record_local_change(self, barcode):
+        """ Advances this store's entry in the item's vector clock after a local price change. """
+        item = self.items[barcode]
+        item["clock"] = vector_clock.increment(item.get("clock", {}), self.store_id)
+        item["version"] = int(time.time())
+
+    def record_purchase(self, barcode, quantity):
+        """ Adds a sale to the item's total_bought and to the best-seller counters. """
+        with self.lock:
+            self.items[barcode]["total_bought"] = self.purchases.record(barcode, quantity)
+
+    def top_sellers(self, n=None, window=None):
+        """
+        The n most bought items as [(barcode, count)], best first, without sorting the catalog.
+        :param window: Name of a sliding window added with purchases.add_window (e.g. "hour"); None for all-time totals.
+        """
+        with self.lock:
+            return self.purchases.top(n, window)
+
+    def checkpoint(self, barcodes):
+        """
+        What a transaction over barcodes may change: the items' fields and dirty flags, their purchase counts and the
+        price history buffer. Pass it to rollback to undo a transaction that failed halfway. Call with the lock held.
+        """
+        barcodes = {barcode for barcode in barcodes if barcode in self.items}
+        return {
+            "items": {barcode: self.items[barcode].copy() for barcode in barcodes},
+            "dirty": barcodes & self._dirty,
+            "purchases": {barcode: self.purchases.total(barcode) for barcode in barcodes},
+            "history": self.history.mark()
+        }
+
+    def rollback(self, checkpoint):
+        """ Restores the state saved by checkpoint. Call with the lock held, before anything else changes the items. """
+        for barcode, fields in checkpoint["items"].items():
+            self.items[barcode] = fields
+            if barcode not in checkpoint["dirty"]:
+                self._dirty.discard(barcode)
+        for barcode, count in checkpoint["purchases"].items():
+            added = self.purchases.total(barcode) - count
+            if added > 0:
+                self.purchases.undo(barcode, added)
+        self.history.discard_since(checkpoint["history"])
+
+    def record_price(self, barcode, price):
+        """ Appends a price to the item's history (written with the next save). """
+        self.history.append(barcode, price)
+
+    def price_history(self, barcode, n=10):
+        """ The item's newest n prices, oldest first. Older prices are kept as hourly rollups, see history.rollups. """
+        return self.history.recent(barcode, n)
 
     def load_bls_data(self):
         """ Loads the average pricing data from the Beureau of Labor Statistics (BLS) API. """
         print(f"[ItemDataManager] Loading BLS data...")
-        series_ids = []
-        for barcode in self.items:
-            series_ids.append(self.items[barcode].get("series_id"))
+        barcodes = list(self.items)
+        series_ids = [self.items.peek(barcode, "series_id") for barcode in barcodes]
 
         avg_prices = self.get_bls_data(series_ids)
 
-        for index, barcode in enumerate(self.items):
-            self.items[barcode]["base_price"] = avg_prices[index]
-            self.items[barcode]["current_price"] = (self.items[barcode]["base_price"] * BLS_WEIGHT) + (self.items[barcode]["demand_price"] * DEMAND_WEIGHT)
+        self._bls_prices = {}
+        for index, barcode in enumerate(barcodes):
+            if avg_prices[index] is None:
+                continue # Keep the last known base price when BLS has nothing for this series
+            if not self.items.is_loaded(barcode):
+                self._bls_prices[series_ids[index]] = avg_prices[index] # Applied when the item is read in
+                continue
+            item = self.items[barcode]
+            item["base_price"] = avg_prices[index]
+            item["current_price"] = self.pricing_rules.rule_for(item).blend(item["base_price"], item["demand_price"])
 
         self.save_items_to_json()
 
+    @metrics.timed("save_items_seconds", "Persisting changed items and price history")
     def save_items_to_json(self):
-        """ Saves the current item data to the JSON file. """
-        try:
-            with open(self.filepath, "w") as file:
-                json.dump(self.items, file, indent=4)
-            print(f"[ItemDataManager] Successfully saved updated items to {self.filepath}.")
-        except IOError as e:
-            print(f"[ItemDataManager] Error writing to file {self.filepath}: {e}")
+        """
+        Persists the items changed since the last save as one atomic commit to the storage backend.
+        The changed records are copied under the lock and written after releasing it, so readers never wait on the disk;
+        saves are serialised by save_lock, which callers must not take while holding the lock.
+        Returns False if the write failed (the changes stay pending for the next save), True otherwise.
+        """
+        with self.save_lock:
+            with self.lock:
+                try:
+                    self.history.flush()
+                except sqlite3.Error as e:
+                    print(f"[ItemDataManager] Error writing price history to {self.history.filepath}: {e}")
+                if not self._dirty and not self._deleted:
+                    return True
+                records = {barcode: self.items[barcode].copy() for barcode in self._dirty if barcode in self.items}
+                deleted = set(self._deleted)
+                self._dirty.clear()
+                self._deleted.clear()
+            try:
+                self.store.commit(records, set(records), deleted, compact = False)
+            except (IOError, sqlite3.Error) as e:
+                print(f"[ItemDataManager] Error writing to file {self.filepath}: {e}")
+                with self.lock:
+                    self._dirty.update(barcode for barcode in records if barcode in self.items)
+                    self._deleted.update(barcode for barcode in deleted if barcode not in self.items)
+                return False
+            if self.store.needs_compaction():
+                with self.lock:
+                    try:
+                        self.store.compact(self.items)
+                    except IOError as e:
+                        print(f"[ItemDataManager] Error compacting {self.filepath}: {e}")
+        changed = set(records) | deleted
+        metrics.count("items_saved_total", len(changed), "Item records written or deleted")
+        print(f"[ItemDataManager] Successfully saved {len(changed)} updated items to {self.filepath}.")
+        self._notify(changed)
+        return True
+
+    def subscribe(self, callback):
+        """
+        Registers callback(barcodes) to be called with the set of changed (or deleted) barcodes after each save.
+        Callbacks run on the saving thread, which may be the network receiver, so GUI code must hand off to its own thread.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self, barcodes):
+        for callback in list(self._subscribers):
+            try:
+                callback(barcodes)
+            except Exception as e:
+                print(f"[ItemDataManager] Error in change subscriber {callback}: {e}")
 
     def get_item_details(self, barcode):
         """ Fetches the item details (name and current_price) from the items dictionary using the barcode. """
@@ -77,50 +295,53 @@ class ItemDataManager:
     def get_recently_updated_items_for_sync(self, since_timestamp):
         """
         Returns a dictionary of items that have been updated since the given timestamp,
-        formatted for syncing (item_id: {"current_price": price}).
+        formatted for syncing (item_id: {"current_price": price, "version": last_updated unix time}).
+        Looks the items up in the change index, so the cost follows the number of changes, not the catalog size.
         :param since_timestamp: A float timestamp (e.g., from time.time()) representing the last sync time.
         """
-        print(f"[ItemDataManager] Sending items to PythonAnywhere...")
-        for index, (item_id, info) in enumerate(self.items.items()):
-            try:
-                current_price = info["current_price"]
-                response = requests.get("https://aloft.pythonanywhere.com/submit", params={
-                    "insertStore": "1",
-                    "searchStore": "0",
-                    "storename": "STORE2",
-                    "storeIP": "2.2.2",
-                    "storeCo": "USA",
-                    "itemname": f"{item_id} : {current_price}",
-                    "password": "password"
-                })
-                response.raise_for_status()
-            except requests.RequestException as e:
-                print(f"Error submitting item {index} to Flask")
-            
-        recently_updated_prices = {}
-        for item_id, info in self.items.items():
-            last_updated_str = info.get("last_updated")
-            if last_updated_str:
-                try:
-                    last_updated_dt = datetime.strptime(last_updated_str, "%Y-%m-%d %H:%M:%S")
-                    last_updated_unix = last_updated_dt.timestamp()
+        with self.lock:
+            return {item_id: self._sync_entry(self.items[item_id]) for item_id in self._changes.changed_since(since_timestamp)}
 
-                    if last_updated_unix >= since_timestamp:
-                        recently_updated_prices[item_id] = {"current_price": info.get("current_price")}
-                except ValueError:
-                    print(f"[ItemDataManager] Warning: Could not parse 'last_updated' date for barcode {item_id}.")
-        return recently_updated_prices
+    def change_sequence(self, barcode):
+        """ Sequence number of the item's latest change (higher is newer), or None if it has never changed. """
+        return self._changes.latest.get(barcode)
+
+    def _sync_entry(self, info):
+        """
+        The {"current_price", "version", "clock"} form of an item used on the wire and for merges.
+        "version" is when the current price was written (by this store or the peer it came from).
+        """
+        version = info.get("version")
+        if version is None:
+            try:
+                version = to_epoch(info.get("last_updated")) or 0
+            except ValueError:
+                version = 0
+        entry = {"current_price": info.get("current_price"), "version": int(version)}
+        if info.get("clock"):
+            entry["clock"] = dict(info["clock"])
+        return entry
 
     def update_prices_from_sync(self, synced_prices):
-        """ Updates local item prices based on received synced prices. """
+        """
+        Updates local item prices based on received synced prices. Each item keeps the side whose
+        vector clock is newer (see vector_clock.resolve), so applying the same update twice is a no-op.
+        """
         updated_count = 0
-        for barcode, data in synced_prices.items():
-            if barcode in self.items and "current_price" in data:
-                if data["current_price"] > self.items[barcode]["current_price"]:
-                    self.items[barcode]["current_price"] = data["current_price"]
-                    updated_count += 1
-            elif barcode not in self.items:
-                print(f"[ItemDataManager] New item {barcode} is not in local data.")
+        with self.lock:
+            for barcode, data in synced_prices.items():
+                if barcode in self.items and "current_price" in data:
+                    item = self.items[barcode]
+                    take_remote, clock = vector_clock.resolve(self._sync_entry(item), data)
+                    if take_remote:
+                        item["current_price"] = data["current_price"]
+                        if "version" in data:
+                            item["version"] = data["version"]
+                        updated_count += 1
+                    if clock and clock != item.get("clock", {}):
+                        item["clock"] = clock
+                elif barcode not in self.items:
+                    print(f"[ItemDataManager] New item {barcode} is not in local data.")
         if updated_count > 0:
             self.save_items_to_json()
             print(f"[ItemDataManager] Updated {updated_count} prices from sync.")
@@ -0,0 +1,511 @@
+import codecs
+import json
+import math
+import mmap
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+from item_catalog import INT_ABSENT, to_epoch
+
+WAL_SUFFIX = ".wal"
+INDEX_SUFFIX = ".idx"
+INDEX_FORMAT = 1
+# Fields copied into the offset index so a loader can pick, rank and price items without parsing them
+INDEX_TIMESTAMPS = ("last_purchased", "last_updated") # float64, NaN when unset
+INDEX_COUNTS = ("total_bought",) # int64, INT_ABSENT when unset
+INDEX_STRINGS = ("series_id",)
+COMPACT_MIN_BYTES = 1024 * 1024 # Never compact a log smaller than this
+SCAN_CHUNK_BYTES = 1024 * 1024
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+def _encode_mapping(value):
+    """ json default hook: catalogs and item records (see item_catalog.py) are mappings but not dicts. """
+    if isinstance(value, Mapping):
+        return value.copy() if hasattr(value, "copy") else dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _keep_mode(tmp_path, *originals):
+    """ mkstemp creates files only the owner can read; gives the temp file the mode of the first original that exists. """
+    for original in originals:
+        try:
+            mode = os.stat(original).st_mode
+        except FileNotFoundError:
+            continue
+        os.chmod(tmp_path, mode & 0o7777)
+        return
+
+def atomic_write_json(filepath, data, indent=4):
+    """ Writes data to filepath through a temp file + rename so readers never see a half-written file. """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(json.dumps(data, indent=indent, default=_encode_mapping)) # dumps, unlike dump, can use the C encoder
+            file.flush()
+            os.fsync(file.fileno())
+        _keep_mode(tmp_path, filepath)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_snapshot(filepath, items, raw_record = None):
+    """
+    Writes items as a JSON snapshot with one item per line (temp file + rename, like atomic_write_json),
+    then the offset index sidecar filepath + ".idx" that lets WalItemStore.load_lazy leave items on disk.
+    :param raw_record: raw_record(barcode) returns (JSON bytes, indexed fields) of an item to copy as is rather than
+                       read from items, or None. WalItemStore.compact uses it for the items still on disk.
+    Returns the _OffsetIndex written.
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    index = _OffsetIndex()
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(b"{\n")
+            offset = 2
+            for position, barcode in enumerate(items):
+                raw = raw_record(barcode) if raw_record else None
+                if raw is None:
+                    fields = items[barcode].copy()
+                    record = json.dumps(fields, default=_encode_mapping).encode("ascii") # ensure_ascii: byte offsets = character offsets
+                else:
+                    record, fields = raw
+                prefix = (b",\n" if position else b"") + json.dumps(barcode).encode("ascii") + b": "
+                file.write(prefix)
+                file.write(record)
+                offset += len(prefix)
+                index.add(barcode, offset, len(record), fields)
+                offset += len(record)
+            file.write(b"\n}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        _keep_mode(tmp_path, filepath)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    index.write(filepath)
+    return index
+
+
+class _OffsetIndex:
+    """
+    Where each item of a snapshot starts and how long it is, plus its INDEX_* fields, as columns.
+    The sidecar holds a JSON header line, the barcodes and string fields as JSON lines, then the numeric
+    columns as raw arrays, so reading it back costs a few bulk reads rather than a parse per item.
+    """
+    def __init__(self):
+        self.barcodes = []
+        self.offsets = array("q")
+        self.lengths = array("q")
+        self.columns = {name: array("d") for name in INDEX_TIMESTAMPS}
+        self.columns.update((name, array("q")) for name in INDEX_COUNTS)
+        self.columns.update((name, []) for name in INDEX_STRINGS)
+
+    def add(self, barcode, offset, length, fields):
+        self.barcodes.append(barcode)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        for name in INDEX_TIMESTAMPS:
+            try:
+                value = to_epoch(fields.get(name))
+            except (TypeError, ValueError):
+                value = None
+            self.columns[name].append(math.nan if value is None else value)
+        for name in INDEX_COUNTS:
+            value = fields.get(name)
+            self.columns[name].append(value if isinstance(value, int) and not isinstance(value, bool) else INT_ABSENT)
+        for name in INDEX_STRINGS:
+            value = fields.get(name)
+            self.columns[name].append(value if isinstance(value, str) else None)
+
+    def _numeric(self):
+        return [self.offsets, self.lengths] + [self.columns[name] for name in INDEX_TIMESTAMPS + INDEX_COUNTS]
+
+    def write(self, filepath):
+        """ Writes the sidecar for the snapshot now at filepath; its size and mtime tie the two together. """
+        stat = os.stat(filepath)
+        header = {"format": INDEX_FORMAT, "byteorder": sys.byteorder, "count": len(self.barcodes),
+                  "fields": INDEX_TIMESTAMPS + INDEX_COUNTS + INDEX_STRINGS,
+                  "snapshot_size": stat.st_size, "snapshot_mtime_ns": stat.st_mtime_ns}
+        directory = os.path.dirname(os.path.abspath(filepath))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".idx", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(json.dumps(header).encode("ascii") + b"\n")
+                file.write(json.dumps(self.barcodes).encode("ascii") + b"\n")
+                for name in INDEX_STRINGS:
+                    file.write(json.dumps(self.columns[name]).encode("ascii") + b"\n")
+                for column in self._numeric():
+                    column.tofile(file)
+            _keep_mode(tmp_path, filepath + INDEX_SUFFIX, filepath)
+            os.replace(tmp_path, filepath + INDEX_SUFFIX)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def read(cls, filepath):
+        """ The sidecar of the snapshot at filepath, or None if it is missing, unreadable or does not match the snapshot. """
+        try:
+            stat = os.stat(filepath)
+            with open(filepath + INDEX_SUFFIX, "rb") as file:
+                header = json.loads(file.readline())
+                if (header.get("format") != INDEX_FORMAT or header.get("byteorder") != sys.byteorder
+                        or header.get("fields") != list(INDEX_TIMESTAMPS + INDEX_COUNTS + INDEX_STRINGS)
+                        or header.get("snapshot_size") != stat.st_size or header.get("snapshot_mtime_ns") != stat.st_mtime_ns):
+                    return None
+                index = cls()
+                index.barcodes = json.loads(file.readline())
+                for name in INDEX_STRINGS:
+                    index.columns[name] = json.loads(file.readline())
+                for column in index._numeric():
+                    column.fromfile(file, header["count"])
+        except (OSError, EOFError, ValueError):
+            return None # ValueError covers json.JSONDecodeError
+        return index
+
+    def split(self, is_hot, skip):
+        """
+        Splits the index rows into the positions is_hot marks (a bool array) and the others, leaving out barcodes in skip.
+        Returns (hot positions, cold columns) with the cold columns in the form CompactCatalog takes.
+        """
+        if skip:
+            is_hot = is_hot | np.fromiter((barcode in skip for barcode in self.barcodes), dtype=bool, count=len(self.barcodes))
+        cold_rows = np.flatnonzero(~is_hot)
+        cold_list = cold_rows.tolist()
+        cold = {"barcode": [self.barcodes[row] for row in cold_list]}
+        for name, column in [("offset", self.offsets), ("length", self.lengths)] + [(name, self.columns[name]) for name in INDEX_TIMESTAMPS + INDEX_COUNTS]:
+            cold[name] = array(column.typecode, np.frombuffer(column, dtype=np.float64 if column.typecode == "d" else np.int64)[cold_rows].tobytes())
+        for name in INDEX_STRINGS:
+            cold[name] = [self.columns[name][row] for row in cold_list]
+        hot = [row for row in np.flatnonzero(is_hot).tolist() if self.barcodes[row] not in skip]
+        return hot, cold
+
+    def recent(self, since):
+        """ Bool array: rows bought or updated at or after since. """
+        recent = np.zeros(len(self.barcodes), dtype=bool)
+        for name in INDEX_TIMESTAMPS:
+            recent |= np.frombuffer(self.columns[name], dtype=np.float64) >= since # NaN compares False
+        return recent
+
+
+class _SnapshotScanner:
+    def __init__(self, file, chunk_size):
+        """ Incremental reader of one JSON object, a value at a time, over a binary file. """
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.base = 0 # File offset of text[0]
+        self.pos = 0
+        self.eof = False
+        self.ascii_only = True # Character offsets are byte offsets only while no multi-byte character has been read
+
+    def _read(self):
+        if self.eof:
+            return False
+        if self.pos > self.chunk_size:
+            self.base += self.pos
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        chunk = self.file.read(self.chunk_size)
+        self.eof = not chunk
+        self.ascii_only = self.ascii_only and chunk.isascii()
+        self.text += self.decoder.decode(chunk, final=self.eof)
+        return not self.eof
+
+    def peek(self):
+        """ Skips whitespace and returns the next character ("" at the end of the file). """
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._read():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.text, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """ Parses the next JSON value. Returns (value, start, end) with file offsets. """
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.pos)
+                if end < len(self.text) or self.eof: # A number at the end of the buffer may continue in the next chunk
+                    break
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+        start = self.base + self.pos
+        self.pos = end
+        return value, start, self.base + end
+
+def scan_snapshot(filepath, chunk_size = SCAN_CHUNK_BYTES):
+    """
+    Parses a JSON snapshot one item at a time, without holding the whole file or its parsed form in memory.
+    Yields (barcode, fields, location) where location is the (offset, length) of the item's JSON in the file,
+    or None once the file turns out not to be plain ASCII. Raises json.JSONDecodeError like json.load.
+    """
+    with open(filepath, "rb") as file:
+        scanner = _SnapshotScanner(file, chunk_size)
+        scanner.expect("{")
+        if scanner.peek() == "}":
+            return
+        while True:
+            barcode, _, _ = scanner.value()
+            scanner.expect(":")
+            fields, start, end = scanner.value()
+            yield barcode, fields, (start, end - start) if scanner.ascii_only else None
+            if scanner.peek() == "}":
+                return
+            scanner.expect(",")
+
+def _read_snapshot(filepath):
+    with open(filepath, "r") as file:
+        return json.load(file)
+
+def _truncate_torn_tail(wal_path):
+    """
+    Cuts a half-written last line (crash mid-append) off the log, so the next batch starts on a line of its own
+    instead of being glued to the torn one. Returns the number of bytes removed.
+    """
+    try:
+        file = open(wal_path, "r+b")
+    except FileNotFoundError:
+        return 0
+    with file:
+        size = file.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(end - SCAN_CHUNK_BYTES, 0)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b"\n")
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            file.truncate(end)
+            file.flush()
+            os.fsync(file.fileno())
+    return size - end
+
+def _replay_wal(wal_path, items, touched = None):
+    """
+    Applies every complete batch in the write-ahead log to items, adding the barcodes written or deleted to touched.
+    A torn trailing line (crash mid-append) is ignored, so each batch is all-or-nothing.
+    """
+    if not os.path.exists(wal_path):
+        return 0
+    applied = 0
+    with open(wal_path, "r") as file:
+        for line in file:
+            try:
+                batch = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            items.update(batch.get("put", {}))
+            for barcode in batch.get("del", []):
+                items.pop(barcode, None)
+            if touched is not None:
+                touched.update(batch.get("put", {}))
+                touched.update(batch.get("del", []))
+            applied += 1
+    return applied
+
+
+class WalItemStore:
+    """
+    items.json stays the snapshot; each commit appends one line holding only the dirty
+    records to items.json.wal. The log is folded back into the snapshot once it grows
+    past the size of the snapshot itself.
+    """
+    def __init__(self, filepath, compact_min_bytes = COMPACT_MIN_BYTES):
+        self.filepath = filepath
+        self.wal_path = filepath + WAL_SUFFIX
+        self.compact_min_bytes = compact_min_bytes
+        self.snapshot_map = None # Read-only map of the snapshot load_lazy indexed, for read_record
+
+    def load(self):
+        try:
+            items = _read_snapshot(self.filepath)
+        except FileNotFoundError:
+            items = {}
+        self._repair_wal()
+        applied = _replay_wal(self.wal_path, items)
+        if applied:
+            print(f"[WalItemStore] Replayed {applied} logged batches from {self.wal_path}.")
+        return items
+
+    def load_lazy(self, hot_since):
+        """
+        Like load, but only parses the items bought or updated at or after hot_since (plus those in the log).
+        The others stay in the snapshot and are returned as columns: {"barcode": [...], "offset", "length",
+        and the INDEX_* fields}, to be read with read_record((offset, length)) when needed.
+        Uses the offset index sidecar; without a valid one the snapshot is scanned item by item (never parsed
+        whole) and the sidecar is written for the next start.
+        Returns (items, cold).
+        """
+        self.close()
+        items = {}
+        try:
+            with open(self.filepath, "rb") as file:
+                self.snapshot_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) # Stays valid after the file is replaced
+        except (FileNotFoundError, ValueError):
+            index = _OffsetIndex() # No snapshot, or an empty one: nothing to read but the log
+        else:
+            index = _OffsetIndex.read(self.filepath)
+            if index is None:
+                index, items = self._scan(hot_since)
+
+        touched = set()
+        self._repair_wal()
+        applied = _replay_wal(self.wal_path, items, touched)
+        if applied:
+            print(f"[WalItemStore] Replayed {applied} logged batches from {self.wal_path}.")
+        # Scanned items were parsed already; logged items (and deletions) supersede the snapshot
+        hot, cold = index.split(index.recent(hot_since), set(items) | touched)
+        for row in hot:
+            items[index.barcodes[row]] = self.read_record((index.offsets[row], index.lengths[row]))
+        return items, cold
+
+    def _scan(self, hot_since):
+        """ Builds the offset index by scanning the snapshot. Returns it with the recent items, which the scan has parsed anyway. """
+        index, items, indexable = _OffsetIndex(), {}, True
+        for barcode, fields, location in scan_snapshot(self.filepath):
+            if location is None:
+                items[barcode] = fields # Not plain ASCII: offsets are unreliable from here on, so keep the rest in memory
+                indexable = False
+                continue
+            index.add(barcode, location[0], location[1], fields)
+            if index.columns["last_purchased"][-1] >= hot_since or index.columns["last_updated"][-1] >= hot_since:
+                items[barcode] = fields
+        if indexable:
+            try:
+                index.write(self.filepath)
+            except OSError as e:
+                print(f"[WalItemStore] Could not write the offset index {self.filepath + INDEX_SUFFIX}: {e}")
+        return index, items
+
+    def _repair_wal(self):
+        try:
+            removed = _truncate_torn_tail(self.wal_path)
+        except OSError as e:
+            print(f"[WalItemStore] Could not check {self.wal_path} for a torn last batch: {e}")
+            return
+        if removed:
+            print(f"[WalItemStore] Dropped a torn last batch ({removed} bytes) from {self.wal_path}.")
+
+    def read_record(self, location):
+        """ Parses one item left on disk by load_lazy. Safe to call from any thread. """
+        offset, length = location
+        return json.loads(self.snapshot_map[offset:offset + length])
+
+    def commit(self, items, dirty, deleted, compact = True):
+        batch = {"put": {barcode: items[barcode] for barcode in dirty if barcode in items}}
+        if deleted:
+            batch["del"] = sorted(deleted)
+        try:
+            with open(self.wal_path, "a") as file:
+                file.write(json.dumps(batch, separators=(",", ":"), default=_encode_mapping) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            self._repair_wal() # The batch stays dirty and is retried; it must not land on half of itself
+            raise
+
+        if compact and self.needs_compaction():
+            self.compact(items)
+
+    def needs_compaction(self):
+        wal_size = os.path.getsize(self.wal_path)
+        try:
+            snapshot_size = os.path.getsize(self.filepath)
+        except OSError:
+            snapshot_size = 0
+        return wal_size >= max(self.compact_min_bytes, snapshot_size)
+
+    def compact(self, items):
+        """
+        Rewrites the snapshot (and its offset index) from memory and truncates the log. Replaying a stale log is harmless.
+        Items still on disk (see CompactCatalog.cold_location) are copied from the old snapshot byte for byte, without
+        being parsed or read in, and the catalog is told where they are in the new one.
+        """
+        raw_record = None
+        if self.snapshot_map is not None and hasattr(items, "cold_location"):
+            raw_record = lambda barcode: self._raw_record(items, barcode)
+        index = write_snapshot(self.filepath, items, raw_record)
+        open(self.wal_path, "w").close()
+        if self.snapshot_map is not None:
+            self.close()
+            with open(self.filepath, "rb") as file:
+                self.snapshot_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(items, "relocate_cold"):
+                items.relocate_cold(zip(index.barcodes, index.offsets, index.lengths))
+        print(f"[WalItemStore] Compacted log into {self.filepath}.")
+
+    def _raw_record(self, items, barcode):
+        """ (JSON bytes, indexed fields) of an item still on disk, or None if it has been read in. """
+        location = items.cold_location(barcode)
+        if location is None:
+            return None
+        offset, length = location
+        fields = {name: items.peek(barcode, name) for name in INDEX_TIMESTAMPS + INDEX_COUNTS + INDEX_STRINGS}
+        return self.snapshot_map[offset:offset + length], fields
+
+    def close(self):
+        if self.snapshot_map is not None:
+            self.snapshot_map.close()
+            self.snapshot_map = None
+
+
+class SqliteItemStore:
+    """ One row per item in an SQLite database running in WAL mode; each commit is one transaction. """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.conn = sqlite3.connect(filepath, check_same_thread = False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS items (barcode TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def load(self):
+        rows = self.conn.execute("SELECT barcode, data FROM items")
+        return {barcode: json.loads(data) for barcode, data in rows}
+
+    def commit(self, items, dirty, deleted, compact = True):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO items (barcode, data) VALUES (?, ?)",
+                [(barcode, json.dumps(items[barcode], default = _encode_mapping)) for barcode in dirty if barcode in items]
+            )
+            self.conn.executemany("DELETE FROM items WHERE barcode = ?", [(barcode,) for barcode in deleted])
+
+    def needs_compaction(self):
+        return False
+
+    def close(self):
+        self.conn.close()
+
+
+def make_item_store(filepath):
+    """ Picks a backend from the file extension: SQLite for .db/.sqlite, otherwise JSON snapshot + WAL. """
+    if filepath.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteItemStore(filepath)
+    return WalItemStore(filepath)
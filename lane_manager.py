@@ -0,0 +1,194 @@
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from capture_module import CaptureModule
+from transaction_queue import NotDurableError
+
+POLL_INTERVAL = 0.05 # Seconds between sweeps of every lane's barcode events
+
+def _ignore_interrupt():
+    """ Decode workers leave Ctrl+C to the parent, which shuts the pool down after the lanes stop. """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Lane:
+    def __init__(self, lane_id, capture_module, item_data_manager, transaction_queue, log_callback):
+        """
+        One checkout lane: a capture source and the transaction being scanned on it.
+        :param capture_module: CaptureModule for this lane's camera; LaneManager starts it.
+        """
+        self.lane_id = lane_id
+        self.capture_module = capture_module
+        self.item_data_manager = item_data_manager
+        self.transaction_queue = transaction_queue
+        self.log_callback = log_callback
+
+        self.lock = threading.Lock()
+        self.transaction_barcodes = []
+        self.last_scan_time = None
+        self.started_at = time.monotonic()
+        self.scans = 0
+        self.unknown = 0
+        self.transactions = 0
+        self.items = 0
+        self.failed = 0
+        self.unsaved = 0
+
+    def poll(self):
+        """ Adds the barcodes decoded since the last poll to this lane's transaction. """
+        events = self.capture_module.get_barcode_events()
+        if not events:
+            return
+        output_lines = []
+        with self.lock:
+            for barcode_data, barcode_type in events:
+                name, price = self.item_data_manager.get_item_details(barcode_data)
+                if name and price is not None:
+                    self.transaction_barcodes.append(barcode_data)
+                    self.scans += 1
+                    output_lines.append(f"Lane {self.lane_id} scanned {barcode_data}: {name} - ${round(price, 2)}")
+                else:
+                    self.unknown += 1
+                    output_lines.append(f"Lane {self.lane_id}: item with barcode {barcode_data} not found.")
+            self.last_scan_time = time.monotonic()
+        self.log_callback("\n".join(output_lines), "scan")
+
+    def finish(self):
+        """ Queues the lane's transaction and starts a new one. Returns the TransactionQueue future, or None if empty. """
+        with self.lock:
+            barcodes = list(self.transaction_barcodes)
+            self.transaction_barcodes.clear()
+            self.last_scan_time = None
+        if not barcodes:
+            return None
+        future = self.transaction_queue.submit(barcodes)
+        future.add_done_callback(lambda done: self._on_saved(barcodes, done))
+        return future
+
+    def _on_saved(self, barcodes, future):
+        error = future.exception()
+        with self.lock:
+            if error is None or isinstance(error, NotDurableError):
+                self.transactions += 1
+                self.items += len(barcodes)
+            else:
+                self.failed += 1
+            if isinstance(error, NotDurableError):
+                self.unsaved += 1
+        if isinstance(error, NotDurableError):
+            self.log_callback(f"Lane {self.lane_id}: transaction of {len(barcodes)} items processed but not saved yet: {error}", "scan")
+        elif error:
+            self.log_callback(f"Lane {self.lane_id}: transaction of {len(barcodes)} items failed and was not applied: {error}", "scan")
+        else:
+            self.log_callback(f"Lane {self.lane_id}: transaction of {len(barcodes)} items processed.", "scan")
+
+    def stats(self):
+        """ Throughput since the lane opened: decoded frames, scans and saved transactions, with per-second rates. """
+        decode = self.capture_module.decode_stats.summary()
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        with self.lock:
+            return {
+                "source": self.capture_module.source.name,
+                "seconds": elapsed,
+                "frames_decoded": decode["frames"],
+                "frames_per_second": decode["frames"] / elapsed,
+                "scans": self.scans,
+                "unknown": self.unknown,
+                "scans_per_minute": 60 * self.scans / elapsed,
+                "open_items": len(self.transaction_barcodes),
+                "transactions": self.transactions,
+                "items": self.items,
+                "failed": self.failed,
+                "unsaved": self.unsaved
+            }
+
+
+class LaneManager:
+    def __init__(self, item_data_manager, transaction_queue, sources, decode_workers = None, idle_finish = None,
+                 log_callback = None):
+        """
+        Drives several checkout lanes from one process. Every lane decodes through one shared process pool
+        and queues its transactions on the same TransactionQueue, so one ItemDataManager/ItemProcessor
+        prices and saves for all of them.
+        :param sources: One capture source per lane: a camera index, video file or image directory (see capture_module.open_source).
+        :param decode_workers: Decode processes; defaults to the CPU count.
+        :param idle_finish: Finish a lane's transaction once nothing was scanned on it for this many seconds (None: only finish()).
+        """
+        self.item_data_manager = item_data_manager
+        self.transaction_queue = transaction_queue
+        self.idle_finish = idle_finish
+        self.log_callback = log_callback if log_callback else self._default_log
+        self.decode_workers = decode_workers or os.cpu_count() or 1
+        self.decode_pool = ProcessPoolExecutor(max_workers = self.decode_workers, initializer = _ignore_interrupt)
+        self.lanes = {}
+        self.running = False
+        self.poll_thread = None
+
+        try:
+            for lane_id, source in enumerate(sources, 1):
+                capture_module = CaptureModule(source, decode_pool = self.decode_pool)
+                self.lanes[lane_id] = Lane(lane_id, capture_module, item_data_manager, transaction_queue, self.log_callback)
+        except Exception:
+            self.release()
+            raise
+
+    def _default_log(self, message, log_type="info"):
+        """Default logging if no callback is provided."""
+        print(f"[{log_type.upper()}] {message}")
+
+    def start(self, scanning = True):
+        """ Starts every lane's capture and decode threads and the thread that collects their scans. """
+        if self.running:
+            return
+        self.running = True
+        for lane in self.lanes.values():
+            lane.started_at = time.monotonic()
+            lane.capture_module.start()
+            if scanning:
+                lane.capture_module.scanning.set()
+        self.poll_thread = threading.Thread(target = self._poll_loop, daemon = True)
+        self.poll_thread.start()
+        self.log_callback(f"Started {len(self.lanes)} lanes with {self.decode_workers} decode workers.", "scan")
+
+    def _poll_loop(self):
+        while self.running:
+            now = time.monotonic()
+            for lane in self.lanes.values():
+                try:
+                    lane.poll()
+                    if self.idle_finish is not None and lane.last_scan_time is not None \
+                            and now - lane.last_scan_time >= self.idle_finish:
+                        lane.finish()
+                except Exception as e:
+                    print(f"[LaneManager] Error polling lane {lane.lane_id}: {e}")
+            time.sleep(POLL_INTERVAL)
+
+    def finish(self, lane_id):
+        """ Finishes the transaction on one lane; see Lane.finish. Raises KeyError for an unknown lane. """
+        return self.lanes[lane_id].finish()
+
+    def stats(self):
+        """ {lane_id: Lane.stats()} plus "total" summed over lanes. """
+        stats = {lane_id: lane.stats() for lane_id, lane in self.lanes.items()}
+        total = {}
+        for key in ("frames_decoded", "frames_per_second", "scans", "scans_per_minute", "transactions", "items", "failed", "unsaved"):
+            total[key] = sum(lane[key] for lane in stats.values())
+        stats["total"] = total
+        return stats
+
+    def stop(self):
+        """ Stops collecting scans and every lane's capture. Open transactions are left unfinished. """
+        self.running = False
+        if self.poll_thread and self.poll_thread.is_alive():
+            self.poll_thread.join(timeout = 1)
+        for lane in self.lanes.values():
+            lane.capture_module.stop()
+
+    def release(self):
+        self.stop()
+        for lane in self.lanes.values():
+            lane.capture_module.release()
+        self.decode_pool.shutdown(wait = True, cancel_futures = True)
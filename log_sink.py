@@ -0,0 +1,107 @@
+import json
+import logging
+import queue
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+FLUSH_INTERVAL_MS = 100 # How often queued messages are written to the log widgets
+MAX_WIDGET_ENTRIES = 100 # Messages kept per log widget; older ones are dropped from the bottom
+LOG_FILE = "demandsync.log"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+
+class JsonLineFormatter(logging.Formatter):
+    """ One JSON object per line: {"time", "type", "message"}. """
+    def format(self, record):
+        return json.dumps({
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "type": getattr(record, "log_type", "info"),
+            "message": record.getMessage()
+        })
+
+
+class UILogSink:
+    def __init__(self, root, widgets, flush_interval_ms = FLUSH_INTERVAL_MS, max_entries = MAX_WIDGET_ENTRIES,
+                 log_path = LOG_FILE, echo = True):
+        """
+        Collects log messages from any thread and writes them to the Tk log widgets in one batch per
+        flush_interval_ms, on the Tk thread. Every message also goes to a rotating JSON-lines log file.
+        :param widgets: {log_type: tk.Text}; newest messages are shown at the top.
+        :param echo: Also print messages to the console, as the app always has.
+        """
+        self.root = root
+        self.widgets = widgets
+        self.flush_interval_ms = flush_interval_ms
+        self.echo = echo
+        self.messages = queue.SimpleQueue()
+        self.entries = {log_type: deque(maxlen = max_entries) for log_type in widgets} # What each widget shows, oldest first
+        self.running = True
+
+        self.logger = logging.getLogger("demandsync")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.file_handler = None
+        if log_path:
+            self.file_handler = RotatingFileHandler(log_path, maxBytes = LOG_MAX_BYTES, backupCount = LOG_BACKUP_COUNT)
+            self.file_handler.setFormatter(JsonLineFormatter())
+            self.logger.addHandler(self.file_handler)
+
+        self.root.after(self.flush_interval_ms, self._flush_loop)
+
+    def log(self, message, log_type = "scan"):
+        """ Queues a message. Safe to call from any thread; never touches Tk. """
+        self.messages.put((time.time(), log_type, message))
+
+    def _flush_loop(self):
+        self.flush()
+        if self.running:
+            self.root.after(self.flush_interval_ms, self._flush_loop)
+
+    def flush(self):
+        """ Writes everything queued so far. Must run on the Tk thread. """
+        batches = {}
+        console = []
+        while True:
+            try:
+                created, log_type, message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            full_message = f"{datetime.fromtimestamp(created).strftime('[%H:%M:%S]')} {message}"
+            self.logger.info(message, extra = {"log_type": log_type})
+            if log_type in self.widgets:
+                batches.setdefault(log_type, []).append(full_message + "\n")
+                console.append(full_message)
+            else:
+                console.append(f"[{log_type.upper()} - ERROR] {full_message}")
+
+        for log_type, lines in batches.items():
+            self._write_widget(log_type, lines)
+        if self.echo and console:
+            print("\n".join(console))
+
+    def _write_widget(self, log_type, lines):
+        """ One insert for the whole batch, plus one delete if old entries fell out of the ring. """
+        widget = self.widgets[log_type]
+        entries = self.entries[log_type]
+        overflowed = len(entries) + len(lines) > entries.maxlen
+        entries.extend(lines)
+
+        widget.insert('1.0', "".join(reversed(lines)))
+        if overflowed:
+            kept_lines = sum(entry.count("\n") for entry in entries)
+            widget.delete(f"{kept_lines + 1}.0", 'end')
+        widget.see('1.0')
+
+    def stop(self):
+        """ Writes what is still queued and closes the log file. """
+        self.running = False
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[UILogSink] Error flushing log on shutdown: {e}")
+        if self.file_handler:
+            self.logger.removeHandler(self.file_handler)
+            self.file_handler.close()
@@ -1,15 +1,19 @@
+import os
 import tkinter as tk
 from tkinter import messagebox
-from PIL import Image, ImageTk
-import cv2
 from dashboard_module import DashboardModule
 from capture_module import CaptureModule
 from item_data_manager import ItemDataManager
 from process_module import ItemProcessor
-from network_manager import NetworkManager, get_local_ip
-
+from network_manager import NetworkManager, get_local_ip, load_topology
+from registry_publisher import RegistryPublisher
+from log_sink import UILogSink
+from preview_renderer import PreviewRenderer
+from transaction_queue import NotDurableError, TransactionQueue
+import metrics
+
+import queue
 import time
-from datetime import datetime
 
 # --- Global Configuration ---
 # Set this IP to the IP address of the OTHER computer on your local network.
@@ -17,6 +21,8 @@ from datetime import datetime
 OTHER_STORE_IP = TODO # <--- IMPORTANT: REPLACE THIS WITH THE ACTUAL IP OF THE OTHER MACHINE
 
 JSON_FILE = "items.json" # Path to your item data file
+PREVIEW_MAX_FPS = 20 # Camera preview rate cap; decoding still sees every captured frame
+STORES_CONFIG = "stores.json" # Optional N-store mesh config (see stores.example.json); when present it replaces OTHER_STORE_IP
 
 # --- Application Class ---
 class DemandSyncApp:
@@ -47,7 +53,7 @@ class DemandSyncApp:
 
         self.root.bind("<Configure>", self._on_resize)
 
-        self.scan_button = tk.Button(self.left_frame, text="Scan Barcode", command=self.handle_scan)
+        self.scan_button = tk.Button(self.left_frame, text="Start Scanning", command=self.handle_scan)
         self.scan_button.pack()
 
         self.finish_button = tk.Button(self.left_frame, text="Finish Transaction", command=self.finish_transaction)
@@ -77,17 +83,29 @@ class DemandSyncApp:
             self.log_frames[log_type] = frame
             self.log_text_widgets[log_type] = text_widget
 
+        self.log_sink = UILogSink(self.root, self.log_text_widgets)
+
         self.item_data_manager = ItemDataManager(filepath=JSON_FILE, log_callback=self._log_message) # MODIFIED: Pass log_callback
         self.item_processor = ItemProcessor(item_data_manager=self.item_data_manager, log_callback=self._log_message) # MODIFIED: Pass log_callback
+        self.transaction_queue = TransactionQueue(self.item_processor, log_callback=self._log_message)
+        self.transaction_queue.start()
+        self.finished_transactions = queue.Queue()
         
         # --- Module Instances ---
         self.capture_module = CaptureModule()
+        self.capture_module.start()
+        if os.path.exists(STORES_CONFIG):
+            network_config = load_topology(STORES_CONFIG)
+        else:
+            network_config = {"is_this_store_server": is_this_store_server, "other_store_ip": OTHER_STORE_IP}
         self.network_manager = NetworkManager(
             item_data_manager = self.item_data_manager,
-            is_this_store_server = is_this_store_server,
-            other_store_ip = OTHER_STORE_IP,
-            log_callback=self._log_message
+            log_callback=self._log_message,
+            **network_config
         )
+        self.root.title(f"DemandSync (Store {self.network_manager.store_id}) - My IP: {get_local_ip()}")
+        self.registry_publisher = RegistryPublisher(store_name=self.network_manager.store_name, log_callback=self._log_message)
+        self.registry_publisher.start()
 
         # Right Side of UI
         self.dashboard = DashboardModule(self.right_frame, self.item_processor)
@@ -101,11 +119,13 @@ class DemandSyncApp:
         # Simulated intervals (in seconds)
         self.hourly_interval_simulated = 10
         self.daily_interval_simulated = 120
+        self.item_data_manager.purchases.add_window("day", self.daily_interval_simulated)
 
         # Start periodic tasks
         self.start_periodic_tasks()
-        self.update_camera()
-        self.start_dashboard_refresh()
+        self.preview = PreviewRenderer(self.root, self.video_label, self.capture_module, max_fps=PREVIEW_MAX_FPS)
+        self.poll_scan_events()
+        self.poll_finished_transactions()
 
         self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
 
@@ -129,31 +149,34 @@ class DemandSyncApp:
     def run_hourly_tasks(self):
         """ Executes tasks that simulate hourly processes. """
         self._log_message("Simulating hourly process: Sending price updates to other store...", "sent")
-        self.network_manager.send_prices_to_other_store(self.last_hourly_check_time)
+        prices = self.item_data_manager.get_recently_updated_items_for_sync(self.last_hourly_check_time)
+        self.network_manager.send_prices_to_other_store(self.last_hourly_check_time, prices)
+        self.registry_publisher.publish(prices)
         self.last_hourly_check_time = time.time()
 
     def run_daily_tasks(self):
         """ Executes tasks that simulate daily processes. """
         self._log_message("Simulating daily process: Decaying prices of unsold items...", "process")
         self.item_processor.decay_prices(self.last_daily_check_time)
-        self.dashboard.update_dashboard([])
         self.last_daily_check_time = time.time()
 
     def handle_scan(self):
-        """ Handles the 'Scan Barcode' button click event. """
+        """ Handles the 'Start/Stop Scanning' button click event by toggling continuous decoding. """
+        if self.capture_module.scanning.is_set():
+            self.capture_module.scanning.clear()
+            self.scan_button.configure(text="Start Scanning")
+            self._log_message("Scanning paused.", "scan")
+        else:
+            self.capture_module.scanning.set()
+            self.scan_button.configure(text="Stop Scanning")
+            self._log_message("Scanning...", "scan")
+
+    def poll_scan_events(self):
+        """ Adds barcodes decoded by the capture engine to the current transaction. Never blocks on decode. """
         try:
-            frame, results = self.capture_module.capture_pipeline()
-
-            img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img_pil = Image.fromarray(img_rgb)
-            img_tk = ImageTk.PhotoImage(img_pil)
-            self.video_label.imgtk = img_tk
-            self.video_label.configure(image = img_tk)
-
-            output_lines = []
-            if not results:
-                output_lines.append("No barcode found.")
-            else:
+            results = self.capture_module.get_barcode_events()
+            if results:
+                output_lines = []
                 for barcode_data, barcode_type in results:
                     name, price = self.item_data_manager.get_item_details(barcode_data)
                     if name and price is not None:
@@ -162,11 +185,11 @@ class DemandSyncApp:
                     else:
                         output_lines.append(f"Item with barcode {barcode_data} not found.")
 
-            self._log_message("\n".join(reversed(output_lines)), "scan")
+                self._log_message("\n".join(reversed(output_lines)), "scan")
 
         except Exception as e:
-            messagebox.showerror("Error", f"An error occurred during scan: {e}")
             self._log_message(f"Error during scan: {e}")
+        self.root.after(50, self.poll_scan_events)
 
     def finish_transaction(self):
         """ Handles the 'Finish Transaction' button click event. """
@@ -175,79 +198,51 @@ class DemandSyncApp:
             self._log_message("No items in current transaction.")
             return
         
-        self._log_message("Processing transaction...", "scan")
-        self.item_processor.process_pipeline(self.transaction_barcodes)
-        self.dashboard.update_dashboard(self.transaction_barcodes)
-        self.transaction_barcodes.clear()
-        self._log_message("Transaction processed. Ready for next transaction.", "scan")
-        messagebox.showinfo("Transaction Complete", "Transaction processed successfully!")
-
-    def update_camera(self):
-        ret, frame = self.capture_module.camera.read()
-        if ret:
-            frame_height, frame_width = frame.shape[:2]
-            frame_aspect_ratio = frame_width / frame_height
-
-            label_width = self.video_label.winfo_width()
-            label_height = self.video_label.winfo_height()
-
-            if label_width == 1 and label_height == 1:
-                label_width = 640
-                label_height = 480
-
-            label_aspect_ratio = label_width / label_height
-
-            if label_aspect_ratio > frame_aspect_ratio:
-                new_height = label_height
-                new_width = int(frame_aspect_ratio * new_height)
-            else:
-                new_width = label_width
-                new_height = int(new_width / frame_aspect_ratio)
-
-            resized_frame = cv2.resize(frame, (new_width, new_height))
-            img_rgb = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-            img_pil = Image.fromarray(img_rgb)
-            img_tk = ImageTk.PhotoImage(img_pil)
-
-            self.video_label.imgtk = img_tk
-            self.video_label.configure(image=img_tk)
-
-        self.root.after(30, self.update_camera)
 
+        barcodes = list(self.transaction_barcodes)
+        self.transaction_barcodes.clear()
+        future = self.transaction_queue.submit(barcodes)
+        future.add_done_callback(lambda done: self.finished_transactions.put((barcodes, done)))
+        self._log_message(f"Transaction queued ({self.transaction_queue.depth()} waiting). Ready for next transaction.", "scan")
+
+    def poll_finished_transactions(self):
+        """ Reports transactions the queue has saved and shows them on the dashboard, on the Tk thread. """
+        while True:
+            try:
+                barcodes, future = self.finished_transactions.get_nowait()
+            except queue.Empty:
+                break
+            error = future.exception()
+            if isinstance(error, NotDurableError):
+                self._log_message(f"Transaction of {len(barcodes)} items processed but not saved yet: {error}", "scan")
+            elif error:
+                self._log_message(f"Transaction of {len(barcodes)} items failed and was not applied: {error}", "scan")
+                continue
+            self.dashboard.update_dashboard(barcodes)
+            self._log_message(f"Transaction of {len(barcodes)} items processed.", "scan")
+        self.root.after(50, self.poll_finished_transactions)
 
     def _log_message(self, message, log_type="scan"):
-        """ Logs a message to the appropriate Tkinter text widget and console. """
-        timestamp = datetime.now().strftime("[%H:%M:%S]")
-        full_message = f"{timestamp} {message}\n"
-
-        target_widget = self.log_text_widgets.get(log_type)
-        if target_widget:
-            target_widget.insert('1.0', full_message)
-            num_lines = int(target_widget.index('end-1c').split('.')[0])
-            if num_lines > 100:
-                target_widget.delete('101.0', 'end')
-            target_widget.see('1.0')
-        else:
-            print(f"[{log_type.upper()} - ERROR] {full_message.strip()}")
-
-        print(full_message.strip())
+        """ Logs a message to the appropriate Tkinter text widget, the log file and console. Safe to call from any thread. """
+        self.log_sink.log(message, log_type)
 
     def _on_closing(self):
         """ Handles the window closing event to ensure proper shutdown. """
         print("Application closing. Shutting down network manager...")
+        self.transaction_queue.stop()
         self.network_manager.shutdown()
-        self.capture_module.camera.release()
+        self.registry_publisher.stop()
+        self.preview.stop()
+        self.capture_module.release()
+        self.log_sink.stop()
         self.root.destroy()
 
-    def start_dashboard_refresh(self):
-        """ Periodically refresh dashboard to show price changes (e.g. decay). """
-        self.dashboard.update_dashboard([])
-        self.root.after(10000, self.start_dashboard_refresh)
-
     def _on_resize(self, event):
-        """Ensure video_label stays within 1/2 of window width."""
+        """Ensure video_label stays within 1/2 of window width, in a 4:3 box the preview is fitted to."""
         max_width = int(self.root.winfo_width() * 1 / 2)
-        self.camera_frame.configure(width=max_width)
+        if max_width == self.camera_frame.winfo_width():
+            return
+        self.camera_frame.configure(width=max_width, height=int(max_width * 3 / 4))
         self.camera_frame.pack_propagate(False)
 
 
@@ -258,6 +253,8 @@ if __name__ == "__main__":
     # Set IS_THIS_STORE_SERVER = False for the other computer (e.g., Store 2).
     IS_THIS_STORE_SERVER = TODO # <--- IMPORTANT: SET THIS TO TRUE FOR ONE COMPUTER, FALSE FOR THE OTHER
 
+    metrics.serve_from_env() # DEMANDSYNC_METRICS=9131 exposes timings on http://127.0.0.1:9131/metrics
+
     root = tk.Tk()
     app = DemandSyncApp(root, is_this_store_server = IS_THIS_STORE_SERVER)
     root.mainloop()
@@ -0,0 +1,267 @@
+"""
+Lightweight timers, counters and a sampling profiler for the hot paths, exposed as Prometheus text.
+
+Disabled by default: an instrumented call then costs one global lookup and a branch. Turn it on with
+DEMANDSYNC_METRICS=9131 (or host:port) in the environment, or enable() / serve() from code, then:
+    GET /metrics            Prometheus text format
+    GET /profiler/start     start sampling every thread's stack (?interval=0.005 seconds)
+    GET /profiler/stop      stop and return the samples as collapsed stacks (flamegraph.pl / speedscope input)
+"""
+import bisect
+import functools
+import math
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+METRICS_ENV = "DEMANDSYNC_METRICS"
+DEFAULT_HOST = "127.0.0.1"
+# Seconds; covers a sub-millisecond merge up to a multi-second catalog rewrite
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILER_INTERVAL = 0.005
+
+ENABLED = False
+_registry = {}
+_registry_lock = threading.Lock()
+_profiler = None
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value) # First bucket with value <= bound
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def increment(self, amount = 1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        return [f"{self.name} {self.value}"]
+
+
+def _metric(cls, name, help_text):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.setdefault(name, cls(name, help_text))
+    return metric
+
+def histogram(name, help_text = ""):
+    return _metric(Histogram, name, help_text)
+
+def counter(name, help_text = ""):
+    return _metric(Counter, name, help_text)
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+def timed(name, help_text = ""):
+    """ Decorator recording each call's duration in the histogram name (seconds) while metrics are enabled. """
+    def decorator(fn):
+        recorder = histogram(name, help_text)
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                recorder.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+class _Timer:
+    __slots__ = ("recorder", "start")
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.observe(time.perf_counter() - self.start)
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+_NO_TIMER = _NoTimer()
+
+def timer(name, help_text = ""):
+    """ with metrics.timer("name"): ... times a block like timed() times a call. """
+    if not ENABLED:
+        return _NO_TIMER
+    return _Timer(histogram(name, help_text))
+
+def count(name, amount = 1, help_text = ""):
+    if ENABLED:
+        counter(name, help_text).increment(amount)
+
+def observe(name, value, help_text = ""):
+    """ Records a value measured elsewhere (e.g. in a worker process) in the histogram name. """
+    if ENABLED:
+        histogram(name, help_text).observe(value)
+
+def render():
+    """ Every metric in the Prometheus text exposition format. """
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        if metric.help_text:
+            lines.append(f"# HELP {name} {metric.help_text}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    def __init__(self, interval = PROFILER_INTERVAL):
+        """ Samples the stack of every other thread each interval seconds into collapsed-stack counts. """
+        self.interval = interval
+        self.samples = {}
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return self.collapsed()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while self.running:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+            time.sleep(self.interval)
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items(), key = lambda entry: -entry[1]))
+
+def start_profiler(interval = PROFILER_INTERVAL):
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(interval)
+        _profiler.start()
+
+def stop_profiler():
+    """ Stops the profiler and returns its samples as collapsed stacks ("" if it was not running). """
+    global _profiler
+    if _profiler is None:
+        return ""
+    report = _profiler.stop()
+    _profiler = None
+    return report
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            body = render()
+        elif url.path == "/profiler/start":
+            value = parse_qs(url.query).get("interval", [PROFILER_INTERVAL])[0]
+            try:
+                interval = float(value)
+            except ValueError:
+                interval = None
+            if interval is None or not math.isfinite(interval) or interval <= 0:
+                self.send_error(400, f"interval must be a positive number of seconds, got {value!r}")
+                return
+            start_profiler(interval)
+            body = "profiler started\n"
+        elif url.path == "/profiler/stop":
+            body = stop_profiler()
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # Scrapes every few seconds would flood the console
+
+def serve(port, host = DEFAULT_HOST):
+    """ Enables metrics and serves them from a daemon thread. Returns the server (server.shutdown() stops it). """
+    enable()
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    print(f"[metrics] Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+def serve_from_env():
+    """ Starts serve() if DEMANDSYNC_METRICS is set to a port or host:port. Returns the server or None. """
+    setting = os.environ.get(METRICS_ENV)
+    if not setting:
+        return None
+    host, _, port = setting.rpartition(":")
+    return serve(int(port), host or DEFAULT_HOST)
@@ -2,116 +2,247 @@ import zmq
 import json
 import socket
 import threading
-import time
+
+import metrics
+import vector_clock
+import wire_format
 
 # Configuration for Network Communication
-STORE_1_LISTEN_PORT = "5556" # Port for Store 1 to listen on (PULL socket binds here)
-STORE_2_LISTEN_PORT = "5557" # Port for Store 2 to listen on (PULL socket binds here)
+STORE_1_LISTEN_PORT = "5556" # Port for Store 1 to listen on (ROUTER socket binds here)
+STORE_2_LISTEN_PORT = "5557" # Port for Store 2 to listen on (ROUTER socket binds here)
+MAX_MESSAGES_PER_BATCH = 1000 # Upper bound on messages drained per wake-up before merging
+
+def load_topology(path):
+    """
+    Reads a store mesh config file and returns the matching NetworkManager keyword arguments.
+    Format (see stores.example.json):
+        {"store_id": "store-1", "name": "STORE1", "listen": "tcp://*:5556",
+         "peers": {"store-2": "tcp://192.168.1.20:5556", "store-3": "tcp://192.168.1.30:5556"}}
+    "store_id" is required: peers are listed under their store_id, and a store's messages arrive under it.
+    "name" is what the store registry shows (default "STORE<store_id>").
+    """
+    with open(path, "r") as file:
+        config = json.load(file)
+    if not config.get("store_id"):
+        raise ValueError(f"{path} has no \"store_id\"; every store in the mesh needs one, matching its key under the other stores' \"peers\"")
+    return {
+        "store_id": config["store_id"],
+        "store_name": config.get("name"),
+        "listen_endpoint": config["listen"],
+        "peers": config.get("peers", {})
+    }
 
 class NetworkManager:
-    def __init__(self, item_data_manager, is_this_store_server = False, other_store_ip = None, log_callback = None):
+    def __init__(self, item_data_manager, is_this_store_server = False, other_store_ip = None, log_callback = None,
+                 store_id = None, listen_endpoint = None, peers = None, store_name = None):
         """
-        Initializes the NetworkManager for bidirectional PUSH/PULL communication.
+        Initializes the NetworkManager for an N-store sync mesh. Each store binds one ROUTER socket
+        that all peers send to, and connects one DEALER socket to every peer's ROUTER.
         :param item_data_manager: An instance of ItemDataManager to get/set item data.
-        :param is_this_store_server: True if this instance is Store 1 (binds to STORE_1_LISTEN_PORT),
-                                     False if it is Store 2 (binds to STORE_2_LISTEN_PORT).
-        :param other_store_ip: The IP address of the other store. Required for PUSH socket to connect.
+        :param store_id, listen_endpoint, peers: Mesh configuration ({peer_id: endpoint}), see load_topology.
+                                                 store_id defaults to the ItemDataManager's own. Peers must be
+                                                 keyed by their store_id, which is how their messages are identified.
+        :param store_name: Display name for the store registry; defaults to "STORE<store_id>" ("STORE1"/"STORE2").
+        :param is_this_store_server, other_store_ip: Original two-store setup, used when peers is None.
+                                     Store 1 binds STORE_1_LISTEN_PORT, Store 2 binds STORE_2_LISTEN_PORT.
         """
         self.context = zmq.Context()
         self.item_data_manager = item_data_manager
         self.is_this_store_server = is_this_store_server
         self.running = True
         self.receiver_thread = None
-        self.other_store_ip = other_store_ip
-        self.log_callback = log_callback if log_callback else self._defailt_log
+        self.router_socket = None
+        self.control_socket = None
+        self.control_endpoint = f"inproc://network-manager-control-{id(self)}"
+        self.dealer_sockets = {}
+        self.peer_formats = {} # peer_id -> (wire_version, compression) negotiated from its HELLO; absent -> JSON
+        self._hello_replies_pending = set()
+        self.log_callback = log_callback if log_callback else self._default_log
 
-        if not self.other_store_ip:
-            raise ValueError("other_store_ip must be provided for network communication.")
+        if peers is None:
+            if not other_store_ip:
+                raise ValueError("other_store_ip must be provided for network communication.")
+            my_port, other_port = (STORE_1_LISTEN_PORT, STORE_2_LISTEN_PORT) if is_this_store_server else (STORE_2_LISTEN_PORT, STORE_1_LISTEN_PORT)
+            store_id = "1" if is_this_store_server else "2"
+            listen_endpoint = f"tcp://*:{my_port}"
+            peers = {"2" if is_this_store_server else "1": f"tcp://{other_store_ip}:{other_port}"}
+
+        if store_id is None:
+            store_id = item_data_manager.store_id
+        self.store_id = store_id
+        self.store_name = store_name if store_name else f"STORE{store_id}"
+        self.listen_endpoint = listen_endpoint
+        self.peers = {}
+        self.item_data_manager.store_id = store_id # Local price changes are stamped with this id in item clocks
 
         self.setup_sockets()
+        if self.running:
+            for peer_id, endpoint in peers.items():
+                self.add_peer(peer_id, endpoint)
 
     def _default_log(self, message, log_type="info"):
         """Default logging if no callback is provided."""
         print(f"[{log_type.upper()}] {message}")
 
     def setup_sockets(self):
-        """ Sets up the PUSH and PULL sockets based on the store's role. """
-        if self.is_this_store_server:
-            self.my_listen_port = STORE_1_LISTEN_PORT
-            self.other_store_connect_port = STORE_2_LISTEN_PORT
-        else:
-            self.my_listen_port = STORE_2_LISTEN_PORT
-            self.other_store_connect_port = STORE_1_LISTEN_PORT
-
-        # Setup PULL socket (for receiving messages from the other store)
-        self.pull_socket = self.context.socket(zmq.PULL)
+        """ Binds the ROUTER socket other stores send to and starts the receiver thread. """
+        # Control socket used to wake the receiver thread for shutdown
+        self.control_socket = self.context.socket(zmq.PAIR)
+        self.control_socket.bind(self.control_endpoint)
+
+        self.router_socket = self.context.socket(zmq.ROUTER)
         try:
-            self.pull_socket.bind(f"tcp://*:{self.my_listen_port}")
-            self.log_callback(f"PULL socket bound to tcp://*:{self.my_listen_port} (Receiving from other store)", "received")
+            self.router_socket.bind(self.listen_endpoint)
+            self.log_callback(f"ROUTER socket bound to {self.listen_endpoint} (Receiving from other stores)", "received")
             self.receiver_thread = threading.Thread(target = self.receive_loop, daemon = True)
             self.receiver_thread.start()
         except zmq.error.ZMQError as e:
-            print(f"[NetworkManager] Error binding PULL socket: {e}")
-            self.pull_socket.close()
+            print(f"[NetworkManager] Error binding ROUTER socket: {e}")
+            self.router_socket.close()
+            self.control_socket.close()
             self.context.term()
             self.running = False
-            return
 
-        # Setup PUSH socket (for sending messages to the other store)
-        self.push_socket = self.context.socket(zmq.PUSH)
+    def add_peer(self, peer_id, endpoint):
+        """
+        Connects a DEALER socket to another store and announces this store with a HELLO.
+        Like all sends, call it from the thread that owns the NetworkManager (not the receiver thread).
+        """
+        if peer_id in self.dealer_sockets:
+            return
+        dealer = self.context.socket(zmq.DEALER)
+        dealer.setsockopt(zmq.ROUTING_ID, self.store_id.encode("utf-8"))
+        dealer.setsockopt(zmq.LINGER, 0)
         try:
-            # Connect to the other store's PULL socket
-            self.push_socket.connect(f"tcp://{self.other_store_ip}:{self.other_store_connect_port}")
-            self.log_callback(f" PUSH socket connected to tcp://{self.other_store_ip}:{self.other_store_connect_port} (Sending to other store)", "sent")
-            self.push_socket.send_string("Hello this is store 1")
+            dealer.connect(endpoint)
+            dealer.send_multipart(wire_format.encode_hello(self.store_id))
         except zmq.error.ZMQError as e:
-            print(f"[NetworkManager] Error connecting PUSH socket: {e}")
-            self.push_socket.close()
-            self.pull_socket.close()
-            self.context.term()
-            self.running = False
-
+            print(f"[NetworkManager] Error connecting to store {peer_id} at {endpoint}: {e}")
+            dealer.close()
+            return
+        self.dealer_sockets[peer_id] = dealer
+        self.peers[peer_id] = endpoint
+        self.log_callback(f"DEALER socket connected to {endpoint} (Sending to store {peer_id})", "sent")
 
     def receive_loop(self):
-        """ Loop to receive messages on the PULL socket. """
-        self.pull_socket.RCVTIMEO = 100 # milliseconds
-        while self.running:
-            try:
-                message = self.pull_socket.recv_string()
-                self.log_callback(f"Received price update -> {message}", "received")
-                received_prices = json.loads(message)
-                self.log_callback("[NetworkManager] Processing received prices...", "received")
-
-                self.item_data_manager.update_prices_from_sync(received_prices)
+        """
+        Sleeps in a poll on the ROUTER and control sockets. Each wake-up drains every pending message
+        and merges them into the item data in one batch; any message on the control socket stops the loop.
+        """
+        control = self.context.socket(zmq.PAIR)
+        control.connect(self.control_endpoint)
+        poller = zmq.Poller()
+        poller.register(self.router_socket, zmq.POLLIN)
+        poller.register(control, zmq.POLLIN)
+        try:
+            while self.running:
+                events = dict(poller.poll())
+                if control in events:
+                    break
+                if self.router_socket in events:
+                    with metrics.timer("sync_receive_seconds", "Draining, decoding and merging one wake-up of received messages"):
+                        received_prices = self._drain_messages()
+                        if received_prices:
+                            metrics.count("sync_items_received_total", len(received_prices), "Prices received from peers")
+                            self.log_callback(f"[NetworkManager] Processing {len(received_prices)} received prices...", "received")
+                            self.item_data_manager.update_prices_from_sync(received_prices)
+        except zmq.error.ZMQError as e:
+            if self.running:
+                print(f"[NetworkManager] ZMQ Error in receive loop: {e}")
+        except Exception as e:
+            print(f"[NetworkManager] Unexpected error in receive loop: {e}")
+        finally:
+            control.close()
 
+    def _drain_messages(self):
+        """
+        Reads every message already queued on the ROUTER socket without blocking and folds the price
+        updates into one {barcode: entry} dict, resolving repeats with the same vector clock rule as the
+        merge itself. HELLO messages update the negotiated wire format for their sender instead.
+        """
+        merged = {}
+        for _ in range(MAX_MESSAGES_PER_BATCH):
+            try:
+                peer_routing_id, *frames = self.router_socket.recv_multipart(zmq.NOBLOCK)
             except zmq.error.Again:
-                pass
-            except zmq.error.ZMQError as e:
-                if self.running:
-                    print(f"[NetworkManager] ZMQ Error in receive loop: {e}")
                 break
-            except json.JSONDecodeError as e:
-                print(f"[NetworkManager] JSON Decode Error in received message: {e}")
-            except Exception as e:
-                print(f"[NetworkManager] Unexpected error in receive loop: {e}")
-            time.sleep(0.01)
+            peer_id = peer_routing_id.decode("utf-8", "replace")
+            metrics.count("sync_messages_received_total", 1, "Messages read from the ROUTER socket")
+            try:
+                received_prices = self._decode_message(peer_id, frames)
+            except (ValueError, UnicodeDecodeError, IndexError) as e:
+                print(f"[NetworkManager] Could not decode message from store {peer_id}: {e}")
+                continue
+            if not isinstance(received_prices, dict):
+                continue
+            for barcode, data in received_prices.items():
+                existing = merged.get(barcode)
+                if existing is None:
+                    merged[barcode] = data
+                    continue
+                take_remote, clock = vector_clock.resolve(existing, data)
+                winner = dict(data if take_remote else existing)
+                if "clock" in existing or "clock" in data:
+                    winner["clock"] = clock
+                merged[barcode] = winner
+        return merged
+
+    def _decode_message(self, peer_id, frames):
+        """ Returns the price dict carried by a message, or None for handshakes. Older peers send JSON strings. """
+        if wire_format.is_hello(frames):
+            hello = wire_format.parse_hello(frames)
+            self.peer_formats[peer_id] = wire_format.negotiate(hello)
+            if hello.get("reply", False):
+                self._hello_replies_pending.add(peer_id)
+            self.log_callback(f"Store {peer_id} connected, sending wire format {self.peer_formats[peer_id] or 'JSON'}", "received")
+            return None
+        if wire_format.is_price_batch(frames):
+            received_prices = wire_format.decode_prices(frames)
+            self.log_callback(f"Received binary price update for {len(received_prices)} items from store {peer_id}", "received")
+            return received_prices
+        message = b"".join(frames).decode("utf-8")
+        self.log_callback(f"Received price update from store {peer_id} -> {message}", "received")
+        return json.loads(message)
 
-    def send_prices_to_other_store(self, last_sync_time):
+    @metrics.timed("sync_send_seconds", "Encoding and sending one price update to every peer")
+    def send_prices_to_other_store(self, last_sync_time, prices = None):
         """
-        Sends the current prices to the other store using the PUSH socket.
+        Sends the current prices to every peer store, encoding once per negotiated wire format.
         Only sends items updated since last_sync_time.
         :param last_sync_time: A float timestamp (e.g., from time.time()) representing the last sync time.
+        :param prices: Already computed get_recently_updated_items_for_sync(last_sync_time) result, if any.
         """
         if not self.running:
             print("[NetworkManager] Not running, cannot send prices.")
             return
 
         try:
-            prices = self.item_data_manager.get_recently_updated_items_for_sync(last_sync_time)
+            if prices is None:
+                prices = self.item_data_manager.get_recently_updated_items_for_sync(last_sync_time)
+            unknown = self._hello_replies_pending - set(self.dealer_sockets)
+            if unknown:
+                # Their HELLO came under a store_id no peer is listed as, so no format can be matched to a socket
+                self.log_callback(f"Stores {', '.join(sorted(unknown))} connected but are not listed under peers "
+                                  f"({', '.join(self.dealer_sockets)}); list peers by their store_id to send them binary updates", "sent")
+                self._hello_replies_pending.difference_update(unknown)
+            encoded = {}
+            for peer_id, dealer in self.dealer_sockets.items():
+                if peer_id in self._hello_replies_pending:
+                    # The peer (re)started and asked what we can read. Replied from here so only this thread sends
+                    dealer.send_multipart(wire_format.encode_hello(self.store_id, reply_requested = False))
+                    self._hello_replies_pending.discard(peer_id)
+                if not prices:
+                    continue
+                peer_format = self.peer_formats.get(peer_id)
+                if peer_format not in encoded:
+                    if peer_format:
+                        encoded[peer_format] = wire_format.encode_prices(prices, *peer_format)
+                    else:
+                        encoded[peer_format] = [json.dumps(prices).encode("utf-8")]
+                dealer.send_multipart(encoded[peer_format], copy = False)
+
             if prices:
-                msg = json.dumps(prices)
-                self.push_socket.send_string(msg)
-                self.log_callback(f"Sent price update for {len(prices)} items -> {msg}", "sent")
+                self.log_callback(f"Sent price update for {len(prices)} items to {len(self.dealer_sockets)} stores", "sent")
             else:
                 self.log_callback("No recent item updates to send.", "sent")
         except zmq.error.ZMQError as e:
@@ -122,14 +253,19 @@ class NetworkManager:
     def shutdown(self):
         """Shuts down ZeroMQ sockets and context."""
         print("[NetworkManager] Shutting down...")
+        if not self.running:
+            return
         self.running = False
         if self.receiver_thread and self.receiver_thread.is_alive():
+            self.control_socket.send(b"STOP")
             self.receiver_thread.join(timeout = 1) # Give thread a moment to finish
 
-        if self.push_socket:
-            self.push_socket.close()
-        if self.pull_socket:
-            self.pull_socket.close()
+        for dealer in self.dealer_sockets.values():
+            dealer.close()
+        if self.router_socket:
+            self.router_socket.close()
+        if self.control_socket:
+            self.control_socket.close()
         self.context.term()
         print("[NetworkManager] Shut down complete.")
 
@@ -0,0 +1,89 @@
+import time
+from PIL import Image, ImageTk
+
+import metrics
+from capture_module import PREVIEW_MAX_FPS
+
+PREVIEW_MIN_FPS = 5
+DEFAULT_BOX = (640, 480) # Used until the container has been laid out
+UI_SHARE = 0.25 # Rendering may use at most this fraction of the Tk thread before frames are skipped
+SMOOTHING = 0.2
+
+
+class PreviewRenderer:
+    def __init__(self, root, label, capture_module, max_fps = PREVIEW_MAX_FPS, min_fps = PREVIEW_MIN_FPS):
+        """
+        Shows the camera preview in a Tk label. The capture thread fits frames to the label's container and converts
+        them to RGB (CaptureModule.configure_preview); each tick here only pastes the newest one into a
+        single PhotoImage that is reused for as long as the preview size stays the same.
+        :param max_fps: Cap on preview frames per second.
+        :param min_fps: Floor the rate backs off to when rendering takes more than UI_SHARE of the Tk thread.
+        """
+        self.root = root
+        self.label = label
+        self.capture_module = capture_module
+        self.min_interval = 1 / max_fps
+        self.max_interval = 1 / min_fps
+        self.interval = self.min_interval
+        self.photo = None
+        self.photo_size = None
+        self.sequence = 0
+        self.render_seconds = 0.0 # Smoothed time of one paste
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+        self.running = True
+
+        self.capture_module.configure_preview(DEFAULT_BOX, max_fps)
+        self.label.master.bind("<Configure>", self._on_configure)
+        self.root.after(0, self._tick)
+
+    def _on_configure(self, event):
+        """ Caches the container's size, less the label's border, as the preview box; the only place widget sizes are read. """
+        inset = 2 * (int(self.label.cget("borderwidth")) + int(self.label.cget("highlightthickness")))
+        width = event.width - inset - 2 * int(self.label.cget("padx"))
+        height = event.height - inset - 2 * int(self.label.cget("pady"))
+        if width > 1 and height > 1 and (width, height) != self.capture_module.preview_box:
+            self.capture_module.configure_preview((width, height), 1 / self.min_interval)
+
+    def _tick(self):
+        if not self.running:
+            return
+        sequence, rgb = self.capture_module.latest_preview()
+        if rgb is not None and sequence != self.sequence:
+            if self.sequence:
+                skipped = max(sequence - self.sequence - 1, 0)
+                self.frames_skipped += skipped
+                metrics.count("preview_frames_skipped", skipped, "Captured frames the preview never showed")
+            self.sequence = sequence
+            start = time.perf_counter()
+            with metrics.timer("preview_render_seconds", "Pasting one preview frame into the Tk label"):
+                self.render(rgb)
+            self.render_seconds += SMOOTHING * (time.perf_counter() - start - self.render_seconds)
+            self.frames_rendered += 1
+            # Back off while a paste costs more than UI_SHARE of the frame budget, recover once it is cheap again
+            self.interval = min(max(self.render_seconds / UI_SHARE, self.min_interval), self.max_interval)
+        self.root.after(int(1000 * self.interval), self._tick)
+
+    def render(self, rgb):
+        """ Pastes an RGB array into the label's PhotoImage, creating a new one only when the size changes. """
+        height, width = rgb.shape[:2]
+        image = Image.frombuffer("RGB", (width, height), rgb, "raw", "RGB", 0, 1)
+        if self.photo_size != (width, height):
+            self.photo = ImageTk.PhotoImage(image)
+            self.photo_size = (width, height)
+            self.label.configure(image = self.photo)
+        else:
+            self.photo.paste(image)
+
+    def stats(self):
+        """ {"rendered", "skipped", "render_ms", "fps_cap"} for the log or a benchmark. """
+        return {
+            "rendered": self.frames_rendered,
+            "skipped": self.frames_skipped,
+            "render_ms": 1000 * self.render_seconds,
+            "fps_cap": 1 / self.interval
+        }
+
+    def stop(self):
+        self.running = False
+        self.capture_module.configure_preview(None)
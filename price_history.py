@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+RECENT_CAPACITY = 16 # Raw price points kept per item; the dashboard plots the last 10
+BUCKET_SECONDS = 3600 # Width of one OHLC rollup bucket
+QUERY_BATCH = 500 # Barcodes per IN (...) query; SQLite allows at most 999 parameters in older builds
+
+
+class PriceRing:
+    """ Fixed-capacity ring of (time, price) points backed by two float arrays. """
+    __slots__ = ("times", "prices", "start", "size")
+
+    def __init__(self, capacity = RECENT_CAPACITY):
+        self.times = array("d", bytes(8 * capacity))
+        self.prices = array("d", bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+
+    def append(self, timestamp, price):
+        capacity = len(self.prices)
+        index = (self.start + self.size) % capacity
+        self.times[index] = timestamp
+        self.prices[index] = price
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def last(self, n):
+        """ The newest n prices, oldest first. """
+        n = min(n, self.size)
+        capacity = len(self.prices)
+        first = self.start + self.size - n
+        return [self.prices[(first + offset) % capacity] for offset in range(n)]
+
+    def points(self):
+        capacity = len(self.prices)
+        return [(self.times[(self.start + offset) % capacity], self.prices[(self.start + offset) % capacity]) for offset in range(self.size)]
+
+
+class HistoryStore:
+    def __init__(self, filepath, capacity = RECENT_CAPACITY, bucket_seconds = BUCKET_SECONDS):
+        """
+        Price history kept out of the item records. The newest capacity points of each item stay in an
+        in-memory ring (persisted in the points table, trimmed on flush); every point is also folded into
+        an open/high/low/close rollup per bucket_seconds, so the full history costs one row per item per bucket.
+        An item's ring is read from the points table the first time the item's history is used, so opening the
+        store costs nothing per item.
+        Appends are buffered in memory and written by flush(), which ItemDataManager calls on every save.
+        """
+        self.filepath = filepath
+        self.capacity = capacity
+        self.bucket_seconds = bucket_seconds
+        self.lock = threading.Lock()
+        self.rings = {} # barcode -> PriceRing, or None for an item looked up that has no points
+        self.pending = []
+        self.conn = sqlite3.connect(filepath, check_same_thread = False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS points (barcode TEXT NOT NULL, ts REAL NOT NULL, price REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS points_barcode ON points (barcode)")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS rollups (
+                                 barcode TEXT NOT NULL, bucket REAL NOT NULL,
+                                 open REAL NOT NULL, high REAL NOT NULL, low REAL NOT NULL, close REAL NOT NULL, count INTEGER NOT NULL,
+                                 PRIMARY KEY (barcode, bucket))""")
+
+    def _ring(self, barcode):
+        """
+        The item's ring, read from the points table (plus any points not flushed yet) on first use;
+        None if the item has no points. Call with the lock held.
+        """
+        try:
+            return self.rings[barcode]
+        except KeyError:
+            pass
+        rows = self.conn.execute("SELECT ts, price FROM points WHERE barcode = ? ORDER BY rowid DESC LIMIT ?", (barcode, self.capacity)).fetchall()
+        rows.reverse()
+        rows += [(timestamp, price) for pending_barcode, timestamp, price in self.pending if pending_barcode == barcode]
+        ring = None
+        if rows:
+            ring = PriceRing(self.capacity)
+            for timestamp, price in rows:
+                ring.append(timestamp, price)
+        self.rings[barcode] = ring
+        return ring
+
+    def append(self, barcode, price, timestamp = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            if barcode in self.rings: # A ring not read in yet picks the point up from pending when it is (see _ring)
+                ring = self.rings[barcode]
+                if ring is None:
+                    ring = self.rings[barcode] = PriceRing(self.capacity)
+                ring.append(timestamp, price)
+            self.pending.append((barcode, timestamp, price))
+
+    def has_history(self, barcode):
+        with self.lock:
+            ring = self._ring(barcode)
+            return ring is not None and ring.size > 0
+
+    def last_price(self, barcode):
+        with self.lock:
+            ring = self._ring(barcode)
+            return ring.last(1)[0] if ring is not None and ring.size else None
+
+    def last_prices(self, barcodes):
+        """ {barcode: newest price} for those of the items that have history, in a few queries and without reading their rings in. """
+        with self.lock:
+            prices = {}
+            unread = []
+            for barcode in barcodes:
+                if barcode not in self.rings:
+                    unread.append(barcode)
+                elif self.rings[barcode] is not None and self.rings[barcode].size:
+                    prices[barcode] = self.rings[barcode].last(1)[0]
+            for start in range(0, len(unread), QUERY_BATCH):
+                batch = unread[start:start + QUERY_BATCH]
+                prices.update(self.conn.execute(
+                    f"""SELECT barcode, price FROM points WHERE rowid IN (
+                            SELECT MAX(rowid) FROM points WHERE barcode IN ({",".join("?" * len(batch))}) GROUP BY barcode)""", batch))
+            if self.pending and unread:
+                unread = set(unread)
+                prices.update((barcode, price) for barcode, _, price in self.pending if barcode in unread)
+            return prices
+
+    def recent(self, barcode, n = 10):
+        """ The newest n prices of an item, oldest first. """
+        with self.lock:
+            ring = self._ring(barcode)
+            return ring.last(n) if ring is not None else []
+
+    def mark(self):
+        """ A point in the append buffer to go back to with discard_since, valid until the next flush. """
+        with self.lock:
+            return len(self.pending)
+
+    def discard_since(self, mark):
+        """ Drops the points appended after mark; their items' rings are read again (from the table and buffer) on next use. """
+        with self.lock:
+            discarded, self.pending = self.pending[mark:], self.pending[:mark]
+            for barcode in {barcode for barcode, _, _ in discarded}:
+                self.rings.pop(barcode, None)
+
+    def flush(self):
+        """ Writes buffered points and their rollups in one transaction, then trims each touched item to capacity. """
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, []
+            try:
+                with self.conn:
+                    self.conn.executemany("INSERT INTO points (barcode, ts, price) VALUES (?, ?, ?)", pending)
+                    self.conn.executemany(
+                        """INSERT INTO rollups (barcode, bucket, open, high, low, close, count) VALUES (?, ?, ?, ?, ?, ?, 1)
+                           ON CONFLICT (barcode, bucket) DO UPDATE SET
+                               high = MAX(high, excluded.high), low = MIN(low, excluded.low), close = excluded.close, count = count + 1""",
+                        [(barcode, timestamp - timestamp % self.bucket_seconds, price, price, price, price) for barcode, timestamp, price in pending]
+                    )
+                    self.conn.executemany(
+                        """DELETE FROM points WHERE barcode = ? AND rowid <= (
+                               SELECT rowid FROM points WHERE barcode = ? ORDER BY rowid DESC LIMIT 1 OFFSET ?)""",
+                        [(barcode, barcode, self.capacity) for barcode in {barcode for barcode, _, _ in pending}]
+                    )
+            except sqlite3.Error:
+                self.pending = pending + self.pending
+                raise
+
+    def rollups(self, barcode, start = None, end = None):
+        """ [(bucket_start, open, high, low, close, count)] for buckets starting in [start, end), oldest first. """
+        self.flush()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT bucket, open, high, low, close, count FROM rollups WHERE barcode = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (barcode, float("-inf") if start is None else start - start % self.bucket_seconds, float("inf") if end is None else end)
+            )
+            return rows.fetchall()
+
+    def clear(self):
+        """ Drops all history, recent points and rollups. """
+        with self.lock:
+            self.rings.clear()
+            self.pending = []
+            with self.conn:
+                self.conn.execute("DELETE FROM points")
+                self.conn.execute("DELETE FROM rollups")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def history_path_for(catalog_path):
+    """ Default history file next to the catalog: items.json -> items_history.db """
+    return os.path.splitext(catalog_path)[0] + "_history.db"
@@ -0,0 +1,93 @@
+import json
+import os
+
+import numpy as np
+
+BLS_WEIGHT = 0.30
+DEMAND_WEIGHT = 0.70
+STEP_UNITS = 5 # Units sold per demand step
+STEP_INCREASE = 0.01 # Demand price increase per step (1%)
+DECAY_FACTOR = 0.9 # Demand price multiplier per day without sales
+PRICING_RULES_FILE = "pricing_rules.json"
+
+
+class PricingRule:
+    def __init__(self, step_units = STEP_UNITS, step_increase = STEP_INCREASE, bls_weight = BLS_WEIGHT,
+                 demand_weight = DEMAND_WEIGHT, decay_factor = DECAY_FACTOR):
+        """
+        The demand pricing parameters for one item category.
+        current_price = base_price * bls_weight + demand_price * demand_weight, where demand_price rises by
+        step_increase for every step_units sold and is multiplied by decay_factor on a day without sales.
+        """
+        self.step_units = step_units
+        self.step_increase = step_increase
+        self.bls_weight = bls_weight
+        self.demand_weight = demand_weight
+        self.decay_factor = decay_factor
+
+    def blend(self, base_price, demand_price):
+        return (base_price * self.bls_weight) + (demand_price * self.demand_weight)
+
+
+class PricingRules:
+    FIELDS = ("step_units", "step_increase", "bls_weight", "demand_weight", "decay_factor")
+
+    def __init__(self, default = None, categories = None):
+        """
+        Maps an item's "category" field to its PricingRule; items without one (or with an unknown one) use default.
+        The array methods take one row per item and apply every row's own rule in one NumPy pass.
+        """
+        self.default = default if default else PricingRule()
+        self.categories = categories if categories else {}
+
+    @classmethod
+    def load(cls, path = PRICING_RULES_FILE):
+        """
+        Reads {"default": {...}, "categories": {"produce": {"decay_factor": 0.8}, ...}} where every object holds
+        any of the PricingRule fields. Category rules start from the default rule. A missing file gives the built-in rule.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r") as file:
+            config = json.load(file)
+        default = PricingRule(**config.get("default", {}))
+        categories = {}
+        for category, overrides in config.get("categories", {}).items():
+            fields = {field: getattr(default, field) for field in cls.FIELDS}
+            fields.update(overrides)
+            categories[category] = PricingRule(**fields)
+        print(f"[PricingRules] Loaded {len(categories)} category rules from {path}.")
+        return cls(default, categories)
+
+    def rule_for(self, item):
+        return self.categories.get(item.get("category"), self.default)
+
+    def parameters(self, items):
+        """
+        {field: value} for the given items, in order. Each value is an array with one entry per item, or a
+        plain number when every item uses the default rule (NumPy broadcasts it).
+        """
+        if not self.categories:
+            return {field: getattr(self.default, field) for field in self.FIELDS}
+        rules = [self.rule_for(item) for item in items]
+        return {field: np.array([getattr(rule, field) for rule in rules]) for field in self.FIELDS}
+
+    def apply_purchases(self, meter, quantity, demand, base, parameters):
+        """
+        Closed form of "every step_units sold raises demand by step_increase": with steps = (meter + quantity) // step_units,
+        demand * (1 + step_increase) ** steps. Matches repeated multiplication up to float rounding.
+        Returns (steps, new_meter, new_demand, new_current) arrays; new_current is only meaningful where steps > 0.
+        """
+        total = meter + quantity
+        steps = total // parameters["step_units"]
+        new_meter = total - steps * parameters["step_units"]
+        new_demand = demand * (1 + parameters["step_increase"]) ** steps
+        new_current = (base * parameters["bls_weight"]) + (new_demand * parameters["demand_weight"])
+        return steps, new_meter, new_demand, new_current
+
+    def decay(self, demand, base, parameters):
+        """ One day of decay: demand * decay_factor, floored at base. Returns (new_demand, new_current) arrays. """
+        new_demand = demand * parameters["decay_factor"]
+        new_demand = np.where(new_demand < base, base, new_demand) # Don't decrease below base price
+        new_current = (base * parameters["bls_weight"]) + (new_demand * parameters["demand_weight"])
+        return new_demand, new_current
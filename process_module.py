@@ -1,8 +1,10 @@
 import json
-from datetime import datetime
+import time
 
-BLS_WEIGHT = 0.30
-DEMAND_WEIGHT = 0.70
+import numpy as np
+
+import metrics
+from item_catalog import to_epoch
 
 class ItemProcessor:
     def __init__(self, item_data_manager, log_callback=None):
@@ -27,42 +29,59 @@ class ItemProcessor:
         print(f"[ItemProcessor] Organized transaction: {result}")
         return result
 
-    def adjust_price(self, item_count):
-        """ Adjusts the price of the items based on the quantity bought and updates last_purchased/updated. """
+    def adjust_price(self, item_count, persist=True):
+        """
+        Adjusts the price of the items based on the quantity bought and updates last_purchased/updated.
+        :param persist: Save afterwards. TransactionQueue passes False and saves once per group of transactions.
+        """
         items_data = self.item_data_manager.items
+        rules = self.item_data_manager.pricing_rules
 
-        for barcode, details in item_count.items():
-            if barcode in items_data:
-                item = items_data[barcode]
-                original_price = items_data[barcode]["current_price"]
-                current_meter = item.get("meter", 0)
-                new_meter = current_meter + details["quantity"]
-
-                if "history" not in item or not item["history"]:
+        for barcode in item_count:
+            if barcode not in items_data:
+                print(f"[ItemProcessor] Warning: Barcode '{barcode}' not found in item data for price adjustment.")
+        barcodes = [barcode for barcode in item_count if barcode in items_data]
+        if barcodes:
+            # Every line item of the transaction is priced in one pass, each with its category's rule
+            items = [items_data[barcode] for barcode in barcodes]
+            meter = np.array([item.get("meter", 0) for item in items])
+            quantity = np.array([item_count[barcode]["quantity"] for barcode in barcodes])
+            base = np.array([float(item.get("base_price", item.get("current_price", 0))) for item in items])
+            demand = np.array([float(item.get("demand_price", item.get("base_price", 0))) for item in items])
+            steps, new_meter, new_demand, new_current = rules.apply_purchases(meter, quantity, demand, base, rules.parameters(items))
+
+            now = time.time()
+            for barcode, item, row_steps, row_meter, row_demand, row_current in zip(
+                    barcodes, items, steps.tolist(), new_meter.tolist(), new_demand.tolist(), new_current.tolist()):
+                original_price = item["current_price"]
+
+                if not self.item_data_manager.history.has_history(barcode):
                     base_price = item.get("base_price", item.get("current_price", 0))
-                    item["history"] = [round(base_price, 2)]
-
-                while new_meter >= 5:
-                    new_meter -= 5
-                    # Increase demand_price by 1%
-                    items_data[barcode]["demand_price"] *= 1.01
-                    items_data[barcode]["current_price"] = (items_data[barcode]["base_price"] * BLS_WEIGHT) + (items_data[barcode]["demand_price"] * DEMAND_WEIGHT)
-                    items_data[barcode]["last_updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                item["history"].append(round(item["current_price"], 2))
-                item["meter"] = new_meter
-                item["last_purchased"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    self.item_data_manager.record_price(barcode, round(base_price, 2))
+
+                if row_steps > 0:
+                    item["demand_price"] = row_demand
+                    item["current_price"] = row_current
+                    item["last_updated"] = now
+
+                if item["current_price"] != original_price:
+                    self.item_data_manager.record_local_change(barcode)
+                self.item_data_manager.record_price(barcode, round(item["current_price"], 2))
+                item["meter"] = row_meter
+                self.item_data_manager.record_purchase(barcode, item_count[barcode]["quantity"])
+                item["last_purchased"] = now
                 self.log_callback(f"Adjusted price for {barcode}. Old price: {original_price:.2f}, New price: {item['current_price']:.2f}", "process")
 
-            else:
-                print(f"[ItemProcessor] Warning: Barcode '{barcode}' not found in item data for price adjustment.")
-
-        self.item_data_manager.save_items_to_json()
+        if persist:
+            self.item_data_manager.save_items_to_json()
 
-    def process_pipeline(self, items_list):
+    @metrics.timed("process_pipeline_seconds", "Pricing one transaction (including its save unless group-committed)")
+    def process_pipeline(self, items_list, persist=True):
         """ Processes a list of scanned items (barcodes) through organization and price adjustment. """
+        metrics.count("transactions_total", 1, "Transactions priced")
+        metrics.count("transaction_items_total", len(items_list), "Scanned units priced")
         item_count = self.organize(items_list)
-        self.adjust_price(item_count)
+        self.adjust_price(item_count, persist)
 
     def reset_history(self):
         """
@@ -70,58 +89,90 @@ class ItemProcessor:
         """
         items_data = self.item_data_manager.items
 
+        self.item_data_manager.history.clear()
         for item in items_data.values():
-            item["history"] = []
             item["current_price"] = item.get("base_price", item.get("current_price", 0))
 
         self.item_data_manager.save_items_to_json()
         print("Successfully reset item histories.")
 
+    def _decay_columns(self, items_data, since_timestamp):
+        """
+        Copies the pricing columns of the catalog (see item_catalog.CompactCatalog) into NumPy arrays for decay_prices.
+        Returns (barcodes, base, demand, current, eligible) indexed by catalog row, where eligible marks items with all
+        three prices and a parseable last_purchased older than since_timestamp, plus skipped-item counts.
+        """
+        items_data.load_all() # Decay covers every item, including those still on disk
+        barcodes = items_data.row_barcodes()
+        base = np.array(items_data.float_column("base_price"))
+        demand = np.array(items_data.float_column("demand_price"))
+        current = np.array(items_data.float_column("current_price"))
+        last_purchased = np.array(items_data.float_column("last_purchased"))
+        live = np.array([barcode is not None for barcode in barcodes], dtype=bool)
+        priced = ~(np.isnan(base) | np.isnan(demand) | np.isnan(current))
+
+        # Values the catalog could not keep in the float column (unparseable strings, None, "") sit in the row's extras
+        missing, unparseable = 0, 0
+        held = np.zeros(len(barcodes), dtype=bool)
+        for row, extras in enumerate(items_data.extras):
+            if extras is None or "last_purchased" not in extras:
+                continue
+            held[row] = True
+            if not extras["last_purchased"]:
+                missing += 1
+            elif priced[row]:
+                try:
+                    last_purchased[row] = to_epoch(extras["last_purchased"])
+                except (TypeError, ValueError):
+                    unparseable += 1
+        unset = live & (np.isnan(last_purchased) | (last_purchased == 0))
+        missing += int(np.count_nonzero(unset & ~held))
+        # Check if it's been at least 1 day since last purchase
+        eligible = live & priced & ~unset & (last_purchased < since_timestamp)
+        return barcodes, base, demand, current, eligible, missing, unparseable
+
+    @metrics.timed("decay_prices_seconds", "One decay pass over the catalog")
     def decay_prices(self, since_timestamp):
-        """ Decays the prices of items that have not been purchased in the last day and updates price history. """
+        """
+        Decays the prices of items that have not been purchased in the last day and updates price history.
+        The decay itself is one masked NumPy operation over all items; results match the per-item rule
+        (demand * decay_factor, floored at base, then re-weighted; see pricing_rules.py) bit for bit.
+        Logs one summary and saves once.
+        """
         items_data = self.item_data_manager.items
 
         print("[ItemProcessor] Starting price decay process...")
         try:
-            for barcode, details in items_data.items():
-                if "last_purchased" in details and details["last_purchased"]:
-                    try:
-                        last_purchased = datetime.strptime(details["last_purchased"], "%Y-%m-%d %H:%M:%S")
-                        # Check if it's been at least 1 day since last purchase
-                        if last_purchased.timestamp() < since_timestamp:
-                            if "demand_price" in details and "base_price" in details and "current_price" in details:
-                                current_price = float(details["current_price"])
-                                original_price = current_price
-                                demand_price = float(details["demand_price"])
-                                base_price = float(details["base_price"])
-
-                                demand_price *= 0.9 # Decrease  demand price by 10%
-                                if demand_price < base_price:
-                                    demand_price = base_price # Don't decrease below base price
-                                
-                                current_price = (base_price * BLS_WEIGHT) + (demand_price * DEMAND_WEIGHT)
-
-                                details["demand_price"] = demand_price
-                                details["current_price"] = current_price
-                                details["last_updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                self.log_callback(f"Decayed price for {barcode}. Old price: {original_price:.2f}, Decayed price: {current_price:.2f}", "process")
-
-                                # Append the new decayed price to history only if it changed
-                                if "history" not in details or not isinstance(details["history"], list):
-                                    details["history"] = []
-
-                                if not details["history"] or details["history"][-1] != details["current_price"]:
-                                    details["history"].append(details["current_price"])
-                                else:
-                                    print(f"[ItemProcessor] Price for {barcode} unchanged since last history entry; not appending.")
-                    except ValueError:
-                        print(f"[ItemProcessor] Warning: Could not parse 'last_purchased' date for barcode {barcode}.")
-                else:
-                    print(f"[ItemProcessor] Warning: 'last_purchased' not found or empty for barcode {barcode}. Skipping decay.")
+            with self.item_data_manager.lock:
+                barcodes, base, demand, current, eligible, missing, unparseable = self._decay_columns(items_data, since_timestamp)
+                rows = np.flatnonzero(eligible)
+
+                rules = self.item_data_manager.pricing_rules
+                parameters = rules.parameters([items_data[barcodes[row]] for row in rows.tolist()])
+                decayed_demand, decayed_current = rules.decay(demand[rows], base[rows], parameters)
+
+                now = time.time()
+                last_prices = self.item_data_manager.history.last_prices([barcodes[row] for row in rows.tolist()])
+                for row, new_demand, new_current in zip(rows.tolist(), decayed_demand.tolist(), decayed_current.tolist()):
+                    barcode = barcodes[row]
+                    details = items_data[barcode]
+                    details["demand_price"] = new_demand
+                    details["current_price"] = new_current
+                    details["last_updated"] = now
+                    self.item_data_manager.record_local_change(barcode)
+
+                    # Append the new decayed price to history only if it changed
+                    if last_prices.get(barcode) != new_current:
+                        self.item_data_manager.record_price(barcode, new_current)
+
+            if missing or unparseable:
+                print(f"[ItemProcessor] Warning: skipped {missing} items without 'last_purchased' and {unparseable} with an unparseable date.")
 
             self.item_data_manager.save_items_to_json()
+            if len(rows):
+                dropped = current[rows] - decayed_current
+                self.log_callback(f"Decayed {len(rows)} prices (largest drop {dropped.max():.2f}, average drop {dropped.mean():.2f}).", "process")
             self.log_callback("Price decay process completed.", "process")
 
         except Exception as e:
             print(f"[ItemProcessor] An error occurred during price decay: {e}")
-
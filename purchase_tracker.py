@@ -0,0 +1,170 @@
+import heapq
+import time
+
+WINDOW_BUCKETS = 12 # Resolution of the sliding windows: counts expire one bucket (window / 12) at a time
+
+
+class WindowCounter:
+    def __init__(self, window_seconds, buckets = WINDOW_BUCKETS, clock = time.time):
+        """
+        Per-item purchase counts over the last window_seconds, kept as a ring of buckets.
+        Adding is O(1); a bucket is cleared when the ring wraps onto it, so old purchases fall out without a scan.
+        """
+        self.window_seconds = window_seconds
+        self.bucket_seconds = window_seconds / buckets
+        self.clock = clock
+        self.buckets = [{} for _ in range(buckets)]
+        self.bucket_ids = [None] * buckets
+        self.totals = {} # barcode -> count over the live buckets
+
+    def _advance(self, now):
+        """ Drops buckets older than the window and returns the bucket for now. """
+        bucket_id = int(now // self.bucket_seconds)
+        oldest_live = bucket_id - len(self.buckets) + 1
+        for slot, slot_id in enumerate(self.bucket_ids):
+            if slot_id is not None and slot_id < oldest_live:
+                self._expire(slot)
+        slot = bucket_id % len(self.buckets)
+        if self.bucket_ids[slot] != bucket_id:
+            self._expire(slot)
+            self.bucket_ids[slot] = bucket_id
+        return self.buckets[slot]
+
+    def _expire(self, slot):
+        for barcode, count in self.buckets[slot].items():
+            remaining = self.totals[barcode] - count
+            if remaining:
+                self.totals[barcode] = remaining
+            else:
+                del self.totals[barcode]
+        self.buckets[slot] = {}
+        self.bucket_ids[slot] = None
+
+    def add(self, barcode, quantity = 1, now = None):
+        bucket = self._advance(self.clock() if now is None else now)
+        bucket[barcode] = bucket.get(barcode, 0) + quantity
+        self.totals[barcode] = self.totals.get(barcode, 0) + quantity
+
+    def remove(self, barcode, quantity):
+        """ Takes back the item's last quantity purchases, newest bucket first. """
+        slots = sorted((slot for slot, bucket_id in enumerate(self.bucket_ids) if bucket_id is not None),
+                       key = lambda slot: self.bucket_ids[slot], reverse = True)
+        for slot in slots:
+            bucket = self.buckets[slot]
+            taken = min(bucket.get(barcode, 0), quantity)
+            if not taken:
+                continue
+            if bucket[barcode] == taken:
+                del bucket[barcode]
+            else:
+                bucket[barcode] -= taken
+            if self.totals[barcode] == taken:
+                del self.totals[barcode]
+            else:
+                self.totals[barcode] -= taken
+            quantity -= taken
+            if not quantity:
+                return
+
+    def discard(self, barcode):
+        """ Drops every purchase of the item from the window. """
+        if self.totals.pop(barcode, None) is None:
+            return
+        for bucket in self.buckets:
+            bucket.pop(barcode, None)
+
+    def count(self, barcode, now = None):
+        self._advance(self.clock() if now is None else now)
+        return self.totals.get(barcode, 0)
+
+    def top(self, k, now = None):
+        """ The k items bought most within the window, as [(barcode, count)], best first. Only items bought in the window are looked at. """
+        self._advance(self.clock() if now is None else now)
+        return heapq.nlargest(k, self.totals.items(), key = lambda entry: entry[1])
+
+
+class PurchaseTracker:
+    def __init__(self, k = 5, clock = time.time):
+        """
+        All-time purchase counts per item with the top k kept up to date as purchases come in,
+        plus optional sliding windows (see add_window).
+        :param k: Size of the maintained best-seller list; top(n) for n <= k costs O(k).
+        """
+        self.k = k
+        self.clock = clock
+        self.counts = {}
+        self.leaders = {} # The current top k: barcode -> count
+        self.windows = {}
+
+    def add_window(self, name, window_seconds, buckets = WINDOW_BUCKETS):
+        """ Also counts purchases over the last window_seconds, queried with top(n, window=name). """
+        self.windows[name] = WindowCounter(window_seconds, buckets, self.clock)
+
+    def load(self, counts):
+        """ Seeds the all-time counts, e.g. from the total_bought fields of a loaded catalog. """
+        self.counts = {barcode: count for barcode, count in counts.items() if count}
+        self._rebuild_leaders()
+
+    def _rebuild_leaders(self):
+        self.leaders = dict(heapq.nlargest(self.k, self.counts.items(), key = lambda entry: entry[1]))
+
+    def record(self, barcode, quantity = 1):
+        """ Counts a purchase and returns the item's new all-time total. """
+        count = self.counts.get(barcode, 0) + quantity
+        self.counts[barcode] = count
+        if barcode in self.leaders or len(self.leaders) < self.k:
+            self.leaders[barcode] = count
+        else:
+            lowest = min(self.leaders, key = self.leaders.get)
+            if count > self.leaders[lowest]:
+                del self.leaders[lowest]
+                self.leaders[barcode] = count
+        now = self.clock()
+        for window in self.windows.values():
+            window.add(barcode, quantity, now)
+        return count
+
+    def undo(self, barcode, quantity):
+        """ Takes back the item's last quantity purchases, e.g. those of a transaction that failed halfway. """
+        count = self.counts.get(barcode, 0) - quantity
+        if count > 0:
+            self.counts[barcode] = count
+        else:
+            self.counts.pop(barcode, None)
+        if barcode in self.leaders:
+            self._rebuild_leaders()
+        for window in self.windows.values():
+            window.remove(barcode, quantity)
+
+    def forget(self, barcode):
+        """ Drops a deleted item from the counts and the windows. """
+        self.counts.pop(barcode, None)
+        if barcode in self.leaders:
+            self._rebuild_leaders()
+        for window in self.windows.values():
+            window.discard(barcode)
+
+    def total(self, barcode, window = None):
+        if window is not None:
+            return self.windows[window].count(barcode)
+        return self.counts.get(barcode, 0)
+
+    def top(self, n = None, window = None):
+        """ The n best-selling items as [(barcode, count)], best first, all-time or within the named window. """
+        n = self.k if n is None else n
+        if window is not None:
+            return self.windows[window].top(n)
+        if n > self.k:
+            return heapq.nlargest(n, self.counts.items(), key = lambda entry: entry[1])
+        return sorted(self.leaders.items(), key = lambda entry: entry[1], reverse = True)[:n]
+
+    def ranked(self):
+        """
+        Yields every counted item as (barcode, count), best first. The counts are heapified and popped one at a time,
+        so a caller that stops after n items pays O(len(counts) + n log len(counts)) instead of a full sort.
+        """
+        heap = [(-count, barcode) for barcode, count in self.counts.items()]
+        heapq.heapify(heap)
+        while heap:
+            count, barcode = heapq.heappop(heap)
+            yield barcode, -count
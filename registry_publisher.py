@@ -0,0 +1,137 @@
+import json
+import os
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+REGISTRY_URL = "https://aloft.pythonanywhere.com"
+BATCH_SIZE = 500 # Items per POST
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 1.0 # Doubles after every failed attempt
+REQUEST_TIMEOUT = 10 # seconds
+OUTBOX_FILE = "registry_outbox.jsonl"
+
+class RegistryPublisher:
+    def __init__(self, base_url = REGISTRY_URL, store_name = "STORE2", store_ip = "2.2.2", store_country = "USA",
+                 password = "password", batch_size = BATCH_SIZE, max_retries = MAX_RETRIES,
+                 backoff_seconds = BACKOFF_SECONDS, outbox_path = OUTBOX_FILE, log_callback = None):
+        """
+        Publishes changed item prices to the central store registry from a background thread.
+        Items are posted in batches to /submit_batch over one keep-alive session; a batch that still
+        fails after max_retries is appended to the outbox file and retried on the next publish or restart.
+        :param base_url: Registry root; point it at a local flask_app instance for offline runs.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.store_fields = {"storename": store_name, "storeIP": store_ip, "storeCo": store_country, "password": password}
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.outbox_path = outbox_path
+        self.log_callback = log_callback if log_callback else self._default_log
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections = 1, pool_maxsize = 4))
+        self.session.mount("https://", HTTPAdapter(pool_connections = 1, pool_maxsize = 4))
+
+        self.jobs = queue.Queue()
+        self.running = False
+        self.worker_thread = None
+
+    def _default_log(self, message, log_type="info"):
+        """Default logging if no callback is provided."""
+        print(f"[{log_type.upper()}] {message}")
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.worker_thread = threading.Thread(target = self._run, daemon = True)
+        self.worker_thread.start()
+
+    def stop(self, timeout = 5):
+        """ Lets queued batches finish (up to timeout), then stops the worker and closes the session. """
+        if not self.running:
+            return
+        self.jobs.put(None)
+        self.worker_thread.join(timeout = timeout)
+        self.running = False
+        self.session.close()
+
+    def publish(self, prices):
+        """
+        Queues {item_id: {"current_price": price, ...}} for publishing and returns immediately.
+        Only pass the items that changed; the registry already has everything else.
+        """
+        if not prices:
+            return
+        items = [f"{item_id} : {info['current_price']}" for item_id, info in prices.items()]
+        for start in range(0, len(items), self.batch_size):
+            self.jobs.put(items[start:start + self.batch_size])
+
+    def _run(self):
+        self._retry_outbox()
+        while True:
+            batch = self.jobs.get()
+            if batch is None:
+                break
+            if not self._send_with_retries(batch):
+                self._append_to_outbox(batch)
+                continue
+            # The registry is reachable again, so earlier failures are worth another try
+            self._retry_outbox()
+
+    def _send_with_retries(self, batch):
+        delay = self.backoff_seconds
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                response = self.session.post(f"{self.base_url}/submit_batch",
+                                             json = dict(self.store_fields, items = batch), timeout = REQUEST_TIMEOUT)
+                response.raise_for_status()
+                self.log_callback(f"Published {len(batch)} items to the store registry.", "sent")
+                return True
+            except requests.RequestException as e:
+                print(f"[RegistryPublisher] Attempt {attempt}/{self.max_retries} to publish {len(batch)} items failed: {e}")
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+                    delay *= 2
+        return False
+
+    def _append_to_outbox(self, batch):
+        try:
+            with open(self.outbox_path, "a") as file:
+                file.write(json.dumps(batch) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            print(f"[RegistryPublisher] Saved {len(batch)} unpublished items to {self.outbox_path}.")
+        except IOError as e:
+            print(f"[RegistryPublisher] Error writing outbox {self.outbox_path}: {e}")
+
+    def _retry_outbox(self):
+        """
+        Re-sends batches left in the outbox. Only the worker thread touches the file, and it is
+        rewritten only after sending, so a crash mid-retry re-sends (the registry ignores duplicates)
+        rather than losing batches.
+        """
+        if not os.path.exists(self.outbox_path) or os.path.getsize(self.outbox_path) == 0:
+            return
+        batches = []
+        with open(self.outbox_path, "r") as file:
+            for line in file:
+                try:
+                    batches.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue # Torn line from a crash mid-append
+
+        print(f"[RegistryPublisher] Retrying {len(batches)} batches from {self.outbox_path}.")
+        remaining = []
+        for index, batch in enumerate(batches):
+            if not self._send_with_retries(batch):
+                remaining = batches[index:]
+                break
+
+        tmp_path = self.outbox_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.writelines(json.dumps(batch) + "\n" for batch in remaining)
+        os.replace(tmp_path, self.outbox_path)
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import item_data_manager
+from item_data_manager import ItemDataManager
+from item_store import atomic_write_json
+
+
+@pytest.fixture(autouse = True)
+def offline(tmp_path, monkeypatch):
+    """
+    Runs every test in its own directory with the BLS API replaced by the returned dict (series_id -> price),
+    so ItemDataManager never touches the network or the repository's items.json and bls_cache.json.
+    """
+    prices = {}
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(item_data_manager, "get_bls_data", lambda series_ids: [prices.get(series_id) for series_id in series_ids])
+    return prices
+
+
+@pytest.fixture
+def quiet():
+    """ A log_callback that drops every message. """
+    return lambda *args: None
+
+
+@pytest.fixture
+def make_manager(tmp_path, quiet):
+    """
+    Returns make(catalog, **options), which writes catalog (barcode -> item) to items.json in tmp_path and opens
+    an ItemDataManager on it that logs nowhere; options are passed on to ItemDataManager.
+    """
+    def make(catalog, **options):
+        path = str(tmp_path / "items.json")
+        atomic_write_json(path, catalog)
+        return ItemDataManager(path, quiet, **options)
+    return make
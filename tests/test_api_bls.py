@@ -0,0 +1,79 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api_BLS import BLSClient
+
+
+def series(series_id, value):
+    return {"seriesID": series_id, "data": [{"year": "2026", "period": "M02", "value": str(value)},
+                                            {"year": "2026", "period": "M01", "value": "0.01"}]}
+
+
+@pytest.fixture
+def bls_server():
+    """ Local stand-in for the BLS API answering every series with a price; records each request's series ids. """
+    requests_seen = []
+    state = {"fail": False}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            requests_seen.append(payload["seriesid"])
+            if state["fail"]:
+                self.send_response(500)
+                self.end_headers()
+                return
+            body = json.dumps({"Results": {"series": [series(sid, 1.0 + len(sid)) for sid in payload["seriesid"]]}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target = server.serve_forever, kwargs = {"poll_interval": 0.05}, daemon = True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/", requests_seen, state
+    server.shutdown()
+    server.server_close()
+
+
+def test_batches_and_caches(tmp_path, bls_server):
+    url, requests_seen, _ = bls_server
+    cache_path = str(tmp_path / "cache.json")
+    client = BLSClient(api_url = url, cache_path = cache_path, batch_size = 2)
+    ids = ["A", "BB", "CCC", "A", None]
+
+    assert client.get_latest_prices(ids) == {"A": 2.0, "BB": 3.0, "CCC": 4.0} # Newest data point, duplicates and None dropped
+    assert sorted(len(batch) for batch in requests_seen) == [1, 2]
+
+    # A second client reads the cache file and does not go to the network
+    assert BLSClient(api_url = url, cache_path = cache_path).get_latest_prices(ids) == {"A": 2.0, "BB": 3.0, "CCC": 4.0}
+    assert len(requests_seen) == 2
+
+
+def test_stale_cache_used_when_the_api_fails(tmp_path, bls_server):
+    url, requests_seen, state = bls_server
+    client = BLSClient(api_url = url, cache_path = str(tmp_path / "cache.json"), cache_ttl = 0)
+    assert client.get_latest_prices(["A"]) == {"A": 2.0}
+    state["fail"] = True
+    assert client.get_latest_prices(["A", "BB"]) == {"A": 2.0} # Expired but better than nothing; BB has no value at all
+    assert len(requests_seen) == 2
+
+
+def test_fixture_replay_and_record(tmp_path, bls_server):
+    url, requests_seen, _ = bls_server
+    fixture_path = str(tmp_path / "fixture.json")
+    recorder = BLSClient(api_url = url, cache_path = None, fixture_path = fixture_path, record = True)
+    assert recorder.get_latest_prices(["A", "BB"]) == {"A": 2.0, "BB": 3.0}
+
+    # Replaying never touches the network, even with an unreachable endpoint
+    replay = BLSClient(api_url = "http://127.0.0.1:9/", cache_path = None, fixture_path = fixture_path)
+    assert replay.get_latest_prices(["A", "BB", "CCC"]) == {"A": 2.0, "BB": 3.0}
+    assert len(requests_seen) == 1
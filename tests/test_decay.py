@@ -0,0 +1,72 @@
+import random
+import time
+from datetime import datetime
+
+import pytest
+
+from item_catalog import TIMESTAMP_FORMAT, to_epoch
+from pricing_rules import PricingRule, PricingRules
+from process_module import ItemProcessor
+
+RULES = PricingRules(categories = {"produce": PricingRule(decay_factor = 0.8),
+                                   "dairy": PricingRule(bls_weight = 0.5, demand_weight = 0.5, decay_factor = 0.95)})
+
+
+def random_catalog(rng, now):
+    """ Items with every combination of missing prices, missing or malformed timestamps and categories. """
+    catalog = {}
+    for index in range(rng.randint(0, 60)):
+        stamp = now - rng.uniform(0, 5 * 86400)
+        item = {"item_name": f"item {index}", "last_updated": stamp}
+        for field in ("base_price", "demand_price", "current_price"):
+            if rng.random() < 0.9:
+                item[field] = round(rng.uniform(0.5, 20.0), rng.choice([2, 6]))
+        item["last_purchased"] = rng.choice([stamp, stamp, stamp, datetime.fromtimestamp(stamp).strftime(TIMESTAMP_FORMAT),
+                                             "", None, 0, "yesterday"])
+        if rng.random() < 0.1:
+            del item["last_purchased"]
+        category = rng.choice([None, "produce", "dairy", "bakery"])
+        if category:
+            item["category"] = category
+        catalog[f"{index:04d}"] = item
+    return catalog
+
+
+def reference_decay(catalog, rules, since):
+    """ The per-item decay decay_prices replaced: {barcode: (demand_price, current_price)} for the items it changes. """
+    expected = {}
+    for barcode, details in catalog.items():
+        if not details.get("last_purchased"):
+            continue
+        try:
+            last_purchased = to_epoch(details["last_purchased"])
+        except ValueError:
+            continue
+        if last_purchased < since and all(field in details for field in ("demand_price", "base_price", "current_price")):
+            rule = rules.rule_for(details)
+            base_price = float(details["base_price"])
+            demand_price = float(details["demand_price"]) * rule.decay_factor
+            if demand_price < base_price:
+                demand_price = base_price
+            expected[barcode] = (demand_price, base_price * rule.bls_weight + demand_price * rule.demand_weight)
+    return expected
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_decay_matches_per_item_reference(make_manager, quiet, seed):
+    rng = random.Random(seed)
+    now = time.time()
+    catalog = random_catalog(rng, now)
+    manager = make_manager(catalog, pricing_rules = RULES, hot_window = 2 * 86400) # Leaves some items on disk
+    since = now - 86400
+
+    expected = reference_decay(catalog, RULES, since)
+    ItemProcessor(manager, log_callback = quiet).decay_prices(since)
+
+    for barcode, details in catalog.items():
+        item = manager.items[barcode]
+        if barcode in expected:
+            assert (item["demand_price"], item["current_price"]) == expected[barcode]
+        else:
+            assert item.get("current_price") == details.get("current_price")
+            assert item.get("demand_price") == details.get("demand_price")
@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+from item_data_manager import ItemDataManager
+from item_store import INDEX_SUFFIX, WAL_SUFFIX, atomic_write_json, write_snapshot
+
+DAY = 24 * 3600
+
+
+def write_catalog(path, count = 50, hot = 10):
+    """ count items of which the first hot were bought in the last hour and the rest a month ago. """
+    now = time.time()
+    catalog = {}
+    for index in range(count):
+        stamp = now - (3600 if index < hot else 30 * DAY)
+        catalog[f"{index:04d}"] = {"item_name": f"item {index}", "base_price": 1.0 + index, "demand_price": 2.0 + index,
+                                   "current_price": 1.5 + index, "last_purchased": stamp, "last_updated": stamp,
+                                   "meter": index % 3, "total_bought": index, "series_id": f"S{index % 4}"}
+    write_snapshot(path, catalog)
+    return catalog
+
+
+def test_compact_keeps_cold_items_on_disk(tmp_path):
+    path = str(tmp_path / "items.json")
+    catalog = write_catalog(path)
+    manager = ItemDataManager(path)
+    assert len(manager.items.cold) == 40
+
+    manager.items["0001"]["current_price"] = 99.0
+    manager.save_items_to_json()
+    with manager.lock:
+        manager.store.compact(manager.items)
+
+    assert len(manager.items.cold) == 40
+    assert not manager._dirty
+    catalog["0001"]["current_price"] = 99.0
+    with open(path) as file:
+        assert json.load(file) == catalog
+    assert manager.items["0042"].copy() == catalog["0042"] # Read from its new place in the rewritten snapshot
+    assert ItemDataManager(path).items["0042"].copy() == catalog["0042"]
+
+
+def test_reading_a_cold_item_does_not_mark_it_dirty(tmp_path, offline):
+    path = str(tmp_path / "items.json")
+    catalog = write_catalog(path)
+    catalog["0042"]["history"] = [3.0, 4.0]
+    write_snapshot(path, catalog)
+    offline["S2"] = 7.5
+    manager = ItemDataManager(path)
+    assert not manager.items.is_loaded("0042")
+
+    item = manager.items["0042"]
+    assert item["base_price"] == 7.5 # The BLS price held back while the item was on disk
+    assert "history" not in item
+    assert manager.price_history("0042") == [3.0, 4.0]
+    assert not manager._dirty
+
+
+def test_commit_after_a_torn_log_line_survives_reload(tmp_path):
+    path = str(tmp_path / "items.json")
+    write_catalog(path)
+    manager = ItemDataManager(path)
+    manager.items["0001"]["current_price"] = 5.0
+    manager.save_items_to_json()
+    with open(path + WAL_SUFFIX, "a") as file:
+        file.write('{"put":{"0002":{"item_name"') # Crash mid-append
+
+    manager = ItemDataManager(path)
+    manager.items["0003"]["current_price"] = 9.0
+    manager.save_items_to_json()
+
+    reloaded = ItemDataManager(path)
+    assert reloaded.items["0001"]["current_price"] == 5.0
+    assert reloaded.items["0003"]["current_price"] == 9.0
+    assert reloaded.items["0002"]["current_price"] == 3.5
+
+
+def test_rewrites_keep_the_file_mode(tmp_path):
+    path = str(tmp_path / "items.json")
+    atomic_write_json(path, {})
+    os.chmod(path, 0o644)
+    atomic_write_json(path, {"0001": {}})
+    assert os.stat(path).st_mode & 0o777 == 0o644
+
+    write_catalog(path)
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    assert os.stat(path + INDEX_SUFFIX).st_mode & 0o777 == 0o644
@@ -0,0 +1,75 @@
+import multiprocessing
+import sys
+import time
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+try:
+    import capture_module
+except ImportError: # pyzbar is installed but libzbar is not; the decoder is replaced below anyway
+    sys.modules["pyzbar"] = types.ModuleType("pyzbar")
+    sys.modules["pyzbar.pyzbar"] = types.SimpleNamespace(decode = None)
+    import capture_module
+
+from lane_manager import LaneManager
+from process_module import ItemProcessor
+from transaction_queue import TransactionQueue
+
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason = "decode workers must inherit the fake decoder")
+
+BARCODE_LEVELS = {"0001": (240, 253), "0002": (200, 230)} # Mean brightness the fake decoder reads as each barcode
+
+
+class FakeBarcode:
+    def __init__(self, data):
+        self.data = data.encode("utf-8")
+        self.type = "EAN13"
+
+
+def fake_decode(image):
+    """ Stands in for pyzbar: a frame of uniform brightness in one of BARCODE_LEVELS holds that barcode. """
+    level = image.mean()
+    return [FakeBarcode(barcode) for barcode, (low, high) in BARCODE_LEVELS.items() if low < level < high]
+
+
+def frames(level, count = 30, shown = 10):
+    """ count frames of which the first shown have the given brightness and the rest are dark (nothing to decode). """
+    return [np.full((240, 320, 3), level if index < shown else 20, np.uint8) for index in range(count)]
+
+
+def test_lanes_scan_and_save_independently(tmp_path, monkeypatch, make_manager, quiet):
+    monkeypatch.setattr(capture_module, "decode", fake_decode)
+    video = str(tmp_path / "lane1.avi")
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"MJPG"), 30, (320, 240))
+    for frame in frames(250):
+        writer.write(frame)
+    writer.release()
+    images = tmp_path / "lane2"
+    images.mkdir()
+    for index, frame in enumerate(frames(215)):
+        cv2.imwrite(str(images / f"{index:03d}.png"), frame)
+
+    manager = make_manager({barcode: {"item_name": barcode, "base_price": 1.0, "demand_price": 1.0, "current_price": 1.0,
+                                      "last_purchased": time.time(), "last_updated": time.time()} for barcode in BARCODE_LEVELS})
+    queue = TransactionQueue(ItemProcessor(manager, log_callback = quiet), log_callback = quiet)
+    queue.start()
+    lanes = LaneManager(manager, queue, [video, str(images)], decode_workers = 2, idle_finish = 0.3, log_callback = quiet)
+    try:
+        lanes.start()
+        deadline = time.time() + 15
+        while time.time() < deadline and not all(lane.transactions for lane in lanes.lanes.values()):
+            time.sleep(0.05)
+    finally:
+        lanes.release()
+        queue.stop()
+    stats = lanes.stats()
+
+    assert stats[1]["transactions"] >= 1 and stats[2]["transactions"] >= 1
+    assert stats["total"]["failed"] == 0 and stats["total"]["frames_decoded"] > 0
+    # Each lane only ever saw its own barcode
+    assert manager.items["0001"]["total_bought"] == stats[1]["items"]
+    assert manager.items["0002"]["total_bought"] == stats[2]["items"]
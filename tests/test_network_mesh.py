@@ -0,0 +1,96 @@
+import socket
+import time
+
+import pytest
+
+from item_data_manager import ItemDataManager
+from item_store import atomic_write_json
+from network_manager import NetworkManager, load_topology
+
+STORES = ("store-1", "store-2", "store-3")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def change_price(manager, barcode, price):
+    with manager.lock:
+        item = manager.items[barcode]
+        item["current_price"] = price
+        item["last_updated"] = time.time()
+        manager.record_local_change(barcode)
+    manager.save_items_to_json()
+
+
+def snapshot(manager):
+    with manager.lock:
+        return {barcode: (item["current_price"], dict(item.get("clock", {}))) for barcode, item in manager.items.items()}
+
+
+def test_three_stores_converge(tmp_path):
+    catalog = {barcode: {"item_name": barcode, "base_price": 1.0, "demand_price": 1.0, "current_price": 1.0}
+               for barcode in ("0001", "0002", "0003")}
+    endpoints = {store_id: f"tcp://127.0.0.1:{free_port()}" for store_id in STORES}
+    managers, networks = {}, {}
+    quiet = lambda *args: None
+    try:
+        for store_id in STORES:
+            directory = tmp_path / store_id
+            directory.mkdir()
+            atomic_write_json(str(directory / "items.json"), catalog)
+            managers[store_id] = ItemDataManager(str(directory / "items.json"), quiet)
+        for store_id in STORES:
+            networks[store_id] = NetworkManager(managers[store_id], log_callback = quiet, store_id = store_id,
+                                                listen_endpoint = endpoints[store_id],
+                                                peers = {peer: endpoint for peer, endpoint in endpoints.items() if peer != store_id})
+
+        # Concurrent edits: 0001 on stores 1 and 3, 0002 on stores 1 and 2, 0003 on store 2 only
+        since = time.time() - 1
+        change_price(managers["store-1"], "0001", 2.0)
+        change_price(managers["store-1"], "0002", 3.0)
+        change_price(managers["store-2"], "0002", 4.0)
+        change_price(managers["store-2"], "0003", 5.0)
+        change_price(managers["store-3"], "0001", 6.0)
+        for store_id in STORES:
+            networks[store_id].send_prices_to_other_store(since)
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            states = [snapshot(managers[store_id]) for store_id in STORES]
+            if states[0] == states[1] == states[2]:
+                break
+            time.sleep(0.05)
+        assert states[0] == states[1] == states[2]
+        assert states[0]["0001"][1] == {"store-1": 1, "store-3": 1}
+        assert states[0]["0002"][1] == {"store-1": 1, "store-2": 1}
+        assert states[0]["0003"] == (5.0, {"store-2": 1})
+    finally:
+        for network in networks.values():
+            network.shutdown()
+
+
+def test_store_ids_are_unique_and_persistent(tmp_path):
+    catalog = {"0001": {"item_name": "0001", "base_price": 1.0, "demand_price": 1.0, "current_price": 1.0}}
+    paths = []
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        paths.append(str(tmp_path / name / "items.json"))
+        atomic_write_json(paths[-1], catalog)
+    quiet = lambda *args: None
+    first, second = (ItemDataManager(path, quiet).store_id for path in paths)
+    assert first != second
+    assert ItemDataManager(paths[0], quiet).store_id == first
+    assert ItemDataManager(paths[0], quiet, store_id = "store-9").store_id == "store-9"
+
+
+def test_topology_needs_a_store_id(tmp_path):
+    path = str(tmp_path / "stores.json")
+    atomic_write_json(path, {"listen": "tcp://*:5556", "peers": {"store-2": "tcp://127.0.0.1:5557"}})
+    with pytest.raises(ValueError):
+        load_topology(path)
+
+    atomic_write_json(path, {"store_id": "store-1", "name": "Downtown", "listen": "tcp://*:5556", "peers": {}})
+    assert load_topology(path)["store_name"] == "Downtown"
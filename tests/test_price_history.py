@@ -0,0 +1,20 @@
+from price_history import HistoryStore
+
+
+def test_rings_are_read_on_first_use(tmp_path):
+    path = str(tmp_path / "history.db")
+    history = HistoryStore(path, capacity = 4)
+    for step in range(6):
+        history.append("a", float(step), timestamp = step)
+    history.append("b", 9.0, timestamp = 0)
+    history.close()
+
+    history = HistoryStore(path, capacity = 4)
+    assert history.rings == {}
+    history.append("a", 6.0, timestamp = 6) # Not read in yet: the point waits in pending
+    assert history.last_prices(["a", "b", "c"]) == {"a": 6.0, "b": 9.0}
+    assert history.rings == {}
+    assert history.recent("a") == [3.0, 4.0, 5.0, 6.0]
+    assert not history.has_history("c")
+    assert set(history.rings) == {"a", "c"}
+    history.close()
@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+import pytest
+
+from pricing_rules import PricingRule, PricingRules
+
+RULES = PricingRules(categories = {"produce": PricingRule(step_units = 3, step_increase = 0.02),
+                                   "dairy": PricingRule(step_units = 10, step_increase = 0.005, bls_weight = 0.5, demand_weight = 0.5),
+                                   "bulk": PricingRule(step_units = 1, step_increase = 0.001)})
+
+
+def reference_purchase(item, quantity, rule):
+    """ The per-item loop apply_purchases replaced: every step_units sold multiplies demand by 1 + step_increase. """
+    meter = item["meter"] + quantity
+    demand = item["demand_price"]
+    current = None
+    steps = 0
+    while meter >= rule.step_units:
+        meter -= rule.step_units
+        demand *= 1 + rule.step_increase
+        current = rule.blend(item["base_price"], demand)
+        steps += 1
+    return steps, meter, demand, current
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_closed_form_matches_repeated_multiplication(seed):
+    rng = random.Random(seed)
+    rules = RULES if seed % 5 else PricingRules() # Without categories parameters() broadcasts plain numbers
+    items, quantities = [], []
+    for _ in range(rng.randint(1, 60)):
+        item = {"base_price": round(rng.uniform(0.5, 20.0), 2), "demand_price": round(rng.uniform(0.5, 40.0), rng.choice([2, 6]))}
+        category = rng.choice([None, "produce", "dairy", "bulk", "bakery"])
+        if category:
+            item["category"] = category
+        item["meter"] = rng.randrange(rules.rule_for(item).step_units)
+        items.append(item)
+        quantities.append(rng.choice([0, 1, rng.randint(1, 20), rng.randint(1, 500)]))
+
+    steps, meter, demand, current = rules.apply_purchases(
+        np.array([item["meter"] for item in items]), np.array(quantities),
+        np.array([item["demand_price"] for item in items]), np.array([item["base_price"] for item in items]),
+        rules.parameters(items))
+
+    for row, (item, quantity) in enumerate(zip(items, quantities)):
+        expected_steps, expected_meter, expected_demand, expected_current = reference_purchase(item, quantity, rules.rule_for(item))
+        assert (steps[row], meter[row]) == (expected_steps, expected_meter)
+        assert demand[row] == pytest.approx(expected_demand, rel = 1e-12)
+        if expected_steps:
+            assert current[row] == pytest.approx(expected_current, rel = 1e-12)
@@ -0,0 +1,37 @@
+from purchase_tracker import PurchaseTracker
+
+
+def test_forget_drops_the_item_from_every_window():
+    now = [1000.0]
+    tracker = PurchaseTracker(clock = lambda: now[0])
+    tracker.add_window("hour", 3600)
+    tracker.record("0001", 3)
+    tracker.record("0002", 1)
+    tracker.forget("0001")
+    assert tracker.total("0001") == 0
+    assert tracker.total("0001", "hour") == 0
+    assert tracker.top(5, "hour") == [("0002", 1)]
+    now[0] += 3600 # Expiring a bucket that held the forgotten item must not touch its (gone) total
+    assert tracker.top(5, "hour") == []
+
+
+def test_ranked_yields_every_item_best_first():
+    tracker = PurchaseTracker(k = 2)
+    for barcode, quantity in (("0001", 3), ("0002", 7), ("0003", 1), ("0004", 5)):
+        tracker.record(barcode, quantity)
+    ranked = tracker.ranked()
+    assert next(ranked) == ("0002", 7)
+    assert list(ranked) == [("0004", 5), ("0001", 3), ("0003", 1)]
+
+
+def test_deleted_items_leave_the_best_sellers(make_manager):
+    manager = make_manager({barcode: {"item_name": barcode, "base_price": 1.0, "demand_price": 1.0, "current_price": 1.0}
+                            for barcode in ("0001", "0002", "0003")})
+    manager.purchases.add_window("hour", 3600)
+    for barcode, quantity in (("0001", 2), ("0002", 1)):
+        manager.record_purchase(barcode, quantity)
+
+    del manager.items["0001"]
+    assert manager.top_sellers(5, "hour") == [("0002", 1)]
+    assert manager.top_sellers(5) == [("0002", 1)]
+    assert list(manager.purchases.ranked()) == [("0002", 1)]
@@ -0,0 +1,68 @@
+import json
+import threading
+
+import pytest
+import requests
+from werkzeug.serving import make_server
+
+import flask_app
+from registry_publisher import RegistryPublisher
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """ flask_app served on a loopback port with its database in tmp_path. Yields the base URL. """
+    monkeypatch.setattr(flask_app, "registry_db", str(tmp_path / "AllFlashcards.db"))
+    monkeypatch.setattr(flask_app, "flashcards_file", str(tmp_path / "AllFlashcards.json"))
+    monkeypatch.setattr(flask_app, "_initialized", False)
+    server = make_server("127.0.0.1", 0, flask_app.app, threaded = True)
+    thread = threading.Thread(target = server.serve_forever, kwargs = {"poll_interval": 0.05}, daemon = True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.port}"
+    server.shutdown()
+
+
+def registry_items(base_url, store_name):
+    response = requests.get(f"{base_url}/stores", params = {"q": store_name, "password": "password"})
+    response.raise_for_status()
+    stores = [json.loads(line) for line in response.text.splitlines()]
+    return {item for store in stores for item in store["itemslist"]}
+
+
+def prices(count, price):
+    return {f"{index:05d}": {"current_price": price} for index in range(count)}
+
+
+def test_publishes_in_batches(registry, quiet):
+    publisher = RegistryPublisher(base_url = registry, store_name = "TESTSTORE", batch_size = 500, log_callback = quiet)
+    publisher.start()
+    publisher.publish(prices(1200, 1.5))
+    publisher.stop()
+    assert registry_items(registry, "TESTSTORE") == {f"{index:05d} : 1.5" for index in range(1200)}
+
+
+def test_failed_batches_wait_in_the_outbox(registry, tmp_path, quiet):
+    outbox = str(tmp_path / "outbox.jsonl")
+    offline = RegistryPublisher(base_url = "http://127.0.0.1:9", store_name = "TESTSTORE", max_retries = 1,
+                                backoff_seconds = 0, outbox_path = outbox, log_callback = quiet)
+    offline.start()
+    offline.publish(prices(3, 2.0))
+    offline.stop()
+    with open(outbox) as file:
+        assert len(file.readlines()) == 1
+
+    # The next publisher to reach the registry sends the saved batch first
+    online = RegistryPublisher(base_url = registry, store_name = "TESTSTORE", outbox_path = outbox, log_callback = quiet)
+    online.start()
+    online.stop()
+    assert registry_items(registry, "TESTSTORE") == {f"{index:05d} : 2.0" for index in range(3)}
+    with open(outbox) as file:
+        assert file.read() == ""
+
+
+def test_malformed_legacy_entries_are_skipped(registry, tmp_path):
+    with open(tmp_path / "AllFlashcards.json", "w") as file:
+        json.dump([{"storename": "GOODSTORE", "itemslist": ["00001 : 1.0"]}, {"storeIP": "10.0.0.1"}, "STORE",
+                   {"storename": "BADITEMS", "itemslist": "00002 : 2.0"}], file)
+    assert registry_items(registry, "GOODSTORE") == {"00001 : 1.0"}
+    assert registry_items(registry, "BADITEMS") == set()
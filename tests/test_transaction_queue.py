@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from process_module import ItemProcessor
+from transaction_queue import NotDurableError, TransactionQueue
+
+
+@pytest.fixture
+def manager(make_manager):
+    manager = make_manager({barcode: {"item_name": barcode, "base_price": 1.0, "demand_price": 1.0, "current_price": 1.0,
+                                      "last_purchased": time.time(), "last_updated": time.time()} for barcode in ("0001", "0002")})
+    manager.purchases.add_window("hour", 3600)
+    return manager
+
+
+def state(manager):
+    return ({barcode: item.copy() for barcode, item in manager.items.items()}, dict(manager.purchases.counts),
+            manager.purchases.total("0001", "hour"), manager.price_history("0001"), set(manager._dirty))
+
+
+def test_failed_transaction_is_rolled_back(manager, monkeypatch, quiet):
+    queue = TransactionQueue(ItemProcessor(manager, log_callback = quiet), log_callback = quiet)
+    queue.start()
+    queue.submit(["0001"]).result(timeout = 5)
+    before = state(manager)
+
+    # Fail after 0001 has been priced, counted and recorded but before 0002 is
+    record_purchase = manager.record_purchase
+    def failing_record_purchase(barcode, quantity):
+        if barcode == "0002":
+            raise RuntimeError("disk on fire")
+        record_purchase(barcode, quantity)
+    monkeypatch.setattr(manager, "record_purchase", failing_record_purchase)
+    with pytest.raises(RuntimeError):
+        queue.submit(["0001", "0001", "0002"]).result(timeout = 5)
+    queue.stop()
+
+    assert state(manager) == before
+    assert queue.stats()["failed"] == 1
+
+
+def test_failed_save_reports_applied_transaction(manager, monkeypatch, quiet):
+    queue = TransactionQueue(ItemProcessor(manager, log_callback = quiet), log_callback = quiet)
+    queue.start()
+    monkeypatch.setattr(manager, "save_items_to_json", lambda: False)
+    with pytest.raises(NotDurableError) as error:
+        queue.submit(["0001"]).result(timeout = 5)
+    queue.stop()
+
+    assert error.value.prices == {"0001": manager.items["0001"]["current_price"]}
+    assert manager.items["0001"]["total_bought"] == 1 # Applied, and still pending for the next save
+    assert "0001" in manager._dirty
+    assert queue.stats()["unsaved"] == 1
+
+
+def test_save_writes_outside_the_item_lock(manager, monkeypatch, quiet):
+    queue = TransactionQueue(ItemProcessor(manager, log_callback = quiet), log_callback = quiet)
+    queue.start()
+    readers = []
+    commit = manager.store.commit
+    def probing_commit(*args, **kwargs):
+        def reader(): # The dashboard's view: another thread taking the lock while the save is on disk
+            readers.append(manager.lock.acquire(timeout = 1) and manager.lock.release() is None)
+        thread = threading.Thread(target = reader)
+        thread.start()
+        thread.join()
+        commit(*args, **kwargs)
+    monkeypatch.setattr(manager.store, "commit", probing_commit)
+    queue.submit(["0001"]).result(timeout = 5)
+    queue.stop()
+    assert readers == [True]
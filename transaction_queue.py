@@ -0,0 +1,161 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+GROUP_WINDOW_SECONDS = 0.02 # How long the worker waits for more transactions to share one save
+MAX_GROUP_SIZE = 64
+
+
+class NotDurableError(IOError):
+    """
+    A transaction was applied in memory but the save after it failed. It stays applied and is written with the
+    next save that succeeds, so it must not be submitted again. prices holds what the transaction priced.
+    """
+    def __init__(self, message, prices):
+        super().__init__(message)
+        self.prices = prices
+
+
+class TransactionQueue:
+    def __init__(self, item_processor, group_window = GROUP_WINDOW_SECONDS, max_group = MAX_GROUP_SIZE, log_callback = None):
+        """
+        Applies finished transactions in arrival order on one worker thread. Transactions that arrive
+        within group_window of each other are priced one by one and then saved together (group commit),
+        so a checkout rush costs one write per group instead of one per transaction.
+        :param item_processor: ItemProcessor whose item_data_manager is saved after each group.
+        """
+        self.item_processor = item_processor
+        self.item_data_manager = item_processor.item_data_manager
+        self.group_window = group_window
+        self.max_group = max_group
+        self.log_callback = log_callback if log_callback else self._default_log
+
+        self.pending = queue.Queue()
+        self.worker_thread = None
+        self.running = False
+
+        self.stats_lock = threading.Lock()
+        self.committed = 0
+        self.groups = 0
+        self.failed = 0
+        self.unsaved = 0
+        self.total_commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.last_commit_seconds = 0.0
+
+    def _default_log(self, message, log_type="info"):
+        """Default logging if no callback is provided."""
+        print(f"[{log_type.upper()}] {message}")
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.worker_thread = threading.Thread(target = self._run, daemon = True)
+        self.worker_thread.start()
+
+    def stop(self, timeout = 5):
+        """ Applies everything already queued (up to timeout), then stops the worker. """
+        if not self.running:
+            return
+        self.pending.put(None)
+        self.worker_thread.join(timeout = timeout)
+        self.running = False
+
+    def submit(self, barcodes):
+        """
+        Queues one transaction and returns a Future. It resolves to {barcode: new current_price} once the
+        transaction's prices are saved. If pricing it fails, nothing of it is kept and the future raises that error.
+        If only the save fails, it raises NotDurableError: the transaction is applied and will be saved later.
+        """
+        future = Future()
+        self.pending.put((list(barcodes), future, time.perf_counter()))
+        return future
+
+    def depth(self):
+        """ Transactions waiting for the worker. """
+        return self.pending.qsize()
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "depth": self.depth(),
+                "committed": self.committed,
+                "failed": self.failed,
+                "unsaved": self.unsaved,
+                "groups": self.groups,
+                "average_group_size": self.committed / self.groups if self.groups else 0.0,
+                "last_commit_seconds": self.last_commit_seconds,
+                "average_commit_seconds": self.total_commit_seconds / self.groups if self.groups else 0.0,
+                "max_commit_seconds": self.max_commit_seconds
+            }
+
+    def _next_group(self):
+        """ Blocks for one transaction, then gathers whatever else arrives within the group window. """
+        first = self.pending.get()
+        if first is None:
+            return None, True
+        group = [first]
+        deadline = time.perf_counter() + self.group_window
+        while len(group) < self.max_group:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self.pending.get(timeout = remaining) if remaining > 0 else self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                return group, True
+            group.append(entry)
+        return group, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            group, stopping = self._next_group()
+            if group:
+                self._apply_group(group)
+
+    def _apply_group(self, group):
+        applied = []
+        failed = 0
+        manager = self.item_data_manager
+        with manager.lock:
+            for barcodes, future, queued_at in group:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                checkpoint = manager.checkpoint(barcodes)
+                try:
+                    self.item_processor.process_pipeline(barcodes, persist = False)
+                except Exception as e:
+                    manager.rollback(checkpoint) # A half-priced transaction would be counted again when it is retried
+                    print(f"[TransactionQueue] Error processing transaction {barcodes}, rolled back: {e}")
+                    future.set_exception(e)
+                    failed += 1
+                    continue
+                applied.append((barcodes, future, queued_at))
+            prices = [{barcode: manager.items[barcode].get("current_price") for barcode in set(barcodes) if barcode in manager.items}
+                      for barcodes, _, _ in applied]
+        saved = manager.save_items_to_json() # Outside the lock: the dashboard and decay must not wait on the fsync
+
+        now = time.perf_counter()
+        commit_seconds = max((now - queued_at for _, _, queued_at in applied), default = 0.0)
+        with self.stats_lock:
+            self.groups += 1
+            self.failed += failed
+            if saved:
+                self.committed += len(applied)
+            else:
+                self.unsaved += len(applied)
+            self.last_commit_seconds = commit_seconds
+            self.total_commit_seconds += commit_seconds
+            self.max_commit_seconds = max(self.max_commit_seconds, commit_seconds)
+
+        for (_, future, _), item_prices in zip(applied, prices):
+            if saved:
+                future.set_result(item_prices)
+            else:
+                future.set_exception(NotDurableError(f"Transaction applied but not yet saved to {manager.filepath}; "
+                                                     "it is written with the next successful save", item_prices))
+        if saved and len(applied) > 1:
+            self.log_callback(f"Committed {len(applied)} transactions in one save ({commit_seconds * 1000:.1f} ms from queue to disk).", "process")
@@ -0,0 +1,60 @@
+"""
+Per-item vector clocks for store-to-store price sync.
+
+Every item carries "clock": {store_id: counter}. A store bumps its own counter whenever it changes
+an item's price locally; merges keep whichever side's clock dominates. Concurrent edits (neither
+clock dominates) are resolved by the same deterministic rule on every store, so all stores converge
+no matter in which order, or how many times, they receive updates.
+"""
+
+BEFORE = "before"
+AFTER = "after"
+EQUAL = "equal"
+CONCURRENT = "concurrent"
+
+def compare(a, b):
+    """ Orders clock a relative to clock b: BEFORE (a < b), AFTER, EQUAL or CONCURRENT. """
+    a_ahead = any(counter > b.get(store, 0) for store, counter in a.items())
+    b_ahead = any(counter > a.get(store, 0) for store, counter in b.items())
+    if a_ahead and b_ahead:
+        return CONCURRENT
+    if a_ahead:
+        return AFTER
+    if b_ahead:
+        return BEFORE
+    return EQUAL
+
+def merge(a, b):
+    """ Pointwise maximum of two clocks. """
+    merged = dict(a)
+    for store, counter in b.items():
+        if counter > merged.get(store, 0):
+            merged[store] = counter
+    return merged
+
+def increment(clock, store_id):
+    clock = dict(clock)
+    clock[store_id] = clock.get(store_id, 0) + 1
+    return clock
+
+def _tie_break_key(entry):
+    # Later write wins; equal write times fall back to the price so every store picks the same side
+    return (entry.get("version", 0), entry.get("current_price", 0))
+
+def resolve(local, remote):
+    """
+    Decides the outcome of merging a remote sync entry into local state.
+    Both are dicts with "current_price", "clock" and optionally "version" (last write time).
+    Returns (take_remote, merged_clock). Entries without a clock come from peers that predate
+    vector clocks and fall back to the old "higher price wins" rule.
+    """
+    local_clock = local.get("clock", {})
+    if "clock" not in remote:
+        return remote.get("current_price", 0) > local.get("current_price", 0), local_clock
+
+    order = compare(remote["clock"], local_clock)
+    if order == AFTER:
+        return True, dict(remote["clock"])
+    if order == CONCURRENT:
+        return _tie_break_key(remote) > _tie_break_key(local), merge(local_clock, remote["clock"])
+    return False, local_clock
@@ -0,0 +1,187 @@
+"""
+Binary wire format for store-to-store price sync.
+
+A price batch is a multipart ZeroMQ message:
+    frame 0: header  -> MAGIC, wire version, flags, total item count       (HEADER)
+    frame 1..n: body -> one flags byte, then up to MAX_ITEMS_PER_FRAME items, optionally compressed
+
+Body layout (little-endian, column-oriented so each column packs/unpacks in C):
+    uint32 count | uint32 names_len | names (UTF-8 barcodes joined by '\\n')
+    float64[count] current_price
+    int64[count]   version, delta-encoded (first value absolute, then differences)
+  wire version 2 appends the per-item vector clocks (see vector_clock.py):
+    uint32 stores_len | uint32 word_count | stores (UTF-8 store ids joined by '\\n')
+    uint32[word_count] for each item: entry count n, then n (store index, counter) pairs
+
+Peers announce what they can read with a HELLO message; the sender picks the highest common
+wire version and the best common compression, and falls back to JSON for peers that never said hello.
+"""
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+MAGIC = b"DSYN"
+HELLO = b"DSYN-HELLO"
+WIRE_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+FLAG_ZLIB = 0x01
+FLAG_LZ4 = 0x02
+COMPRESS_MIN_BYTES = 4096 # Smaller frames are sent uncompressed
+MAX_ITEMS_PER_FRAME = 10000
+
+HEADER = struct.Struct("<4sBBI")
+BODY_PREFIX = struct.Struct("<II")
+
+def supported_compression():
+    return ["lz4", "zlib"] if lz4 else ["zlib"]
+
+def encode_hello(store_id, reply_requested = True):
+    """ Frames announcing this store's readable wire versions and compression codecs. """
+    hello = {
+        "store": store_id,
+        "versions": list(SUPPORTED_VERSIONS),
+        "compression": supported_compression(),
+        "reply": reply_requested
+    }
+    return [HELLO, json.dumps(hello).encode("utf-8")]
+
+def is_hello(frames):
+    return frames[0] == HELLO
+
+def is_price_batch(frames):
+    return frames[0][:len(MAGIC)] == MAGIC and len(frames[0]) == HEADER.size
+
+def parse_hello(frames):
+    return json.loads(frames[1].decode("utf-8"))
+
+def negotiate(peer_hello):
+    """ Returns (wire_version, compression) to use when sending to the peer, or None if nothing is shared. """
+    common = set(SUPPORTED_VERSIONS) & set(peer_hello.get("versions", []))
+    if not common:
+        return None
+    codecs = [codec for codec in supported_compression() if codec in peer_hello.get("compression", [])]
+    return max(common), (codecs[0] if codecs else None)
+
+def _to_wire(column):
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+def _from_wire(typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+def _compress(body, compression):
+    if compression is None or len(body) < COMPRESS_MIN_BYTES:
+        return 0, body
+    if compression == "lz4" and lz4:
+        return FLAG_LZ4, lz4.frame.compress(body)
+    return FLAG_ZLIB, zlib.compress(body, 6)
+
+def _encode_clocks(barcodes, prices):
+    clocks = [prices[barcode].get("clock", {}) for barcode in barcodes]
+    stores = sorted({store for clock in clocks for store in clock})
+    store_index = {store: index for index, store in enumerate(stores)}
+    words = array("I")
+    for clock in clocks:
+        words.append(len(clock))
+        for store, counter in clock.items():
+            words.append(store_index[store])
+            words.append(counter)
+    names = "\n".join(stores).encode("utf-8")
+    return BODY_PREFIX.pack(len(names), len(words)) + names + _to_wire(words)
+
+def _encode_body(barcodes, prices, version):
+    names = "\n".join(barcodes).encode("utf-8")
+    price_column = array("d", (prices[barcode]["current_price"] for barcode in barcodes))
+    versions = [int(prices[barcode].get("version", 0)) for barcode in barcodes]
+    deltas = array("q", [versions[0]] + [b - a for a, b in zip(versions, versions[1:])])
+    body = BODY_PREFIX.pack(len(barcodes), len(names)) + names + _to_wire(price_column) + _to_wire(deltas)
+    if version >= 2:
+        body += _encode_clocks(barcodes, prices)
+    return body
+
+def encode_prices(prices, version = WIRE_VERSION, compression = "zlib"):
+    """
+    Encodes {barcode: {"current_price": float, "version": int, "clock": {store: int}}} as a list of frames.
+    Barcodes are sorted so neighbouring versions are close and the deltas compress well.
+    """
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported wire version {version}")
+    barcodes = sorted(prices)
+    flags = 0
+    frames = []
+    for start in range(0, len(barcodes), MAX_ITEMS_PER_FRAME):
+        frame_flag, body = _compress(_encode_body(barcodes[start:start + MAX_ITEMS_PER_FRAME], prices, version), compression)
+        flags |= frame_flag
+        frames.append(bytes((frame_flag,)) + body)
+    return [HEADER.pack(MAGIC, version, flags, len(barcodes))] + frames
+
+def _decompress(frame):
+    """ Each body frame is compressed independently and carries its own flags byte. """
+    flag, body = frame[0], frame[1:]
+    if flag & FLAG_LZ4:
+        if not lz4:
+            raise ValueError("Received an lz4 frame but lz4 is not installed")
+        return lz4.frame.decompress(body)
+    if flag & FLAG_ZLIB:
+        return zlib.decompress(body)
+    return body
+
+def _decode_clocks(body, offset, barcodes, prices):
+    stores_len, word_count = BODY_PREFIX.unpack_from(body, offset)
+    offset += BODY_PREFIX.size
+    stores = body[offset:offset + stores_len].decode("utf-8").split("\n")
+    offset += stores_len
+    words = _from_wire("I", body[offset:offset + 4 * word_count])
+
+    position = 0
+    for barcode in barcodes:
+        entries = words[position]
+        position += 1
+        if entries:
+            pairs = words[position:position + 2 * entries]
+            prices[barcode]["clock"] = {stores[pairs[i]]: pairs[i + 1] for i in range(0, len(pairs), 2)}
+            position += 2 * entries
+
+def decode_prices(frames):
+    """
+    Decodes a price batch back into {barcode: {"current_price": float, "version": int}}.
+    Version 2 batches add "clock" to every item that had a non-empty one.
+    """
+    magic, version, _, total = HEADER.unpack(frames[0])
+    if magic != MAGIC or version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported price batch (magic={magic!r}, version={version})")
+
+    prices = {}
+    for frame in frames[1:]:
+        body = _decompress(frame)
+        count, names_len = BODY_PREFIX.unpack_from(body)
+        offset = BODY_PREFIX.size
+        barcodes = body[offset:offset + names_len].decode("utf-8").split("\n") if count else []
+        offset += names_len
+        price_column = _from_wire("d", body[offset:offset + 8 * count])
+        offset += 8 * count
+        deltas = _from_wire("q", body[offset:offset + 8 * count])
+        offset += 8 * count
+
+        version_value = 0
+        for barcode, price, delta in zip(barcodes, price_column, deltas):
+            version_value += delta
+            prices[barcode] = {"current_price": price, "version": version_value}
+        if version >= 2:
+            _decode_clocks(body, offset, barcodes, prices)
+
+    if len(prices) != total:
+        raise ValueError(f"Price batch declared {total} items but contained {len(prices)}")
+    return prices